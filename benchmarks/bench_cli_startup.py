@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""reports the import time of gutils.cli, from python -X importtime
+
+Each run is a fresh interpreter. The time taken by click is shown for
+comparison, as it is the floor for the cli.
+
+    $ python benchmarks/bench_cli_startup.py --repeats 10
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+
+def import_times(statement):
+    """returns {module: cumulative import microseconds} from python -X importtime"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+
+    runs = [import_times("import gutils.cli") for _ in range(args.repeats)]
+    print(f"{'module':<12}{'median ms':>10}{'min ms':>10}")
+    for name in ("click", "gutils.cli"):
+        times = [run[name] / 1000 for run in runs]
+        print(f"{name:<12}{statistics.median(times):>10.1f}{min(times):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""compares reading assignment scores via the nbgrader ORM with gutils.gradebook
+
+A synthetic gradebook is created with nbgrader's schema, the rows are
+inserted directly as creating them through the ORM takes many minutes.
+
+    $ python benchmarks/bench_export_grades.py --students 500 --assignments 20
+"""
+import argparse
+import pathlib
+import random
+import sqlite3
+import tempfile
+import time
+import warnings
+
+_TOPICS = ("python", "seqcomp", "molevol", "microres")
+
+
+def _ids(prefix, num):
+    return [f"{prefix}{i:06d}" for i in range(num)]
+
+
+def make_gradebook(path, num_students, num_assignments, num_cells, seed=0):
+    """writes a gradebook where every student submitted every assignment"""
+    from nbgrader.api import Gradebook
+
+    Gradebook(f"sqlite:///{path}").close()  # creates the schema
+
+    rand = random.Random(seed)
+    students = _ids("u", num_students)
+    assignments = [
+        f"{_TOPICS[i % len(_TOPICS)]}_{i // len(_TOPICS) + 1}"
+        for i in range(num_assignments)
+    ]
+    conn = sqlite3.connect(str(path))
+    with conn:
+        conn.executemany(
+            "INSERT INTO student (id, first_name, last_name) VALUES (?, ?, ?)",
+            [(s, f"first{s}", f"last{s}") for s in students],
+        )
+        for a_num, name in enumerate(assignments):
+            aid, nbid = f"a{a_num}", f"n{a_num}"
+            conn.execute(
+                "INSERT INTO assignment (id, name, course_id) "
+                "VALUES (?, ?, 'default_course')",
+                (aid, name),
+            )
+            conn.execute(
+                "INSERT INTO notebook (id, name, assignment_id) VALUES (?, ?, ?)",
+                (nbid, name, aid),
+            )
+            cells = _ids(f"c{a_num}_", num_cells)
+            conn.executemany(
+                "INSERT INTO base_cell (id, name, notebook_id, type) "
+                "VALUES (?, ?, ?, 'GradeCell')",
+                [(c, c, nbid) for c in cells],
+            )
+            conn.executemany(
+                "INSERT INTO grade_cells (id, max_score, cell_type) "
+                "VALUES (?, 5, 'code')",
+                [(c,) for c in cells],
+            )
+            conn.executemany(
+                "INSERT INTO submitted_assignment (id, assignment_id, student_id) "
+                "VALUES (?, ?, ?)",
+                [(f"sa{a_num}_{s}", aid, s) for s in students],
+            )
+            conn.executemany(
+                "INSERT INTO submitted_notebook (id, assignment_id, notebook_id, "
+                "flagged) VALUES (?, ?, ?, 0)",
+                [(f"sn{a_num}_{s}", f"sa{a_num}_{s}", nbid) for s in students],
+            )
+            conn.executemany(
+                "INSERT INTO grade (id, notebook_id, cell_id, auto_score, "
+                "manual_score, needs_manual_grade) VALUES (?, ?, ?, ?, ?, 0)",
+                [
+                    (
+                        f"g{a_num}_{s}_{c}",
+                        f"sn{a_num}_{s}",
+                        c,
+                        rand.randint(0, 5),
+                        rand.choice((None, None, rand.randint(0, 5))),
+                    )
+                    for s in students
+                    for c in cells
+                ],
+            )
+    conn.close()
+
+
+def orm_export(path):
+    """the loop formerly used by gutils export_grades"""
+    from nbgrader.api import Gradebook
+
+    gb = Gradebook(f"sqlite:///{path}")
+    assignment_scores = {}
+    students = {}
+    for assignment in gb.assignments:
+        results = {}
+        for s in assignment.submissions:
+            students[s.student_id] = s.student
+            results[s.student_id] = s.score
+        assignment_scores[assignment.name] = results
+
+    student_ids = {s: s for s in students}
+    data = {
+        "anuid": student_ids,
+        "name": {
+            s: " ".join((students[s].first_name, students[s].last_name))
+            for s in students
+        },
+    }
+    for title in sorted(assignment_scores):
+        scores = assignment_scores[title]
+        data[title] = {s: scores.get(s, 0.0) for s in student_ids}
+    gb.close()
+    return data
+
+
+def sql_export(path):
+    from gutils import gradebook as GB
+
+    conn = GB.connect(path)
+    data = GB.pivot_scores(GB.submission_scores(conn), GB.student_names(conn))
+    conn.close()
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--students", type=int, default=500)
+    parser.add_argument("--assignments", type=int, default=20)
+    parser.add_argument("--cells", type=int, default=10)
+    args = parser.parse_args()
+    warnings.simplefilter("ignore")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = pathlib.Path(tmpdir) / "gradebook.db"
+        make_gradebook(path, args.students, args.assignments, args.cells)
+        print(
+            f"{args.students} students x {args.assignments} assignments x "
+            f"{args.cells} grade cells"
+        )
+        results = {}
+        print(f"{'reader':<8}{'sec':>10}")
+        for name, func in (("orm", orm_export), ("sql", sql_export)):
+            start = time.perf_counter()
+            results[name] = func(path)
+            print(f"{name:<8}{time.perf_counter() - start:>10.3f}")
+
+    assert results["orm"] == results["sql"], "exports differ"
+
+
+if __name__ == "__main__":
+    main()
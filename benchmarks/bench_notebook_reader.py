@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""compares json.load with gutils.notebook.iter_cells on output heavy notebooks
+
+Each reader runs in a fresh subprocess so the reported peak RSS
+(ru_maxrss of the child) is not polluted by the other reader.
+
+    $ python benchmarks/bench_notebook_reader.py --cells 60 --image_kb 500
+"""
+import argparse
+import base64
+import json
+import os
+import pathlib
+import subprocess
+import sys
+import tempfile
+
+_READERS = {
+    "json.load": (
+        "import json\n"
+        "with open(path) as infile:\n"
+        "    data = json.load(infile)\n"
+        "n = sum(len(c['source']) for c in data['cells'])\n"
+    ),
+    "iter_cells": (
+        "from gutils.notebook import iter_cells\n"
+        "n = sum(len(c['source']) for c in iter_cells(path))\n"
+    ),
+}
+
+_TEMPLATE = """
+import resource, sys, time
+path = sys.argv[1]
+repeats = int(sys.argv[2])
+start = time.perf_counter()
+for _ in range(repeats):
+{body}
+elapsed = (time.perf_counter() - start) / repeats
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(elapsed, rss)
+"""
+
+
+def make_notebook(path, num_cells, image_kb):
+    image = base64.b64encode(os.urandom(image_kb * 1024 * 3 // 4)).decode("ascii")
+    cells = []
+    for i in range(num_cells):
+        cells.append(
+            {
+                "cell_type": "code",
+                "execution_count": i,
+                "metadata": {"nbgrader": {"grade": False, "solution": True}},
+                "source": [f"x{i} = {i}\n", "plot(x)\n"],
+                "outputs": [
+                    {
+                        "data": {"image/png": image, "text/plain": ["<Figure>"]},
+                        "metadata": {},
+                        "output_type": "display_data",
+                    }
+                ],
+            }
+        )
+    nb = {"cells": cells, "metadata": {}, "nbformat": 4, "nbformat_minor": 5}
+    pathlib.Path(path).write_text(json.dumps(nb, indent=1))
+
+
+def run_reader(name, path, repeats):
+    body = "\n".join(f"    {line}" for line in _READERS[name].splitlines())
+    code = _TEMPLATE.format(body=body)
+    out = subprocess.run(
+        [sys.executable, "-c", code, str(path), str(repeats)],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    elapsed, rss = out.split()
+    return float(elapsed), int(rss)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cells", type=int, default=60)
+    parser.add_argument("--image_kb", type=int, default=500)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = pathlib.Path(tmpdir) / "student.ipynb"
+        make_notebook(path, args.cells, args.image_kb)
+        size_mb = path.stat().st_size / 2**20
+        print(f"notebook size: {size_mb:.1f} MB")
+        print(f"{'reader':<12}{'sec/read':>10}{'MB/sec':>10}{'peak RSS MB':>14}")
+        for name in _READERS:
+            elapsed, rss = run_reader(name, path, args.repeats)
+            print(
+                f"{name:<12}{elapsed:>10.4f}{size_mb / elapsed:>10.1f}{rss / 1024:>14.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
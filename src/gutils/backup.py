@@ -0,0 +1,109 @@
+"""numbered backups with bounded retention, and atomic file writes
+
+Backups of <name> are <name>.bak, <name>.bak.1, <name>.bak.2, ... with the
+highest number being the most recent. Compressed backups have an additional
+.gz suffix.
+"""
+import gzip
+import os
+import pathlib
+import re
+import shutil
+import tempfile
+
+
+def _backup_pattern(name):
+    return re.compile(rf"^{re.escape(name)}\.bak(?:\.(\d+))?(\.gz)?$")
+
+
+def list_backups(path):
+    """returns [(number, backup path), ...] for path, oldest first
+
+    Uses a single listing of the parent directory."""
+    path = pathlib.Path(path)
+    pattern = _backup_pattern(path.name)
+    found = []
+    with os.scandir(path.parent) as entries:
+        for entry in entries:
+            match = pattern.match(entry.name)
+            if match:
+                num = int(match.group(1) or 0)
+                found.append((num, path.parent / entry.name))
+    return sorted(found)
+
+
+def next_backup_path(path, backups=None, compress=False):
+    """returns the path for the next backup of path"""
+    path = pathlib.Path(path)
+    backups = list_backups(path) if backups is None else backups
+    num = backups[-1][0] + 1 if backups else 0
+    name = f"{path.name}.bak" if not num else f"{path.name}.bak.{num}"
+    if compress:
+        name = f"{name}.gz"
+    return path.parent / name
+
+
+def prune_backups(path, keep, backups=None):
+    """deletes all but the most recent keep backups, returns deleted paths"""
+    backups = list_backups(path) if backups is None else backups
+    if keep is None or len(backups) <= keep:
+        return []
+    remove = [p for _, p in backups[: len(backups) - keep]]
+    for p in remove:
+        p.unlink()
+    return remove
+
+
+def make_backup(path, keep=None, compress=False):
+    """backs up path, retaining only the most recent keep backups
+
+    Parameters
+    ----------
+    path
+        file to backup, it is not modified
+    keep
+        maximum number of backups to retain, None means all
+    compress
+        gzip compress the backup
+
+    Returns
+    -------
+    the backup path
+    """
+    path = pathlib.Path(path)
+    backups = list_backups(path)
+    dest = next_backup_path(path, backups, compress=compress)
+    if compress:
+        with open(path, "rb") as infile, gzip.open(dest, "wb") as outfile:
+            shutil.copyfileobj(infile, outfile)
+        shutil.copystat(path, dest)
+    else:
+        try:
+            # a hard link is instant and the original is replaced, not
+            # modified, by atomic_write_text
+            os.link(path, dest)
+        except OSError:
+            shutil.copy2(path, dest)
+
+    # the new backup counts towards keep
+    keep = None if keep is None else max(keep - 1, 0)
+    prune_backups(path, keep, backups=backups)
+    return dest
+
+
+def atomic_write_text(path, text, encoding="utf8"):
+    """writes text to a temporary file in the same directory, then renames it
+    to path"""
+    path = pathlib.Path(path)
+    fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", dir=path.parent)
+    try:
+        with os.fdopen(fd, "w", encoding=encoding) as outfile:
+            outfile.write(text)
+        if path.exists():
+            shutil.copymode(path, tmp)
+        else:
+            os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
@@ -1,26 +1,211 @@
 #!/usr/bin/env python3
 """bundles all non-python, non-r, non-ipynb script files into a dir
 replacing with symlinks"""
+import json
+import os
 import pathlib
+import re
 import shutil
+import threading
 
 import click
 
+from gutils.content_store import STORE_NAME, ContentStore, hash_files
+from gutils.transfer import copy_file, move_files
 
-def get_data_paths(assign_dir: pathlib.Path, excludes):
-    moving = []
-    for fn in assign_dir.glob("**/*"):
-        if (
-            str(fn.relative_to(assign_dir)).startswith(".")
-            or fn.suffix.lower() in excludes
-            or fn.name.startswith(".")
-            or fn.is_dir()
-            or fn.is_symlink()
-        ):
+
+DEFAULT_EXCLUDES = (".py", ".r", ".ipynb", ".png", ".jpg", ".html", ".docx")
+IGNORE_FILE = ".bundleignore"
+
+
+def _read_ignore_patterns(path):
+    """gitignore style patterns from path, blank lines and comments are ignored"""
+    lines = pathlib.Path(path).read_text().splitlines()
+    return [l.strip() for l in lines if l.strip() and not l.startswith("#")]
+
+
+def _pattern_regex(pattern):
+    """returns the compiled regex for a gitignore style pattern, without a
+    leading '!' or trailing '/', matching paths relative to the root
+
+    A pattern without a '/' matches a name at any depth, otherwise it is
+    relative to the root. '*' and '?' do not match '/', a leading '**/'
+    matches any leading directories, '/**/' zero or more directories and a
+    trailing '/**' everything within."""
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+    parts = [] if anchored else ["(?:.*/)?"]
+    i = 0
+    while i < len(pattern):
+        at_start = i == 0 or pattern[i - 1] == "/"
+        if at_start and pattern.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
             continue
+        if at_start and pattern[i:] == "**":
+            parts.append(".*")
+            break
+
+        char = pattern[i]
+        end = pattern.find("]", i + 2) if char == "[" else -1
+        if char == "*":
+            parts.append("[^/]*")
+        elif char == "?":
+            parts.append("[^/]")
+        elif end > 0:
+            members = pattern[i + 1 : end].replace("\\", "\\\\")
+            if members.startswith("!"):
+                members = f"^{members[1:]}"
+            parts.append(f"[{members}]")
+            i = end
+        else:
+            parts.append(re.escape(char))
+        i += 1
+    return re.compile("".join(parts), re.DOTALL)
+
+
+class DataRules:
+    """decides which files in an assignment directory are data
+
+    Parameters
+    ----------
+    excludes
+        file suffixes (case insensitive) that are not data
+    includes
+        if provided, only files with these suffixes are data
+    min_size, max_size
+        bounds, in bytes, on the size of data files
+    ignore_patterns
+        gitignore style patterns matched against the path relative to the
+        assignment directory. A leading '/' anchors a pattern to the
+        assignment directory, a trailing '/' only matches directories and
+        a leading '!' re-includes a match. The last matching pattern wins.
+
+    Notes
+    -----
+    Hidden files and directories are never data.
+    """
+
+    def __init__(
+        self,
+        excludes=DEFAULT_EXCLUDES,
+        includes=None,
+        min_size=0,
+        max_size=None,
+        ignore_patterns=(),
+    ):
+        self.excludes = {e.lower() for e in excludes}
+        self.includes = {e.lower() for e in includes} if includes else None
+        self.min_size = min_size or 0
+        self.max_size = max_size
+        self._patterns = []
+        for pattern in ignore_patterns:
+            negate = pattern.startswith("!")
+            pattern = pattern[1:] if negate else pattern
+            dir_only = pattern.endswith("/")
+            regex = _pattern_regex(pattern.rstrip("/"))
+            self._patterns.append((regex, negate, dir_only))
+
+    def ignored(self, rel_path, is_dir):
+        """True if rel_path matches the ignore patterns"""
+        ignored = False
+        for regex, negate, dir_only in self._patterns:
+            if dir_only and not is_dir:
+                continue
+            if regex.fullmatch(rel_path):
+                ignored = not negate
+        return ignored
+
+    def is_data(self, rel_path, entry):
+        """True if the file os.DirEntry entry, at rel_path, is a data file"""
+        suffix = os.path.splitext(entry.name)[1].lower()
+        if suffix in self.excludes:
+            return False
+        if self.includes is not None and suffix not in self.includes:
+            return False
+        if self.ignored(rel_path, False):
+            return False
+        if self.min_size or self.max_size is not None:
+            size = entry.stat(follow_symlinks=False).st_size
+            if size < self.min_size:
+                return False
+            if self.max_size is not None and size > self.max_size:
+                return False
+        return True
+
+
+def _as_suffix(ext):
+    return ext if ext.startswith(".") else f".{ext}"
+
+
+def make_rules(
+    assign_dir,
+    exclude_ext=(),
+    include_ext=(),
+    min_size=0,
+    max_size=None,
+    ignore_file=None,
+):
+    """returns DataRules
+
+    Parameters
+    ----------
+    assign_dir
+        the assignment directory
+    exclude_ext
+        suffixes excluded in addition to DEFAULT_EXCLUDES
+    include_ext
+        if provided, only files with these suffixes are data
+    min_size, max_size
+        bounds on data file size in bytes
+    ignore_file
+        file of gitignore style patterns, defaults to assign_dir/.bundleignore
+        if that exists
+    """
+    ignore_file = ignore_file or pathlib.Path(assign_dir) / IGNORE_FILE
+    patterns = _read_ignore_patterns(ignore_file) if os.path.exists(ignore_file) else ()
+    return DataRules(
+        excludes=DEFAULT_EXCLUDES + tuple(_as_suffix(e) for e in exclude_ext),
+        includes=[_as_suffix(e) for e in include_ext] or None,
+        min_size=min_size,
+        max_size=max_size,
+        ignore_patterns=patterns,
+    )
+
+
+def walk_assignment(assign_dir: pathlib.Path, rules=None):
+    """returns the data files and top-level notebooks in assign_dir
 
-        moving.append(fn)
-    return moving
+    A single os.scandir pass, hidden and ignored directories are not
+    descended into. Symlinks are not data and are not followed."""
+    rules = DataRules() if rules is None else rules
+    data_paths = []
+    notebooks = []
+    stack = [(str(assign_dir), "")]
+    while stack:
+        dirpath, rel_dir = stack.pop()
+        with os.scandir(dirpath) as entries:
+            for entry in entries:
+                if entry.name.startswith(".") or entry.is_symlink():
+                    continue
+                rel_path = f"{rel_dir}{entry.name}"
+                if entry.is_dir():
+                    if not rules.ignored(rel_path, True):
+                        stack.append((entry.path, f"{rel_path}/"))
+                    continue
+
+                if not rel_dir and entry.name.endswith(".ipynb"):
+                    notebooks.append(pathlib.Path(entry.path))
+                if rules.is_data(rel_path, entry):
+                    data_paths.append(pathlib.Path(entry.path))
+
+    return sorted(data_paths), sorted(notebooks)
+
+
+def get_data_paths(assign_dir: pathlib.Path, excludes=DEFAULT_EXCLUDES, rules=None):
+    rules = DataRules(excludes=excludes) if rules is None else rules
+    data_paths, _ = walk_assignment(assign_dir, rules)
+    return data_paths
 
 
 def get_dest(assign_dir: pathlib.Path, dest_dir: pathlib.Path, path):
@@ -33,12 +218,261 @@ def get_dest(assign_dir: pathlib.Path, dest_dir: pathlib.Path, path):
 
 def valid_assignment_dir(assign_dir: pathlib.Path):
     """an assignment dir must have at least one notebook"""
-    nbks = list(assign_dir.glob("*.ipynb"))
-    return len(nbks) >= 1
+    with os.scandir(assign_dir) as entries:
+        return any(e.name.endswith(".ipynb") and e.is_file() for e in entries)
+
+
+JOURNAL_NAME = ".bundle_journal.jsonl"
+INCOMPLETE = "incomplete"
+DONE = "done"
+ROLLED_BACK = "rolled_back"
+
+
+class Journal:
+    """append-only json lines record of bundle operations
+
+    Each bundle run starts with a "begin" record followed by a "plan"
+    record per file. Progress is recorded by "moved", "linked" and
+    "chowned" records for each file and the run ends with "done" or
+    "rolled_back".
+
+    A partly written last line, as left by a full disk, is ignored and
+    removed before the next append.
+    """
+
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        self._lock = threading.Lock()
+        self._repaired = False
+
+    def _repair(self):
+        """truncates an unterminated last line"""
+        self._repaired = True
+        if not self.path.exists():
+            return
+        with open(self.path, "rb+") as infile:
+            data = infile.read()
+            end = data.rfind(b"\n") + 1
+            if end != len(data):
+                infile.truncate(end)
+
+    def append(self, op, **kwargs):
+        line = json.dumps({"op": op, **kwargs})
+        with self._lock:
+            if not self._repaired:
+                self._repair()
+            with open(self.path, "a") as outfile:
+                outfile.write(f"{line}\n")
+                outfile.flush()
+                os.fsync(outfile.fileno())
+
+    def runs(self):
+        """returns [{"dedup", "plan": {src: record}, "ops": {src: set}, "status"}]"""
+        runs = []
+        if not self.path.exists():
+            return runs
+        run = None
+        with open(self.path) as infile:
+            for line in infile:
+                if not line.endswith("\n"):
+                    # partly written
+                    break
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                op = record.pop("op")
+                if op == "begin":
+                    run = {"dedup": record["dedup"], "plan": {}, "ops": {}}
+                    run["status"] = INCOMPLETE
+                    runs.append(run)
+                elif run is None:
+                    continue
+                elif op == "plan":
+                    run["plan"][record["src"]] = record
+                    run["ops"][record["src"]] = set()
+                elif op in (DONE, ROLLED_BACK):
+                    run["status"] = op
+                elif record["src"] in run["ops"]:
+                    run["ops"][record["src"]].add(op)
+        return runs
+
+
+def _chown(path, owner, group):
+    """sets the owner and group names of path, not following symlinks"""
+    import grp
+    import pwd
+
+    os.lchown(path, pwd.getpwnam(owner).pw_uid, grp.getgrnam(group).gr_gid)
+
+
+def _plan_run(journal, moves, dedup, workers):
+    """records the planned moves, with the sha256 of each file, in journal"""
+    digests = hash_files([src for src, *_ in moves], workers=workers)
+
+    journal.append("begin", dedup=dedup)
+    run = {"dedup": dedup, "plan": {}, "ops": {}, "status": INCOMPLETE}
+    for src, dest, owner, group in moves:
+        record = dict(
+            src=str(src.absolute()),
+            dest=str(dest),
+            sha256=digests[src],
+            owner=owner,
+            group=group,
+        )
+        journal.append("plan", **record)
+        run["plan"][record["src"]] = record
+        run["ops"][record["src"]] = set()
+    return run
+
 
+def _execute_run(journal, run, dest_root_dir, workers):
+    """performs the operations in run not yet recorded in journal"""
+    dedup = run["dedup"]
+    store = ContentStore(dest_root_dir) if dedup else None
+    to_move = []
+    for src, record in run["plan"].items():
+        if "moved" in run["ops"][src]:
+            continue
+        src_path = pathlib.Path(src)
+        dest = pathlib.Path(record["dest"])
+        target = store.object_path(record["sha256"]) if dedup else dest
+        if src_path.is_symlink() or (not src_path.exists() and target.exists()):
+            # moved before being interrupted
+            journal.append("moved", src=src)
+            continue
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        to_move.append((src_path, dest))
+
+    # the planned digests verify copies across filesystems, so the sources
+    # are not read again
+    digests = {src: run["plan"][str(src)]["sha256"] for src, _ in to_move}
+    if dedup and to_move:
+        # move data to the store, dest is a symlink to the stored file
+        store.add([src for src, _ in to_move], workers=workers, digests=digests)
+        for src, _ in to_move:
+            journal.append("moved", src=str(src))
+    elif to_move:
+        # move data to dest
+        move_files(
+            to_move,
+            workers=workers,
+            on_done=lambda src, dest: journal.append("moved", src=str(src)),
+            digests=digests,
+        )
+
+    for src, record in run["plan"].items():
+        src_path = pathlib.Path(src)
+        dest = pathlib.Path(record["dest"])
+        if "linked" not in run["ops"][src]:
+            if dedup:
+                obj = store.object_path(record["sha256"])
+                if dest.is_symlink() or dest.exists():
+                    dest.unlink()
+                dest.symlink_to(obj)
+            # create symlink at original path
+            if not src_path.is_symlink():
+                src_path.symlink_to(dest)
+            journal.append("linked", src=src)
+
+        if "chowned" not in run["ops"][src]:
+            # change owner and group, of the symlink not the shared stored
+            # file in dedup mode
+            _chown(dest, record["owner"], record["group"])
+            journal.append("chowned", src=src)
+
+    journal.append(DONE)
+
+
+def rollback(journal, run, dest_root_dir, workers=4):
+    """restores the files of run to their original location
+
+    In dedup mode files are copied back from the store, stored files are
+    retained as they may be shared with other assignments."""
+    store = ContentStore(dest_root_dir) if run["dedup"] else None
+    restores = []
+    for src, record in reversed(list(run["plan"].items())):
+        src_path = pathlib.Path(src)
+        dest = pathlib.Path(record["dest"])
+        if src_path.is_symlink():
+            src_path.unlink()
+        if store is not None:
+            if not src_path.exists():
+                obj = store.object_path(record["sha256"])
+                copy_file(obj, src_path)
+                shutil.copystat(obj, src_path)
+            if dest.is_symlink():
+                dest.unlink()
+        elif not src_path.exists() and dest.exists():
+            restores.append((dest, src_path))
+
+    move_files(restores, workers=workers)
+    for record in run["plan"].values():
+        src_path = pathlib.Path(record["src"])
+        if src_path.exists():
+            _chown(src_path, record["owner"], record["group"])
+    journal.append(ROLLED_BACK)
+
+
+def verify(assign_dir, dest_root_dir, workers=4):
+    """checks the bundled files of assign_dir
+
+    Returns a list of problems, empty if every bundled path is a symlink
+    that resolves to a file whose sha256 matches that recorded when it was
+    bundled."""
+    assign_dir = pathlib.Path(assign_dir).expanduser().absolute()
+    dest_root_dir = pathlib.Path(dest_root_dir).expanduser().absolute()
+    journal = Journal(dest_root_dir / assign_dir.name / JOURNAL_NAME)
+    records = {}
+    for run in journal.runs():
+        if run["status"] != ROLLED_BACK:
+            records.update(run["plan"])
+    if not records:
+        return [f"no bundle record for '{assign_dir}'"]
+
+    problems = []
+    targets = {}
+    for src, record in records.items():
+        src_path = pathlib.Path(src)
+        if not src_path.is_symlink():
+            problems.append(f"'{src}' is not a symlink")
+        elif not src_path.exists():
+            problems.append(f"'{src}' is a broken symlink")
+        else:
+            targets[src_path.resolve()] = record
+
+    digests = hash_files(targets, workers=workers)
+    for path, record in targets.items():
+        if digests[path] != record["sha256"]:
+            problems.append(f"checksum of '{path}' does not match '{record['src']}'")
+    return problems
+
+
+def main(
+    dest_root_dir,
+    assign_dir,
+    force,
+    dry_run,
+    workers=4,
+    dedup=False,
+    rules=None,
+    resume=False,
+    undo=False,
+):
+    """copies data files (not directories) from assign_dir/ to dest_root_dir/assign_dir/data
+
+    Files are moved by up to workers threads, files on a different
+    filesystem to dest_root_dir are copied and verified before deletion.
 
-def main(dest_root_dir, assign_dir, force, dry_run):
-    """copies data files (not directories) from assign_dir/ to dest_root_dir/assign_dir/data"""
+    If dedup, files are moved into a content-addressed store in
+    dest_root_dir (files with identical content are only stored once) and
+    the files in dest_root_dir/assign_dir are symlinks into the store.
+
+    rules is a DataRules instance, defaults to make_rules(assign_dir).
+
+    Operations are recorded in a journal in dest_root_dir/assign_dir. If a
+    bundle was interrupted, resume completes it and undo restores the
+    original files. undo also reverses the last completed bundle.
+    """
     cwd = pathlib.Path(".").absolute()
     assign_dir = pathlib.Path(assign_dir).expanduser().absolute()
     try:
@@ -46,28 +480,55 @@ def main(dest_root_dir, assign_dir, force, dry_run):
     except ValueError:
         pass
 
-    if not valid_assignment_dir(assign_dir):
-        click.secho(f"Assignment directories must contain a .ipynb file", fg="red")
-        exit()
-
     assert assign_dir.is_dir(), "assign_dir must be a directory"
 
     dest_root_dir = pathlib.Path(dest_root_dir).expanduser().absolute()
     assert dest_root_dir.is_dir(), "dest_root_dir must be a directory"
 
     dest_dir = dest_root_dir / assign_dir.name
+    journal = Journal(dest_dir / JOURNAL_NAME)
+    runs = journal.runs()
+    last = runs[-1] if runs else None
+    interrupted = last is not None and last["status"] == INCOMPLETE
+    if undo:
+        if last is None or last["status"] == ROLLED_BACK:
+            click.secho("Nothing to roll back", fg="red")
+            exit()
+        rollback(journal, last, dest_root_dir, workers=workers)
+        click.secho("Rolled back!", fg="green")
+        return
+
+    if resume:
+        if not interrupted:
+            click.secho("No interrupted bundle to resume", fg="red")
+            exit()
+        _execute_run(journal, last, dest_root_dir, workers)
+        click.secho("Done!", fg="green")
+        return
+
+    if interrupted and not dry_run:
+        click.secho(
+            "Exiting, a previous bundle was interrupted. "
+            "Use --resume to complete it or --rollback to undo it.",
+            fg="red",
+        )
+        exit()
+
+    rules = make_rules(assign_dir) if rules is None else rules
+
+    # get data paths
+    data_paths, notebooks = walk_assignment(assign_dir, rules)
+    if not notebooks:
+        click.secho(f"Assignment directories must contain a .ipynb file", fg="red")
+        exit()
 
     if dry_run:
         click.secho(f"Assignment dir: {assign_dir}", fg="blue")
         click.secho(f"Dest dir: {dest_dir}", fg="blue")
 
-    excludes = [".py", ".r", ".ipynb", ".png", ".jpg", ".html", ".docx"]
-    # get data paths
-    data_paths = get_data_paths(assign_dir, excludes)
     created_paths = set()
+    moves = []
     for data_path in data_paths:
-        owner = data_path.owner()
-        group = data_path.group()
         # create dest paths
         dest, dest_parent = get_dest(assign_dir, dest_dir, data_path)
         if dest.exists() and not force:
@@ -79,26 +540,32 @@ def main(dest_root_dir, assign_dir, force, dry_run):
         # create dirs for dest paths
         if not dry_run:
             dest_parent.mkdir(parents=True, exist_ok=True)
-            # move data to dest
-            data_path.replace(dest)
-            # create symlink at original path
-            data_path.symlink_to(dest)
-            # change owner and group
-            shutil.chown(dest, user=owner, group=group)
+            moves.append((data_path, dest, data_path.owner(), data_path.group()))
         else:
             if str(dest_parent) not in created_paths:
                 click.secho(f"Will create path: '{dest_parent}'", fg="blue")
                 created_paths.add(str(dest_parent))
 
-            click.secho(
-                f"Will move '{data_path}' to '{dest}'",
-                fg="green",
-            )
+            if dedup:
+                click.secho(
+                    f"Will move '{data_path}' to '{dest_root_dir / STORE_NAME}'"
+                    f" unless already stored, and symlink from '{dest}'",
+                    fg="green",
+                )
+            else:
+                click.secho(
+                    f"Will move '{data_path}' to '{dest}'",
+                    fg="green",
+                )
             click.secho(
                 f"Will symlink '{dest}' to '{data_path}'",
                 fg="green",
             )
 
+    if moves:
+        run = _plan_run(journal, moves, dedup, workers)
+        _execute_run(journal, run, dest_root_dir, workers)
+
     click.secho("Done!", fg="green")
 
 
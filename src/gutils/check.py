@@ -1,9 +1,176 @@
 """functions for validating student nbgrader assignments"""
 import copy
+import functools
+import hashlib
+import inspect
+import os
+import pathlib
+import pickle
+import reprlib
+import statistics
+import time
 import traceback
 
 from numpy import ndarray
 
+# defaults for the checks that call student functions, see set_limits()
+_limits = {"timeout": None, "memory_mb": None, "workers": None}
+
+
+def set_limits(timeout=None, memory_mb=None, workers=None):
+    """sets the limits applied when checks call student functions
+
+    Parameters
+    ----------
+    timeout
+        seconds allowed for each call
+    memory_mb
+        additional memory (MB) each call can allocate
+    workers
+        max calls run concurrently, defaults to the number of CPUs
+
+    Notes
+    -----
+    If timeout or memory_mb is set, each call is made in a forked worker
+    process. Otherwise, calls are made in this process without limits.
+    Calling with no arguments removes the limits.
+    """
+    _limits.update(timeout=timeout, memory_mb=memory_mb, workers=workers)
+
+
+def _address_space():
+    """returns the bytes of address space used by this process"""
+    try:
+        with open("/proc/self/statm") as infile:
+            return int(infile.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def _call_in_worker(conn, func, args, kwargs, memory_mb):
+    if memory_mb:
+        import resource
+
+        # the worker starts with a copy of the parent's address space
+        limit = _address_space() + memory_mb * 2**20
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    try:
+        result = (True, func(*args, **kwargs))
+    except MemoryError:
+        result = (False, MemoryError(f"exceeded memory limit of {memory_mb}MB"))
+    except Exception as err:
+        result = (False, err)
+
+    try:
+        conn.send(result)
+    except Exception as err:
+        # the result or exception cannot be pickled
+        value = result[1]
+        if result[0]:
+            value = RuntimeError(f"{type(value).__name__} result: {err}")
+        else:
+            value = RuntimeError(f"{type(value).__name__}: {value}")
+        conn.send((False, value))
+    conn.close()
+
+
+def _run_isolated(calls, timeout, memory_mb, workers):
+    import multiprocessing
+    from multiprocessing.connection import wait
+
+    ctx = multiprocessing.get_context("fork")
+    workers = workers or os.cpu_count() or 1
+    results = [None] * len(calls)
+    pending = list(enumerate(calls))[::-1]
+    running = {}
+    try:
+        while pending or running:
+            while pending and len(running) < workers:
+                index, (func, args, kwargs) = pending.pop()
+                recv, send = ctx.Pipe(duplex=False)
+                proc = ctx.Process(
+                    target=_call_in_worker,
+                    args=(send, func, args, kwargs, memory_mb),
+                    daemon=True,
+                )
+                proc.start()
+                send.close()
+                deadline = time.monotonic() + timeout if timeout else None
+                running[recv] = (index, proc, deadline)
+
+            deadlines = [d for _, _, d in running.values() if d is not None]
+            wait_for = max(min(deadlines) - time.monotonic(), 0) if deadlines else None
+            for conn in wait(list(running), timeout=wait_for):
+                index, proc, _ = running.pop(conn)
+                try:
+                    results[index] = conn.recv()
+                except EOFError:
+                    msg = f"worker process exited with code {proc.exitcode}"
+                    results[index] = (False, RuntimeError(msg))
+                except Exception as err:
+                    # e.g. an exception that pickles but cannot be unpickled
+                    msg = f"result could not be received, {type(err).__name__}: {err}"
+                    results[index] = (False, RuntimeError(msg))
+                conn.close()
+                proc.join()
+
+            now = time.monotonic()
+            for conn, (index, proc, deadline) in list(running.items()):
+                if deadline is not None and now >= deadline:
+                    del running[conn]
+                    proc.kill()
+                    proc.join()
+                    conn.close()
+                    results[index] = (
+                        False,
+                        TimeoutError(f"timed out after {timeout}s"),
+                    )
+    finally:
+        for conn, (_, proc, _) in running.items():
+            proc.kill()
+            proc.join()
+            conn.close()
+    return results
+
+
+def _resolve_limits(timeout=None, memory_mb=None, workers=None):
+    """returns timeout, memory_mb, workers with defaults from set_limits()"""
+    timeout = _limits["timeout"] if timeout is None else timeout
+    memory_mb = _limits["memory_mb"] if memory_mb is None else memory_mb
+    workers = _limits["workers"] if workers is None else workers
+    return timeout, memory_mb, workers
+
+
+def run_calls(calls, timeout=None, memory_mb=None, workers=None):
+    """returns [(True, result) or (False, exception), ...] for each call
+
+    Parameters
+    ----------
+    calls
+        series of (func, args, kwargs)
+    timeout, memory_mb, workers
+        see set_limits(), which provides the defaults
+
+    Notes
+    -----
+    With limits, calls are made concurrently in forked worker processes.
+    A call that exceeds timeout is killed and gives a TimeoutError, one
+    exceeding memory_mb a MemoryError.
+    """
+    calls = list(calls)
+    timeout, memory_mb, workers = _resolve_limits(timeout, memory_mb, workers)
+    if timeout or memory_mb:
+        return _run_isolated(calls, timeout, memory_mb, workers)
+
+    results = []
+    for func, args, kwargs in calls:
+        try:
+            results.append((True, func(*args, **kwargs)))
+        except Exception as err:
+            results.append((False, err))
+    return results
+
 
 def expected_variables_exist(var_names, scope, callables=None):
     """raises an AssertionError if scope does not contain expected var_names"""
@@ -56,8 +223,171 @@ def expected_variables_types(names_types, scope, array_types=False):
         raise AssertionError(f"The following variables had an incorrect type: {msg}")
 
 
-def expected_variables_values(names_values, scope):
-    """raises an AssertionError if type of name in scope not in expected"""
+def _as_array(value):
+    """returns an ndarray view of value, None if it has none
+
+    pandas objects are converted by to_numpy(), for objects such as cogent3
+    tables the array attribute is used"""
+    if isinstance(value, ndarray):
+        return value
+    to_numpy = getattr(value, "to_numpy", None)
+    if callable(to_numpy):
+        return to_numpy()
+    array = getattr(value, "array", None)
+    return array if isinstance(array, ndarray) else None
+
+
+def _tolerances(rtol, atol):
+    if rtol is None and atol is None:
+        return {"rtol": 1e-05, "atol": 1e-08}  # numpy's defaults
+    return {"rtol": rtol or 0.0, "atol": atol or 0.0}
+
+
+def _array_difference(got, expect, rtol, atol, max_shown):
+    import numpy
+
+    if got.shape != expect.shape:
+        return f"has shape {got.shape}, expected {expect.shape}"
+
+    kinds = {got.dtype.kind, expect.dtype.kind}
+    tolerant = kinds <= set("biufc") and (
+        bool(kinds & set("fc")) or rtol is not None or atol is not None
+    )
+    if tolerant:
+        tols = _tolerances(rtol, atol)
+        if numpy.allclose(got, expect, equal_nan=True, **tols):
+            return None
+        same = numpy.isclose(got, expect, equal_nan=True, **tols)
+    else:
+        if numpy.array_equal(got, expect):
+            return None
+        same = numpy.asarray(got == expect, dtype=bool)
+
+    dtype = ""
+    if got.dtype != expect.dtype:
+        dtype = f" (dtype {got.dtype}, expected {expect.dtype})"
+    if not got.ndim:
+        return f"={got.tolist()!r} does not equal {expect.tolist()!r}{dtype}"
+
+    differ = numpy.argwhere(~same).tolist()
+    shown = []
+    for index in map(tuple, differ[:max_shown]):
+        position = index[0] if got.ndim == 1 else index
+        got_value, expect_value = got[index], expect[index]
+        if isinstance(got_value, numpy.generic):
+            got_value = got_value.item()
+        if isinstance(expect_value, numpy.generic):
+            expect_value = expect_value.item()
+        shown.append(f"[{position}] {got_value!r} != {expect_value!r}")
+    return (
+        f"has {len(differ)} of {got.size} elements different{dtype}: "
+        f"{', '.join(shown)}{', ...' if len(differ) > max_shown else ''}"
+    )
+
+
+_NUMBERS = (int, float, complex)
+
+
+def _both_nan(got, expect):
+    from math import isnan
+
+    return (
+        isinstance(got, _NUMBERS)
+        and isinstance(expect, _NUMBERS)
+        and (isnan(abs(got)) and isnan(abs(expect)))
+    )
+
+
+def _numeric_array(value):
+    """returns value, a list or tuple, as a numeric ndarray or None"""
+    from numpy import asarray
+
+    if not isinstance(value, (list, tuple)):
+        return None
+    try:
+        array = asarray(value)
+    except ValueError:
+        # ragged
+        return None
+    return array if array.dtype.kind in "biufc" else None
+
+
+def value_difference(got, expect, rtol=None, atol=None, max_shown=5):
+    """returns a description of how got differs from expect, None if equal
+
+    Parameters
+    ----------
+    got, expect
+        values compared. If either is an ndarray, pandas object or has an
+        ndarray array attribute (e.g. a cogent3 Table), both are compared
+        as arrays in a single vectorised pass.
+    rtol, atol
+        tolerances, as for numpy.isclose(). Arrays of floats are always
+        compared with a tolerance (numpy's defaults if not provided), other
+        numbers, and lists or tuples of numbers, only if a tolerance is
+        provided.
+    max_shown
+        number of mismatching array elements described
+
+    Notes
+    -----
+    NaN equals NaN.
+    """
+    got_array = _as_array(got)
+    expect_array = _as_array(expect)
+    if (
+        got_array is None
+        and expect_array is None
+        and (rtol is not None or atol is not None)
+    ):
+        got_array = _numeric_array(got)
+        expect_array = _numeric_array(expect)
+        if got_array is None or expect_array is None:
+            got_array = expect_array = None
+
+    if got_array is not None or expect_array is not None:
+        from numpy import asarray
+
+        # lists compared with object arrays, e.g. of tables, are not coerced
+        # to a common type
+        other = got_array if got_array is not None else expect_array
+        dtype = object if other.dtype == object else None
+        try:
+            got_array = asarray(got, dtype=dtype) if got_array is None else got_array
+            if expect_array is None:
+                expect_array = asarray(expect, dtype=dtype)
+        except ValueError as err:
+            # e.g. a ragged list
+            return f"={_short(got)} cannot be compared with {_short(expect)}: {err}"
+        return _array_difference(got_array, expect_array, rtol, atol, max_shown)
+
+    if _both_nan(got, expect):
+        return None
+
+    if (rtol is not None or atol is not None) and (
+        isinstance(got, _NUMBERS) and isinstance(expect, _NUMBERS)
+    ):
+        from numpy import isclose
+
+        if isclose(got, expect, **_tolerances(rtol, atol)):
+            return None
+    elif got == expect:
+        return None
+
+    expect = repr(expect) if isinstance(expect, str) else expect
+    got = repr(got) if isinstance(got, str) else got
+    return f"={got} does not equal {expect}"
+
+
+def _describe(name, difference):
+    sep = "" if difference.startswith("=") else " "
+    return f"value of {name}{sep}{difference}"
+
+
+def expected_variables_values(names_values, scope, rtol=None, atol=None, max_shown=5):
+    """raises an AssertionError if type of name in scope not in expected
+
+    rtol, atol and max_shown are as for value_difference()"""
     wrong = []
     names_values = dict(names_values)
     for name, expect in names_values.items():
@@ -65,18 +395,20 @@ def expected_variables_values(names_values, scope):
             wrong.append(f"'{name}' not present")
             continue
 
-        got = scope[name]
-        if got != expect:
-            expect = repr(expect) if isinstance(expect, str) else expect
-            got = repr(got) if isinstance(got, str) else got
-            wrong.append(f"value of {name}={got} does not equal {expect}")
+        difference = value_difference(
+            scope[name], expect, rtol=rtol, atol=atol, max_shown=max_shown
+        )
+        if difference:
+            wrong.append(_describe(name, difference))
 
     if wrong:
         msg = "\n".join(wrong)
         raise AssertionError(f"The following variables had incorrect values: {msg}")
 
 
-def expected_variables_attrib_values(names_values, attrib_name, scope):
+def expected_variables_attrib_values(
+    names_values, attrib_name, scope, rtol=None, atol=None, max_shown=5
+):
     """
     Parameters
     ----------
@@ -85,6 +417,8 @@ def expected_variables_attrib_values(names_values, attrib_name, scope):
     attrib_name
         name of attribute expected to exist on variables
     scope
+    rtol, atol, max_shown
+        as for value_difference()
 
     Raises AssertionError if attribute does not exist or value of attribute
     incorrect.
@@ -101,28 +435,28 @@ def expected_variables_attrib_values(names_values, attrib_name, scope):
             wrong.append(f"'{name}' does not have attribute {attrib_name}")
             continue
 
-        if attrib_value != expect:
-            expect = repr(expect) if isinstance(expect, str) else expect
-            got = repr(attrib_value) if isinstance(attrib_value, str) else attrib_value
-            wrong.append(
-                (f"value of {name}.{attrib_name}={got} does not equal {expect}")
-            )
+        difference = value_difference(
+            attrib_value, expect, rtol=rtol, atol=atol, max_shown=max_shown
+        )
+        if difference:
+            wrong.append(_describe(f"{name}.{attrib_name}", difference))
 
     if wrong:
         msg = "\n".join(wrong)
         raise AssertionError(f"The following variables were incorrect: {msg}")
 
 
-def function_does_not_fail(func, *inputs, multiple_args=False):
-    """function does not fail on the provided inputs"""
+def function_does_not_fail(
+    func, *inputs, multiple_args=False, timeout=None, memory_mb=None
+):
+    """function does not fail on the provided inputs
+
+    timeout and memory_mb limit each call, see set_limits()"""
+    calls = [(func, input if multiple_args else (input,), {}) for input in inputs]
+    results = run_calls(calls, timeout=timeout, memory_mb=memory_mb)
     errors = []
-    for input in inputs:
-        try:
-            if multiple_args:
-                _ = func(*input)
-            else:
-                _ = func(input)
-        except Exception as err:
+    for input, (succeeded, err) in zip(inputs, results):
+        if not succeeded:
             msg = f"failed on {input}: {err}"
             errors.append(msg)
     if errors:
@@ -136,20 +470,28 @@ def _get_types(result, single):
     return [type(item) for item in result]
 
 
-def function_returned_correct_types(func, expected_types, *inputs):
-    """function returns types matching expected_types"""
+def function_returned_correct_types(
+    func, expected_types, *inputs, timeout=None, memory_mb=None
+):
+    """function returns types matching expected_types
+
+    timeout and memory_mb limit each call, see set_limits()"""
     if isinstance(expected_types, type):
         expected_types = [expected_types]
         single = True
     else:
         single = False
+    results = run_calls(
+        [(func, (input,), {}) for input in inputs],
+        timeout=timeout,
+        memory_mb=memory_mb,
+    )
     errors = []
-    for input in inputs:
-        try:
-            got = func(input)
+    for input, (succeeded, got) in zip(inputs, results):
+        if succeeded:
             got_types = _get_types(got, single)
-        except Exception as err:
-            msg = f"failed on {input}: {err}"
+        else:
+            msg = f"failed on {input}: {got}"
             errors.append(msg)
             got_types = None
 
@@ -165,6 +507,210 @@ def function_returned_correct_types(func, expected_types, *inputs):
         raise AssertionError("\n".join(errors))
 
 
+# the timer used by the timing checks, and the shortest time it resolves
+_timer = time.perf_counter
+_TIMER_RESOLUTION = time.get_clock_info("perf_counter").resolution
+
+
+def _timed_call(func, args, kwargs):
+    # copied so a function that modifies its input is timed on the original
+    args = copy.deepcopy(args)
+    kwargs = copy.deepcopy(kwargs)
+    start = _timer()
+    func(*args, **kwargs)
+    return _timer() - start
+
+
+def _median_time(func, args, kwargs, repeats, warmup):
+    for _ in range(warmup):
+        _timed_call(func, args, kwargs)
+    median = statistics.median(_timed_call(func, args, kwargs) for _ in range(repeats))
+    # a call quicker than the timer resolves takes 0s
+    return max(median, _TIMER_RESOLUTION)
+
+
+def _time_calls(timings, repeats, warmup, timeout, memory_mb):
+    """returns run_calls() results for (func, args, kwargs) timings, the
+    result of each is the median seconds taken"""
+    calls = [
+        (_median_time, (func, args, kwargs, repeats, warmup), {})
+        for func, args, kwargs in timings
+    ]
+    # one at a time, so the timed calls do not compete for a CPU
+    return run_calls(calls, timeout=timeout, memory_mb=memory_mb, workers=1)
+
+
+def time_function(
+    func, *args, repeats=5, warmup=1, timeout=None, memory_mb=None, **kwargs
+):
+    """returns the median seconds taken by func(*args, **kwargs)
+
+    Parameters
+    ----------
+    repeats
+        number of timed calls
+    warmup
+        number of untimed calls made first
+    timeout, memory_mb
+        limit all the calls together, see set_limits()
+
+    Notes
+    -----
+    Arguments are deep copied before each call, outside the timing. Times
+    shorter than the timer resolution are given as the resolution.
+    """
+    [(succeeded, result)] = _time_calls(
+        [(func, args, kwargs)], repeats, warmup, timeout, memory_mb
+    )
+    if not succeeded:
+        raise result
+    return result
+
+
+def function_within_time_budget(
+    func,
+    ref_func,
+    *inputs,
+    max_ratio=10.0,
+    multiple_args=False,
+    repeats=5,
+    warmup=1,
+    timeout=None,
+    memory_mb=None,
+):
+    """raises an AssertionError if func takes more than max_ratio times as
+    long as ref_func on any of inputs
+
+    repeats, warmup, timeout and memory_mb are as for time_function()"""
+    timings = []
+    for input in inputs:
+        args = input if multiple_args else (input,)
+        timings.extend([(ref_func, args, {}), (func, args, {})])
+    results = _time_calls(timings, repeats, warmup, timeout, memory_mb)
+
+    errors = []
+    for i, input in enumerate(inputs):
+        (ref_succeeded, ref), (succeeded, got) = results[2 * i : 2 * i + 2]
+        if not ref_succeeded:
+            raise ref
+        if not succeeded:
+            errors.append(f"failed on {reprlib.repr(input)}: {got}")
+            continue
+
+        if got > max_ratio * ref:
+            errors.append(
+                f"took {got:.3g}s, {got / ref:.1f} times the {ref:.3g}s of the "
+                f"reference (max {max_ratio}), on {reprlib.repr(input)}"
+            )
+
+    if errors:
+        msg = "\n".join(errors)
+        raise AssertionError(f"{func.__name__} is too slow: {msg}")
+
+
+def scaling_exponent(sizes, times):
+    """returns k, from a least squares fit of times = c * sizes**k
+
+    times of 0 are taken as the timer resolution"""
+    from numpy import log, maximum, polyfit
+
+    return polyfit(log(sizes), log(maximum(times, _TIMER_RESOLUTION)), 1)[0]
+
+
+def function_scales_as(
+    func,
+    make_input,
+    sizes,
+    ref_func=None,
+    max_exponent=None,
+    tolerance=0.25,
+    max_ratio=None,
+    repeats=5,
+    warmup=1,
+    timeout=None,
+    memory_mb=None,
+):
+    """raises an AssertionError if func scales worse than expected
+
+    Parameters
+    ----------
+    func
+        called with make_input(n) for each n in sizes
+    make_input
+        returns the input of size n
+    sizes
+        input sizes, spanning at least an order of magnitude gives a
+        reliable exponent. The largest should take more than a few
+        milliseconds.
+    ref_func
+        reference implementation, func fails if its scaling exponent
+        exceeds that of ref_func by more than tolerance
+    max_exponent
+        func fails if its scaling exponent exceeds this by more than
+        tolerance, e.g. 1 for O(n). Required if there is no ref_func.
+    max_ratio
+        func also fails if it takes more than this many times as long as
+        ref_func at any size
+    repeats, warmup, timeout, memory_mb
+        as for time_function(), timeout and memory_mb apply to each size
+
+    Notes
+    -----
+    The exponent of O(n log n) over a range of sizes is slightly above 1,
+    hence the tolerance.
+    """
+    if ref_func is None and max_exponent is None:
+        raise ValueError("one of ref_func or max_exponent is required")
+    if max_ratio is not None and ref_func is None:
+        raise ValueError("max_ratio requires ref_func")
+
+    inputs = [make_input(n) for n in sizes]
+    timings = [(func, (i,), {}) for i in inputs]
+    if ref_func is not None:
+        timings.extend((ref_func, (i,), {}) for i in inputs)
+    results = _time_calls(timings, repeats, warmup, timeout, memory_mb)
+
+    failed = [
+        f"n={n}: {err}" for n, (succeeded, err) in zip(sizes, results) if not succeeded
+    ]
+    if failed:
+        msg = "\n".join(failed)
+        raise AssertionError(f"{func.__name__} failed on:\n{msg}")
+    for succeeded, err in results[len(sizes) :]:
+        if not succeeded:
+            raise err
+
+    times = [t for _, t in results[: len(sizes)]]
+    ref_times = [t for _, t in results[len(sizes) :]]
+    errors = []
+    exponent = scaling_exponent(sizes, times)
+    limits = []
+    if max_exponent is not None:
+        limits.append((max_exponent, f"n^{max_exponent}"))
+    if ref_func is not None:
+        ref_exponent = scaling_exponent(sizes, ref_times)
+        limits.append((ref_exponent, f"n^{ref_exponent:.2f}, as the reference"))
+
+    for limit, desc in limits:
+        if exponent > limit + tolerance:
+            errors.append(
+                f"time grows as n^{exponent:.2f}, expected at most {desc} "
+                f"(tolerance {tolerance})"
+            )
+
+    if max_ratio is not None:
+        for n, got, ref in zip(sizes, times, ref_times):
+            if got > max_ratio * ref:
+                errors.append(
+                    f"took {got:.3g}s, {got / ref:.1f} times the reference "
+                    f"(max {max_ratio}), at n={n}"
+                )
+
+    if errors:
+        msg = "\n".join(errors)
+        raise AssertionError(f"{func.__name__} scales poorly: {msg}")
+
+
 _accessory = {
     "pandas": ["pandas", "numpy", "dateutil", "pytz", "six"],
     "numpy": ["numpy"],
@@ -284,40 +830,83 @@ _accessory = {
 }
 
 
-def allowed_modules(allowed=None):
-    import inspect
-    import pathlib
+@functools.lru_cache(maxsize=None)
+def _allowlist(groups):
+    """returns the frozenset of top-level module names allowed for groups"""
     import sys
 
-    invalid = set()
-    allowed = allowed or []
+    allowed = list(groups)
     allowed.append("jupyter")
-    if allowed:
-        for k, v in _accessory.items():
-            if k in allowed:
-                allowed.extend(v)
+    for k, v in _accessory.items():
+        if k in allowed:
+            allowed.extend(v)
 
     allowed.extend(sys.builtin_module_names)
-    allowed = set(allowed)
-    for name, module in sorted(sys.modules.items()):
-        if not inspect.ismodule(module):
-            continue
-        name = name.split(".")[0]
-        if name in allowed:
-            continue
+    return frozenset(allowed)
 
-        try:
-            name = module.__name__.split(".")[0]
-        except AttributeError:
-            print(name, type(module))
-            exit()
-        f = getattr(module, "__file__", "") or ""
-        path = pathlib.Path(f)
-        if "site-packages" in path.parts:
-            invalid.add(name.split(".")[0])
+
+@functools.lru_cache(maxsize=8)
+def _third_party_prefixes(paths):
+    """returns the entries of paths (sys.path) within a site-packages dir"""
+    prefixes = [p for p in paths if "site-packages" in pathlib.Path(p).parts]
+    return tuple(os.path.join(p, "") for p in prefixes)
+
+
+def _settled(module):
+    """whether module has finished importing, with its file set if it has one"""
+    spec = getattr(module, "__spec__", None)
+    if spec is None:
+        # e.g. submodules created by extension modules
+        return True
+    if getattr(spec, "_initializing", False):
+        return False
+    return not spec.has_location or bool(getattr(module, "__file__", None))
+
+
+# {name: id(module)} of the modules already found to be allowed, keyed by
+# (allowlist, third-party prefixes)
+_verified = {}
+
+
+def allowed_modules(allowed=None):
+    """raises a RuntimeError if modules from site-packages, other than
+    those allowed, have been imported
+
+    Parameters
+    ----------
+    allowed
+        names of allowed 3rd-party packages. The names of the groups in
+        _accessory also allow their dependencies.
+
+    Notes
+    -----
+    Modules found to be allowed are remembered, so a subsequent call only
+    inspects modules imported, or replaced in sys.modules, since. Modules
+    whose file is not yet set, such as those being imported, are inspected
+    again on every call.
+    """
+    import sys
+
+    allowed = [allowed] if isinstance(allowed, str) else allowed or ()
+    allowlist = _allowlist(frozenset(allowed))
+    prefixes = _third_party_prefixes(tuple(sys.path))
+    verified = _verified.setdefault((allowlist, prefixes), {})
+
+    invalid = set()
+    for name, module in list(sys.modules.items()):
+        if verified.get(name) == id(module):
+            continue
+        top = name.split(".")[0]
+        is_module = inspect.ismodule(module)
+        f = getattr(module, "__file__", None) if is_module else None
+        if top not in allowlist and f and f.startswith(prefixes):
+            invalid.add(getattr(module, "__name__", name).split(".")[0])
+        elif not is_module or _settled(module):
+            # other objects, e.g. typing.io, are inspected again if replaced
+            verified[name] = id(module)
 
     if invalid:
-        invalid = ", ".join(f"{i!r}" for i in invalid)
+        invalid = ", ".join(f"{i!r}" for i in sorted(invalid))
         raise RuntimeError(f"the following 3rd-party modules not allowed: {invalid}")
 
 
@@ -330,14 +919,212 @@ def trapped_result(func, *args, **kwargs):
     return result
 
 
+def _trapped(succeeded, result):
+    """the result, or the exception formatted as by trapped_result()"""
+    if succeeded:
+        return result
+    return [traceback.format_exception_only(type(result), result)[-1].rstrip("\n")]
+
+
+_IMMUTABLE_TYPES = (type(None), bool, int, float, complex, str, bytes, range)
+
+
+def _is_immutable(value):
+    if isinstance(value, (tuple, frozenset)):
+        return all(_is_immutable(v) for v in value)
+    return isinstance(value, _IMMUTABLE_TYPES)
+
+
+def _dumps(value):
+    return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _checksum(value):
+    if isinstance(value, ndarray):
+        data = value.tobytes() + str((value.dtype, value.shape)).encode()
+    else:
+        data = _dumps(value)
+    return hashlib.sha1(data).hexdigest()
+
+
+def _freeze(args, kwargs):
+    """returns {key: (kind, value, pickled)} for args, keyed by position,
+    and kwargs
+
+    kind is 'array' for ndarrays, 'shared' for immutable values, 'pickled'
+    for mutable values that can be pickled and otherwise 'copy'
+    """
+    frozen = {}
+    for key, value in [*enumerate(args), *kwargs.items()]:
+        if isinstance(value, ndarray):
+            frozen[key] = ("array", value, None)
+        elif _is_immutable(value):
+            frozen[key] = ("shared", value, None)
+        else:
+            try:
+                frozen[key] = ("pickled", value, _dumps(value))
+            except Exception:
+                frozen[key] = ("copy", value, None)
+    return frozen
+
+
+def _thaw(frozen, isolated):
+    """returns {key: value} for a call
+
+    Mutable values are copied, unless isolated as a forked worker process
+    already has its own copy."""
+    values = {}
+    for key, (kind, value, pickled) in frozen.items():
+        if kind == "shared" or isolated:
+            values[key] = value
+        elif kind == "array":
+            values[key] = value.copy()
+        elif kind == "pickled":
+            values[key] = pickle.loads(pickled)
+        else:
+            values[key] = copy.deepcopy(value)
+    return values
+
+
+def _call_watched(func, frozen, watch, isolated):
+    """returns func(*args, **kwargs) from the thawed frozen values, and
+    {key: checksum} of the watched values after the call"""
+    values = _thaw(frozen, isolated)
+    args = [v for k, v in values.items() if isinstance(k, int)]
+    kwargs = {k: v for k, v in values.items() if not isinstance(k, int)}
+    result = func(*args, **kwargs)
+    return result, {k: _checksum(values[k]) for k in watch}
+
+
+def _same(r1, r2):
+    if isinstance(r1, ndarray) or isinstance(r2, ndarray):
+        from numpy import array_equal
+
+        return array_equal(r1, r2)
+    try:
+        return bool(r1 == r2)
+    except ValueError:
+        # e.g. containers of ndarrays
+        return _dumps(r1) == _dumps(r2)
+
+
+def _equivalence_calls(func1, func2, inputs, isolated, check_mutation):
+    """returns the run_calls() calls, two per input, and the frozen inputs
+
+    inputs are (args, kwargs)"""
+    calls = []
+    frozen_inputs = []
+    for args, kwargs in inputs:
+        frozen = _freeze(args, kwargs)
+        watch = [k for k, f in frozen.items() if f[0] in ("array", "pickled")]
+        watch = watch if check_mutation else []
+        frozen_inputs.append(frozen)
+        # thawed within each call, so only one copy exists at a time
+        for func in (func1, func2):
+            calls.append((_call_watched, (func, frozen, watch, isolated), {}))
+    return calls, frozen_inputs
+
+
+def _modified(frozen, key, checksum):
+    kind, value, pickled = frozen[key]
+    if kind == "pickled":
+        return hashlib.sha1(pickled).hexdigest() != checksum
+    return _checksum(value) != checksum
+
+
+def _mutation_mismatches(frozen, names, sums1, sums2):
+    """returns descriptions of arguments modified differently by two calls"""
+    mismatches = []
+    for key in sorted(sums1.keys() | sums2.keys(), key=str):
+        if sums1.get(key) == sums2.get(key):
+            continue
+        modified = [
+            name
+            for name, sums in zip(names, (sums1, sums2))
+            if key in sums and _modified(frozen, key, sums[key])
+        ]
+        if not modified:
+            continue
+        desc = f"only {modified[0]}" if len(modified) == 1 else "both, differently"
+        mismatches.append(f"argument {key} modified by {desc}")
+    return mismatches
+
+
+def _short(value, length=50):
+    value = str(value)
+    return f"{value[:length]}..." if len(value) > length else value
+
+
+def funcs_equivalent_over(
+    func1, func2, inputs, multiple_args=False, check_mutation=True, **limits
+):
+    """raises an AssertionError listing every input for which func1 and
+    func2 differ
+
+    Parameters
+    ----------
+    func1, func2
+        the functions compared, e.g. a submission and a reference
+    inputs
+        series of inputs, each is a single argument unless multiple_args
+    multiple_args
+        each input is a tuple of arguments
+    check_mutation
+        the functions must also modify arguments in the same way
+    limits
+        timeout, memory_mb and workers, as for set_limits()
+
+    Notes
+    -----
+    Immutable arguments are shared between calls. ndarrays are copied
+    directly, other arguments via pickle, unless the calls are made in
+    forked worker processes. Modification of arguments is detected from
+    checksums.
+    """
+    inputs = list(inputs)
+    names = (func1.__name__, func2.__name__)
+    isolated = any(_resolve_limits(**limits)[:2])
+    calls, frozen = _equivalence_calls(
+        func1,
+        func2,
+        [(input if multiple_args else (input,), {}) for input in inputs],
+        isolated,
+        check_mutation,
+    )
+    results = run_calls(calls, **limits)
+
+    mismatches = []
+    for i, input in enumerate(inputs):
+        (ok1, r1), (ok2, r2) = results[2 * i : 2 * i + 2]
+        out1 = _trapped(ok1, r1[0] if ok1 else r1)
+        out2 = _trapped(ok2, r2[0] if ok2 else r2)
+        if not _same(out1, out2):
+            msgs = [f"{_short(out1)} != {_short(out2)}"]
+        elif check_mutation and ok1 and ok2:
+            msgs = _mutation_mismatches(frozen[i], names, r1[1], r2[1])
+        else:
+            msgs = []
+        mismatches.extend(f"input {reprlib.repr(input)}: {msg}" for msg in msgs)
+
+    if mismatches:
+        msg = "\n".join(mismatches)
+        raise AssertionError(f"{names[0]} and {names[1]} differ on:\n{msg}")
+    return True
+
+
 def two_funcs_equivalent(func1, func2, *args, **kwargs):
-    r1 = trapped_result(func1, *copy.deepcopy(args), **copy.deepcopy(kwargs))
-    r2 = trapped_result(func2, *copy.deepcopy(args), **copy.deepcopy(kwargs))
-    if r1 != r2:
-        r1 = str(r1)
-        r2 = str(r2)
-        output_1 = f"{r1[:50]}..." if len(r1) > 50 else r1
-        output_2 = f"{r2[:50]}..." if len(r2) > 50 else r2
+    """raises an AssertionError if func1 and func2 give different results
+
+    Arguments are copied only if mutable, see funcs_equivalent_over(). Calls
+    are limited as set by set_limits()."""
+    isolated = any(_resolve_limits()[:2])
+    calls, _ = _equivalence_calls(func1, func2, [(args, kwargs)], isolated, False)
+    (ok1, r1), (ok2, r2) = run_calls(calls)
+    r1 = _trapped(ok1, r1[0] if ok1 else r1)
+    r2 = _trapped(ok2, r2[0] if ok2 else r2)
+    if not _same(r1, r2):
+        output_1 = _short(r1)
+        output_2 = _short(r2)
         msg = f"Outputs from {func1.__name__} != {func2.__name__}\n{output_1}\n{output_2}\n"
         raise AssertionError(msg)
     return True
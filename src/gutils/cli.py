@@ -9,10 +9,8 @@ simplefilter("ignore", Warning)
 
 import click
 
-import gutils.bundle_data as BD
-import gutils.inject_marks as MK
-import gutils.nbgrader_fetched as FETCH
-import gutils.rinstall as RK
+# command modules are imported when their command runs, so that starting
+# gutils, e.g. for --help or from cron, does not pay for all of them
 
 
 @click.group()
@@ -26,58 +24,280 @@ def main():
 @click.argument("dest_root_dir", type=click.Path(), default="/home/data")
 @click.option("-F", "--force", flag_value=True, help="force over write of dest_dir")
 @click.option("-D", "--dry_run", flag_value=True, help="display what will be done")
-def bundle_data(dest_root_dir, assign_dir, force, dry_run):
+@click.option("-w", "--workers", default=4, type=int, help="max concurrent transfers")
+@click.option(
+    "--dedup",
+    flag_value=True,
+    help="store files once, by content, under dest_root_dir/.store",
+)
+@click.option(
+    "--exclude_ext", multiple=True, help="additional suffix of non-data files"
+)
+@click.option(
+    "--include_ext", multiple=True, help="only files with this suffix are data"
+)
+@click.option("--min_size", default=0, type=int, help="min data file size (bytes)")
+@click.option("--max_size", default=None, type=int, help="max data file size (bytes)")
+@click.option(
+    "--ignore_file",
+    type=click.Path(exists=True),
+    help="gitignore style patterns of non-data files [default: ASSIGN_DIR/.bundleignore]",
+)
+@click.option("--resume", flag_value=True, help="complete an interrupted bundle")
+@click.option(
+    "--rollback",
+    flag_value=True,
+    help="restore the original files of the last, or an interrupted, bundle",
+)
+def bundle_data(
+    dest_root_dir,
+    assign_dir,
+    force,
+    dry_run,
+    workers,
+    dedup,
+    exclude_ext,
+    include_ext,
+    min_size,
+    max_size,
+    ignore_file,
+    resume,
+    rollback,
+):
     """replaces assignment directory data files with symlinks after moving originals to another location"""
-    BD.main(dest_root_dir, assign_dir, force, dry_run)
+    import gutils.bundle_data as BD
+
+    rules = BD.make_rules(
+        assign_dir,
+        exclude_ext=exclude_ext,
+        include_ext=include_ext,
+        min_size=min_size,
+        max_size=max_size,
+        ignore_file=ignore_file,
+    )
+    BD.main(
+        dest_root_dir,
+        assign_dir,
+        force,
+        dry_run,
+        workers=workers,
+        dedup=dedup,
+        rules=rules,
+        resume=resume,
+        undo=rollback,
+    )
+
+
+@main.command()
+@click.argument("assign_dir", type=click.Path(exists=True))
+@click.argument("dest_root_dir", type=click.Path(exists=True), default="/home/data")
+@click.option("-w", "--workers", default=4, type=int, help="max concurrent checksums")
+def verify_bundle(assign_dir, dest_root_dir, workers):
+    """checks bundled data symlinks resolve and checksums match"""
+    import gutils.bundle_data as BD
+
+    problems = BD.verify(assign_dir, dest_root_dir, workers=workers)
+    for problem in problems:
+        click.secho(problem, fg="red")
+    if problems:
+        exit(1)
+    click.secho("All bundled files verified", fg="green")
 
 
 @main.command()
 def rkernel():
     """installs the R kernel for Jupyter"""
+    import gutils.rinstall as RK
+
     RK.rkernel()
 
 
 @main.command()
 @click.argument("package_file", required=True, type=click.Path(exists=True))
-def cran(package_file):
+@click.option(
+    "-n",
+    "--ncpus",
+    default=None,
+    type=int,
+    help="install all missing packages in one R session with this many parallel builds",
+)
+@click.option(
+    "-r",
+    "--repo",
+    default=None,
+    help="CRAN URL or local repository directory (see cran_cache)",
+)
+def cran(package_file, ncpus, repo):
     """installs CRAN packages"""
-    RK.cran(package_file)
+    import gutils.rinstall as RK
+
+    RK.cran(package_file, ncpus=ncpus, repo=repo)
+
+
+@main.command()
+@click.argument("package_file", required=True, type=click.Path(exists=True))
+@click.argument("cache_dir", required=True, type=click.Path())
+@click.option("-r", "--repo", default=None, help="CRAN URL to download from")
+def cran_cache(package_file, cache_dir, repo):
+    """downloads CRAN packages to a local repository for offline installs"""
+    import gutils.rinstall as RK
+
+    RK.cran_cache(package_file, cache_dir, repo=repo)
+
+
+_log_backend = click.option(
+    "-b",
+    "--backend",
+    type=click.Choice(["json", "jsonl", "sqlite"]),
+    default="json",
+    help="storage for the fetch log",
+)
 
 
 @main.command()
-def log_fetched():
+@click.option(
+    "-w", "--workers", default=16, type=int, help="max concurrent home dir scans"
+)
+@click.option("-v", "--verbose", flag_value=True, help="display timing of the scan")
+@_log_backend
+@click.option(
+    "--watch", flag_value=True, help="run continuously, recording fetches as they occur"
+)
+@click.option(
+    "--poll",
+    flag_value=True,
+    help="in watch mode, poll rather than use filesystem notifications (e.g. NFS)",
+)
+@click.option(
+    "--interval",
+    default=None,
+    type=float,
+    help="in watch mode, seconds between flushes (default 10) or polls (default 300)",
+)
+@click.option(
+    "--close",
+    multiple=True,
+    help="assignment to stop recording fetches for, can be repeated",
+)
+@click.option(
+    "--no_index",
+    flag_value=True,
+    help="ignore the cached index of homes, assignments and finished assignments",
+)
+@click.option(
+    "--compact",
+    flag_value=True,
+    help="remove duplicate records from a jsonl log, safe while others append",
+)
+def log_fetched(
+    workers, verbose, backend, watch, poll, interval, close, no_index, compact
+):
     """logs times when assignments fetched to a json file"""
-    FETCH.main()
+    import gutils.nbgrader_fetched as FETCH
+
+    if close:
+        FETCH.close_assignments(close)
+        click.secho(f"Closed {', '.join(close)}", fg="green")
+        return
+
+    if compact:
+        log = FETCH.get_log(backend)
+        if not hasattr(log, "compact"):
+            click.secho(f"the {backend} log does not need compacting", fg="red")
+            exit(1)
+        click.secho(f"Removed {log.compact()} duplicate records", fg="green")
+        return
+
+    if not watch:
+        FETCH.main(
+            max_workers=workers,
+            verbose=verbose,
+            backend=backend,
+            use_index=not no_index,
+        )
+        return
+
+    intervals = {}
+    if interval is not None:
+        intervals["poll_interval" if poll else "flush_interval"] = interval
+    FETCH.watch(backend=backend, max_workers=workers, poll=poll, **intervals)
 
 
 @main.command()
 @click.option("-i", "--uni_id", required=True, help="student ID")
-def student_fetch_record(uni_id):
+@_log_backend
+def student_fetch_record(uni_id, backend):
     """displays times when student fetched assignments"""
-    FETCH.check_student(uni_id)
+    import gutils.nbgrader_fetched as FETCH
+
+    FETCH.check_student(uni_id, backend=backend)
 
 
 @main.command()
-@click.argument("notebooks", required=True, type=click.Path(exists=True))
-def inject_marks(notebooks):
-    """inserts how many points each nbgrader assessed cell is worth"""
-    MK.main(notebooks)
+@click.argument("notebooks", required=True, nargs=-1, type=click.Path(exists=True))
+@click.option("-j", "--jobs", default=1, type=int, help="number of worker processes")
+@click.option(
+    "-F", "--force", flag_value=True, help="inject even if points are unchanged"
+)
+@click.option(
+    "-k",
+    "--keep",
+    default=10,
+    type=int,
+    help="number of backups to retain per notebook, 0 retains all",
+)
+@click.option("-z", "--gzip", "compress", flag_value=True, help="gzip backups")
+def inject_marks(notebooks, jobs, force, keep, compress):
+    """inserts how many points each nbgrader assessed cell is worth
+
+    NOTEBOOKS can be notebook paths or directories"""
+    import gutils.inject_marks as MK
+
+    MK.main(notebooks, jobs=jobs, force=force, keep=keep or None, compress=compress)
 
 
 @main.command()
 @click.argument("submitted_dir", type=click.Path(exists=True))
 @click.argument("assignment_name", type=str)
-def nb2py(submitted_dir, assignment_name):
+@click.option("-j", "--jobs", default=1, type=int, help="number of worker processes")
+@click.option(
+    "-F", "--force", flag_value=True, help="convert all, including unchanged notebooks"
+)
+@click.option(
+    "-x",
+    "--exclude",
+    multiple=True,
+    help="regex, code lines matching are excluded (added to the defaults)",
+)
+@click.option(
+    "--exclude_file",
+    type=click.Path(exists=True),
+    help="file of regex, one per line, replaces the default exclusions",
+)
+@click.option(
+    "--per_cell", flag_value=True, help="exclude entire cells that have a match"
+)
+def nb2py(submitted_dir, assignment_name, jobs, force, exclude, exclude_file, per_cell):
     """convert notebook to just the script portion"""
-    from gutils.nb2py import make_scripts
+    from gutils.nb2py import DEFAULT_EXCLUDES, make_scripts, read_patterns
 
-    make_scripts(submitted_dir, assignment_name)
+    excludes = read_patterns(exclude_file) if exclude_file else list(DEFAULT_EXCLUDES)
+    excludes.extend(exclude)
+    converted = make_scripts(
+        submitted_dir,
+        assignment_name,
+        jobs=jobs,
+        force=force,
+        excludes=excludes,
+        per_cell=per_cell,
+    )
+    click.secho(f"Converted {len(converted)} notebooks", fg="green")
 
 
 def _assessment_key(name):
     import re
 
-    digit = re.compile("\d$")
+    digit = re.compile(r"\d$")
     if digit.search(name):
         n = int(name[-1])
     else:
@@ -89,8 +309,28 @@ def _assessment_key(name):
 
 @main.command()
 @click.argument("outdir", required=True, type=pathlib.Path, default=".")
-def export_grades(outdir):
+@click.option(
+    "--orm",
+    flag_value=True,
+    help="read scores via the nbgrader ORM, slower than the default sql",
+)
+@click.option(
+    "--long",
+    "long_format",
+    type=click.Choice(["csv", "tsv", "parquet", "feather"]),
+    help="instead write one (student, assignment, notebook, cell, score) row "
+    "per grade in this format, parquet and feather require pyarrow",
+)
+@click.option(
+    "--if_changed",
+    flag_value=True,
+    help="write only if scores changed since the previous --if_changed "
+    "export, otherwise its output is reused",
+)
+def export_grades(outdir, orm, long_format, if_changed):
     """export all assignments in the gradebook.db"""
+    if if_changed and (orm or long_format):
+        raise click.UsageError("--if_changed cannot be used with --long or --orm")
 
     outdir = outdir.expanduser().absolute()
 
@@ -102,8 +342,7 @@ def export_grades(outdir):
     import os
     import re
 
-    from cogent3 import make_table
-    from nbgrader.api import Gradebook
+    from gutils import gradebook as GB
 
     valid_user = re.compile("grader-biol(3157|6243)")
     course = re.compile("(biol3157|biol6243)")
@@ -125,32 +364,49 @@ def export_grades(outdir):
         click.secho(f"Could not find {str(gradebook_path)!r}")
         exit(1)
 
-    gb = Gradebook(f"sqlite:///{str(gradebook_path)}")
-
-    assignment_scores = {}
-    students = {}
-    for assignment in gb.assignments:
-        if not topics.search(assignment.name):
-            continue
-
-        results = {}
-        for s in assignment.submissions:
-            students[s.student_id] = s.student
-            results[s.student_id] = s.score
-        assignment_scores[assignment.name] = results
-
-    student_ids = {s: s for s in students}
-    data = {
-        "anuid": student_ids,
-        "name": {
-            s: " ".join((students[s].first_name, students[s].last_name))
-            for s in students
-        },
-    }
-    assignment_titles = sorted(assignment_scores, key=lambda x: _assessment_key(x))
-    for title in assignment_titles:
-        scores = assignment_scores[title]
-        data[title] = {s: scores.get(s, 0.0) for s in student_ids}
+    if if_changed:
+        from gutils import grade_export
+
+        state_path = outdir / f".{courseid}-export-state.json"
+        num = grade_export.export(
+            gradebook_path,
+            outpath,
+            state_path,
+            select=topics.search,
+            sort_key=_assessment_key,
+        )
+        click.secho(f"Wrote {str(outpath)!r}, {num} submissions changed", fg="green")
+        return
+
+    conn = GB.connect(gradebook_path)
+    if long_format:
+        from gutils import columnar
+
+        outpath = outpath.with_name(f"{outpath.stem}-cells.{long_format}")
+        rows = (r for r in GB.iter_cell_scores(conn) if topics.search(r[1]))
+        try:
+            num = columnar.write_rows(rows, outpath, GB.LONG_COLUMNS)
+        except ImportError:
+            click.secho(f"{long_format} output requires pyarrow", fg="red")
+            exit(1)
+        finally:
+            conn.close()
+        click.secho(f"Wrote {num} rows to {str(outpath)!r}", fg="green")
+        return
+
+    try:
+        if orm:
+            rows = GB.orm_submission_scores(gradebook_path)
+        else:
+            rows = GB.submission_scores(conn)
+        names = GB.student_names(conn)
+    finally:
+        conn.close()
+
+    rows = [r for r in rows if topics.search(r[0])]
+    data = GB.pivot_scores(rows, names, sort_key=_assessment_key)
+
+    from cogent3 import make_table
 
     table = make_table(data=data, digits=2)
     table.write(outpath)
@@ -0,0 +1,95 @@
+"""writing rows to delimited text or, with pyarrow, columnar files
+
+Rows are written in batches as they are produced so the full table is
+never held in memory. The format is determined by the file suffix.
+"""
+import csv
+import itertools
+import pathlib
+
+DELIMITED = {".csv": ",", ".tsv": "\t"}
+ARROW = (".parquet", ".feather", ".arrow")
+FORMATS = tuple(DELIMITED) + ARROW
+
+
+def _batches(rows, batch_size):
+    rows = iter(rows)
+    while batch := list(itertools.islice(rows, batch_size)):
+        yield batch
+
+
+def _write_delimited(rows, path, columns, delimiter):
+    num = 0
+    with open(path, "w", newline="") as outfile:
+        writer = csv.writer(outfile, delimiter=delimiter)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow(row)
+            num += 1
+    return num
+
+
+def _write_arrow(rows, path, columns, batch_size, parquet):
+    import pyarrow as pa
+
+    def to_table(batch, schema=None):
+        values = list(zip(*batch)) or [() for _ in columns]
+        return pa.table(dict(zip(columns, map(list, values))), schema=schema)
+
+    batches = _batches(rows, batch_size)
+    first = to_table(next(batches, []))
+    if parquet:
+        import pyarrow.parquet as pq
+
+        writer = pq.ParquetWriter(str(path), first.schema)
+    else:
+        import pyarrow.ipc as ipc
+
+        writer = ipc.new_file(str(path), first.schema)
+
+    num = first.num_rows
+    with writer:
+        writer.write_table(first)
+        for batch in batches:
+            table = to_table(batch, schema=first.schema)
+            writer.write_table(table)
+            num += table.num_rows
+    return num
+
+
+def write_rows(rows, path, columns, batch_size=50_000):
+    """writes rows to path, returns the number of rows written
+
+    Parameters
+    ----------
+    rows
+        iterable of tuples, one value per column
+    path
+        the suffix selects the format, .csv or .tsv are delimited text,
+        .parquet is Parquet and .feather or .arrow are Arrow IPC (Feather
+        v2), the latter require pyarrow
+    columns
+        column names
+    batch_size
+        number of rows per Parquet row group or Arrow record batch
+
+    Notes
+    -----
+    Written to a temporary file that replaces path when complete.
+    """
+    path = pathlib.Path(path)
+    suffix = path.suffix.lower()
+    if suffix not in FORMATS:
+        raise ValueError(f"unsupported format {suffix!r}, use one of {FORMATS}")
+
+    tmp = path.with_name(f".{path.name}.partial")
+    try:
+        if suffix in DELIMITED:
+            num = _write_delimited(rows, tmp, columns, DELIMITED[suffix])
+        else:
+            num = _write_arrow(rows, tmp, columns, batch_size, suffix == ".parquet")
+        tmp.replace(path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return num
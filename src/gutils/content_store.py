@@ -0,0 +1,60 @@
+"""a content-addressed store, files are saved once under their sha256"""
+import pathlib
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
+
+from gutils.transfer import file_digest, move_files
+
+STORE_NAME = ".store"
+
+
+def hash_files(paths, workers=4):
+    """returns {path: sha256 hex digest}, hashing with up to workers threads"""
+    paths = list(paths)
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        return dict(zip(paths, executor.map(file_digest, paths, repeat("sha256"))))
+
+
+class ContentStore:
+    """files stored as <root>/.store/<first 2 of hash>/<hash>
+
+    Parameters
+    ----------
+    root
+        directory the store is created in
+    """
+
+    def __init__(self, root):
+        self.path = pathlib.Path(root) / STORE_NAME
+
+    def object_path(self, digest):
+        return self.path / digest[:2] / digest
+
+    def add(self, paths, workers=4, show_progress=True, digests=None):
+        """moves the files in paths into the store
+
+        Files whose content is already stored are deleted. digests is
+        {path: sha256} of paths, if already known. Returns
+        {path: stored path}."""
+        if digests is None:
+            digests = hash_files(paths, workers=workers)
+        else:
+            digests = {path: digests[path] for path in paths}
+        stored = {}
+        moves = []
+        duplicates = []
+        moving = set()
+        for path, digest in digests.items():
+            obj = self.object_path(digest)
+            if obj in moving or obj.exists():
+                duplicates.append(path)
+            else:
+                obj.parent.mkdir(parents=True, exist_ok=True)
+                moves.append((path, obj))
+                moving.add(obj)
+            stored[path] = obj
+
+        move_files(moves, workers=workers, show_progress=show_progress, digests=digests)
+        for path in duplicates:
+            pathlib.Path(path).unlink()
+        return stored
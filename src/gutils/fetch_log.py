@@ -0,0 +1,252 @@
+"""storage backends for the record of when students fetched assignments
+
+All backends store (assignment, student, time) records and provide the same
+methods. Records are only ever added, an existing record for a
+(assignment, student) pair is never replaced.
+"""
+import json
+import os
+import pathlib
+import sqlite3
+from contextlib import contextmanager
+
+from gutils.backup import atomic_write_text
+
+
+class JsonLog:
+    """the entire log as a single json dict of {<assignment>: {<student>: time}}
+
+    Every addition rewrites the file."""
+
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+
+    def load(self):
+        """returns {<assignment>: {<student>: time}}"""
+        return json.loads(self.path.read_text()) if self.path.exists() else {}
+
+    def write(self, data):
+        atomic_write_text(self.path, json.dumps(data))
+
+    def add(self, records):
+        """adds (assignment, student, time) records"""
+        records = list(records)
+        if not records:
+            return
+        data = self.load()
+        for assignment, student, time in records:
+            data.setdefault(assignment, {}).setdefault(student, time)
+        self.write(data)
+
+    def assignments(self):
+        return list(self.load())
+
+    def student(self, student_id):
+        """returns {<assignment>: time} for student_id"""
+        data = self.load()
+        return {a: v[student_id] for a, v in data.items() if student_id in v}
+
+
+class JournalLog:
+    """append-only json lines file, one [assignment, student, time] per line
+
+    Additions only append the new records. Records repeated by, for
+    instance, concurrent runs are resolved on loading (the first wins) and
+    removed by compact(). A partly written last line, from an interrupted
+    addition, is ignored and removed by the next add(). The assignment names are indexed in a sidecar
+    file, updated from the records appended since it was written.
+    """
+
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        self.index_path = self.path.with_name(f".{self.path.name}.index")
+        self.lock_path = self.path.with_name(f".{self.path.name}.lock")
+
+    @contextmanager
+    def _locked(self):
+        """exclusive lock, held while appending or compacting"""
+        import fcntl
+
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _lines(self):
+        """yields the complete lines, a partly written last line is skipped"""
+        if not self.path.exists():
+            return
+        with open(self.path) as infile:
+            for line in infile:
+                if line.endswith("\n") and line.strip():
+                    yield line
+
+    def _records(self):
+        for line in self._lines():
+            yield json.loads(line)
+
+    def _truncate_partial(self):
+        """removes a partly written last line, left by an interrupted add()"""
+        if not self.path.exists():
+            return
+        with open(self.path, "rb+") as infile:
+            infile.seek(0, os.SEEK_END)
+            size = infile.tell()
+            if not size:
+                return
+            infile.seek(size - 1)
+            if infile.read(1) == b"\n":
+                return
+            infile.seek(0)
+            data = infile.read()
+            infile.truncate(data.rfind(b"\n") + 1)
+
+    def load(self):
+        """returns {<assignment>: {<student>: time}}"""
+        data = {}
+        for assignment, student, time in self._records():
+            data.setdefault(assignment, {}).setdefault(student, time)
+        return data
+
+    def compact(self):
+        """rewrites the journal without duplicate records, returns the number
+        of lines removed"""
+        with self._locked():
+            data = {}
+            num_lines = 0
+            for assignment, student, time in self._records():
+                data.setdefault(assignment, {}).setdefault(student, time)
+                num_lines += 1
+            lines = [
+                json.dumps([assignment, student, time])
+                for assignment, students in data.items()
+                for student, time in students.items()
+            ]
+            atomic_write_text(self.path, "".join(f"{l}\n" for l in lines))
+        return num_lines - len(lines)
+
+    def add(self, records):
+        """appends (assignment, student, time) records"""
+        lines = [json.dumps(list(record)) for record in records]
+        if not lines:
+            return
+        with self._locked():
+            self._truncate_partial()
+            with open(self.path, "a") as outfile:
+                outfile.write("".join(f"{l}\n" for l in lines))
+
+    def assignments(self):
+        """returns the assignment names, in the order first recorded
+
+        Only the records appended since the index was last updated are read.
+        """
+        if not self.path.exists():
+            return []
+
+        try:
+            index = json.loads(self.index_path.read_text())
+        except (FileNotFoundError, ValueError):
+            index = None
+
+        with open(self.path, "rb") as infile:
+            stat = os.fstat(infile.fileno())
+            # a compacted journal is a new file
+            if (
+                not index
+                or index["inode"] != stat.st_ino
+                or index["offset"] > stat.st_size
+            ):
+                index = {"inode": stat.st_ino, "offset": 0, "assignments": []}
+            infile.seek(index["offset"])
+            tail = infile.read()
+
+        names = dict.fromkeys(index["assignments"])
+        # a line being appended is incomplete
+        tail = tail[: tail.rfind(b"\n") + 1]
+        for line in tail.splitlines():
+            if line.strip():
+                names.setdefault(json.loads(line)[0])
+
+        if tail:
+            index["offset"] += len(tail)
+            index["assignments"] = list(names)
+            atomic_write_text(self.index_path, json.dumps(index))
+        return list(names)
+
+    def student(self, student_id):
+        """returns {<assignment>: time} for student_id"""
+        result = {}
+        if not self.path.exists():
+            return result
+        # only decode lines that can include the student
+        key = json.dumps(student_id)
+        for line in self._lines():
+            if key not in line:
+                continue
+            assignment, student, time = json.loads(line)
+            if student == student_id:
+                result.setdefault(assignment, time)
+        return result
+
+
+class SqliteLog:
+    """records in a sqlite table indexed by student and by assignment"""
+
+    _schema = (
+        "CREATE TABLE IF NOT EXISTS fetched ("
+        "assignment TEXT NOT NULL, student TEXT NOT NULL, time TEXT NOT NULL, "
+        "PRIMARY KEY (student, assignment))",
+        "CREATE INDEX IF NOT EXISTS fetched_assignment ON fetched (assignment)",
+    )
+
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(str(self.path))
+        try:
+            with conn:
+                for statement in self._schema:
+                    conn.execute(statement)
+                yield conn
+        finally:
+            conn.close()
+
+    def load(self):
+        """returns {<assignment>: {<student>: time}}"""
+        data = {}
+        with self._connect() as conn:
+            for assignment, student, time in conn.execute(
+                "SELECT assignment, student, time FROM fetched"
+            ):
+                data.setdefault(assignment, {})[student] = time
+        return data
+
+    def add(self, records):
+        """adds (assignment, student, time) records"""
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO fetched (assignment, student, time) "
+                "VALUES (?, ?, ?)",
+                records,
+            )
+
+    def assignments(self):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT DISTINCT assignment FROM fetched")
+            return [r[0] for r in rows]
+
+    def student(self, student_id):
+        """returns {<assignment>: time} for student_id"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT assignment, time FROM fetched WHERE student = ?",
+                (student_id,),
+            )
+            return dict(rows)
+
+
+BACKENDS = {"json": JsonLog, "jsonl": JournalLog, "sqlite": SqliteLog}
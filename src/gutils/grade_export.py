@@ -0,0 +1,129 @@
+"""export of assignment scores that writes only if they have changed since
+the previous export
+
+nbgrader does not record when a grade was modified, so scores cannot be
+queried for changes since a previous export. If the gradebook has not been
+modified since the previous export it is not read at all. Otherwise the
+scores are read and, if a checksum of any submission's aggregate row
+(timestamp, number of grades, score) differs from that of the previous
+export, the table is rewritten.
+"""
+import hashlib
+import json
+import pathlib
+import shutil
+import time
+
+from gutils import gradebook as GB
+from gutils.backup import atomic_write_text
+
+
+def checksum(row):
+    """returns a checksum of a submissions() row"""
+    return hashlib.md5(json.dumps(row[1:], default=str).encode("utf-8")).hexdigest()
+
+
+def gradebook_mtime(path):
+    """returns the latest mtime of the gradebook and its write-ahead log"""
+    path = pathlib.Path(path)
+    wal = path.with_name(f"{path.name}-wal")
+    mtimes = [path.stat().st_mtime]
+    if wal.exists():
+        mtimes.append(wal.stat().st_mtime)
+    return max(mtimes)
+
+
+def load_state(path):
+    """returns the saved export state, None if there is none"""
+    try:
+        return json.loads(pathlib.Path(path).read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _format(value):
+    return f"{value:.2f}" if isinstance(value, float) else str(value)
+
+
+def write_tsv(data, path):
+    """writes {column: {student id: value}}, as from pivot_scores(), to path"""
+    columns = list(data)
+    lines = ["\t".join(columns)]
+    for student in data["anuid"]:
+        lines.append("\t".join(_format(data[c][student]) for c in columns))
+    atomic_write_text(path, "".join(f"{l}\n" for l in lines))
+
+
+def _reuse_previous(previous, outpath):
+    if previous != outpath:
+        shutil.copyfile(previous, outpath)
+
+
+def export(gradebook_path, outpath, state_path, select=None, sort_key=None):
+    """writes the assignment scores table to outpath, returns the number of
+    submissions added, changed or deleted since the previous export
+
+    Parameters
+    ----------
+    gradebook_path
+        nbgrader gradebook.db
+    outpath
+        the tsv to write
+    state_path
+        json file recording the previous export
+    select
+        callable, only assignments whose name it returns True for are
+        exported
+    sort_key
+        orders the assignment columns
+
+    Notes
+    -----
+    If nothing has changed, the previous output is retained, or copied to
+    outpath if that differs.
+    """
+    outpath = pathlib.Path(outpath).absolute()
+    state = load_state(state_path)
+    previous = pathlib.Path(state["output"]) if state else None
+    if previous is None or not previous.exists():
+        state = None
+
+    mtime = gradebook_mtime(gradebook_path)
+    if state and mtime <= state["exported"]:
+        _reuse_previous(previous, outpath)
+        _save_state(state_path, outpath, state["exported"], state["submissions"])
+        return 0
+
+    exported = time.time()
+    conn = GB.connect(gradebook_path)
+    try:
+        current = {}
+        rows = []
+        for row in GB.submissions(conn):
+            if select is None or select(row[1]):
+                current[str(row[0])] = checksum(row)
+                rows.append((row[1], row[2], row[5]))
+
+        stored = state["submissions"] if state else {}
+        changed = {
+            k for k in current.keys() | stored.keys() if current.get(k) != stored.get(k)
+        }
+        if state and not changed:
+            _reuse_previous(previous, outpath)
+        else:
+            data = GB.pivot_scores(rows, GB.student_names(conn), sort_key)
+            write_tsv(data, outpath)
+    finally:
+        conn.close()
+
+    _save_state(state_path, outpath, exported, current)
+    return len(changed)
+
+
+def _save_state(path, outpath, exported, submissions):
+    state = {
+        "output": str(outpath),
+        "exported": exported,
+        "submissions": submissions,
+    }
+    atomic_write_text(path, json.dumps(state))
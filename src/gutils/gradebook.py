@@ -0,0 +1,174 @@
+"""bulk reads of an nbgrader gradebook.db using sql
+
+Accessing scores through the nbgrader ORM issues queries per submission
+(and per student), these functions read the same values in a few
+aggregate queries.
+"""
+import sqlite3
+
+# the score of a grade, as defined by nbgrader.api.Grade.score
+GRADE_SCORE = (
+    "CASE "
+    "WHEN g.manual_score IS NOT NULL THEN g.manual_score + COALESCE(g.extra_credit, 0.0) "
+    "WHEN g.auto_score IS NOT NULL THEN g.auto_score + COALESCE(g.extra_credit, 0.0) "
+    "ELSE 0.0 END"
+)
+
+_SUBMISSIONS = f"""
+SELECT sa.id, a.name, sa.student_id, sa.timestamp, COUNT(g.id),
+    COALESCE(SUM({GRADE_SCORE}), 0.0)
+FROM submitted_assignment AS sa
+JOIN assignment AS a ON a.id = sa.assignment_id
+LEFT JOIN submitted_notebook AS sn ON sn.assignment_id = sa.id
+LEFT JOIN grade AS g ON g.notebook_id = sn.id
+GROUP BY sa.id
+"""
+
+
+def connect(path):
+    """returns a read-only connection to the gradebook at path"""
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+
+def submissions(conn):
+    """returns [(submission id, assignment name, student id, timestamp,
+    number of grades, score), ...] for all submissions"""
+    return conn.execute(_SUBMISSIONS).fetchall()
+
+
+def submission_scores(conn):
+    """returns [(assignment name, student id, score), ...] for all submissions"""
+    return [(a, s, score) for _, a, s, _, _, score in submissions(conn)]
+
+
+def student_names(conn):
+    """returns {student id: 'first last'}"""
+    rows = conn.execute(
+        "SELECT id, COALESCE(first_name, ''), COALESCE(last_name, '') FROM student"
+    )
+    return {sid: f"{first} {last}" for sid, first, last in rows}
+
+
+def orm_submission_scores(path):
+    """returns the same as submission_scores() using the nbgrader ORM"""
+    from nbgrader.api import Gradebook
+
+    with Gradebook(f"sqlite:///{path}") as gb:
+        return [
+            (assignment.name, s.student_id, s.score)
+            for assignment in gb.assignments
+            for s in assignment.submissions
+        ]
+
+
+def pivot_scores(rows, names, sort_key=None):
+    """returns {column: {student id: value}} with a column per assignment
+
+    Parameters
+    ----------
+    rows
+        (assignment name, student id, score) as from submission_scores()
+    names
+        {student id: name}
+    sort_key
+        orders the assignment columns
+
+    Notes
+    -----
+    Only students with a submission are included, missing submissions
+    score 0.0.
+    """
+    scores = {}
+    for assignment, student, score in rows:
+        scores.setdefault(assignment, {})[student] = score
+
+    ids = {s: s for _, s, _ in rows}
+    data = {"anuid": ids, "name": {s: names.get(s, "") for s in ids}}
+    for title in sorted(scores, key=sort_key):
+        by_student = scores[title]
+        data[title] = {s: by_student.get(s, 0.0) for s in ids}
+    return data
+
+
+def assignment_names(conn):
+    """returns assignment names, ordered as nbgrader's Gradebook.assignments"""
+    rows = conn.execute("SELECT name FROM assignment ORDER BY duedate, name")
+    return [name for (name,) in rows]
+
+
+def student_ids(conn):
+    """returns student ids, ordered as nbgrader's Gradebook.students"""
+    rows = conn.execute("SELECT id FROM student ORDER BY last_name, first_name")
+    return [sid for (sid,) in rows]
+
+
+_GRADE_CELLS = """
+SELECT n.name, bc.name
+FROM grade_cells AS gc
+JOIN base_cell AS bc ON bc.id = gc.id
+JOIN notebook AS n ON n.id = bc.notebook_id
+JOIN assignment AS a ON a.id = n.assignment_id
+WHERE a.name = ?
+ORDER BY n.name, bc.name
+"""
+
+_GRADE_JOINS = """
+FROM grade AS g
+JOIN grade_cells AS gc ON gc.id = g.cell_id
+JOIN base_cell AS bc ON bc.id = gc.id
+JOIN submitted_notebook AS sn ON sn.id = g.notebook_id
+JOIN notebook AS n ON n.id = sn.notebook_id
+JOIN submitted_assignment AS sa ON sa.id = sn.assignment_id
+JOIN assignment AS a ON a.id = sa.assignment_id
+"""
+
+_CELL_GRADES = f"""
+SELECT n.name, bc.name, sa.student_id, {GRADE_SCORE}
+{_GRADE_JOINS}
+WHERE a.name = ?
+"""
+
+_LONG_GRADES = f"""
+SELECT sa.student_id, a.name, n.name, bc.name, {GRADE_SCORE}
+{_GRADE_JOINS}
+ORDER BY a.duedate, a.name, n.name, bc.name, sa.student_id
+"""
+
+LONG_COLUMNS = ("student", "assignment", "notebook", "cell", "score")
+
+
+def cell_grades(conn, assignment, students):
+    """returns {notebook: {grade cell: {student id: score}}} for assignment
+
+    Parameters
+    ----------
+    conn
+        sqlite3 connection to the gradebook
+    assignment
+        assignment name
+    students
+        student ids to include, the score is None for students without a
+        grade for a cell
+
+    Notes
+    -----
+    Uses two queries, regardless of the number of students or cells.
+    """
+    result = {}
+    for notebook, cell in conn.execute(_GRADE_CELLS, (assignment,)):
+        result.setdefault(notebook, {})[cell] = dict.fromkeys(students)
+
+    for notebook, cell, student, score in conn.execute(_CELL_GRADES, (assignment,)):
+        scores = result[notebook][cell]
+        if student in scores:
+            scores[student] = score
+    return result
+
+
+def iter_cell_scores(conn):
+    """yields (student, assignment, notebook, cell, score) for every grade
+
+    Rows are read from the database as they are consumed. Unlike
+    cell_grades(), students without a grade for a cell have no row.
+    """
+    yield from conn.execute(_LONG_GRADES)
@@ -1,8 +1,21 @@
 # inserts a markdown cell into nbgrader assignment notebooks
+import glob
+import hashlib
+import itertools
 import json
 import pathlib
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from gutils.backup import atomic_write_text, make_backup
+from gutils.notebook import read_notebook
 
 MARK_COMMENT = "This part worth"
+METADATA_KEY = "gutils"
+
+INJECTED = "injected"
+UNCHANGED = "unchanged"
+UNGRADED = "no graded cells"
 
 
 def remove_previous(source):
@@ -21,37 +34,149 @@ def insert_total(cell, point):
     cell["source"].insert(0, msg)
 
 
-def inject_mark_comments(path):
-    with open(path) as infile:
-        data = json.load(infile)
-
-    total = 0
-    for cell in data["cells"]:
+def get_cell_points(cells):
+    """returns {<cell index>: points} for nbgrader graded cells"""
+    result = {}
+    for index, cell in enumerate(cells):
         try:
-            points = cell["metadata"]["nbgrader"]["points"]
-            total += float(points)
+            result[index] = cell["metadata"]["nbgrader"]["points"]
         except KeyError:
-            points = None
+            pass
+    return result
+
 
-        if points is not None:
-            insert_total(cell, points)
+def points_digest(cell_points):
+    """md5 of the {<cell index>: points} dict"""
+    data = json.dumps(sorted(cell_points.items()))
+    return hashlib.md5(data.encode("utf8")).hexdigest()
 
-    # backup original
-    i = 0
-    while True:
-        new = f"{path}.bak" if not i else f"{path}.bak.{i}"
-        new = pathlib.Path(new)
-        i += 1
-        if not new.exists():
-            break
-    path.rename(new)
 
-    output = json.dumps(data, indent=2)
-    path.write_text(output)
+def inject_mark_comments(path, force=False, keep=None, compress=False):
+    """inserts the points for each graded cell into its source
 
-    print(f"total assignment points = {total}")
+    Parameters
+    ----------
+    path
+        notebook path
+    force
+        inject even if the points are unchanged since the last injection
+    keep
+        maximum number of backups of path to retain, None means all
+    compress
+        gzip compress the backup
 
+    Returns
+    -------
+    total points, status
 
-def main(path):
+    Notes
+    -----
+    The md5 of the cell points is stored in the notebook metadata. If that
+    matches the current points, the notebook is not rewritten.
+    """
     path = pathlib.Path(path)
-    inject_mark_comments(path)
+    # a cheap scan that skips cell outputs, the full notebook is only loaded
+    # if it has graded cells whose points have changed
+    skeleton = read_notebook(path)
+    cell_points = get_cell_points(skeleton["cells"])
+    total = sum(float(p) for p in cell_points.values())
+    if not cell_points:
+        return total, UNGRADED
+
+    digest = points_digest(cell_points)
+    stored = skeleton.get("metadata", {}).get(METADATA_KEY, {}).get("points_md5")
+    if digest == stored and not force:
+        return total, UNCHANGED
+
+    with open(path) as infile:
+        data = json.load(infile)
+
+    for index, points in cell_points.items():
+        insert_total(data["cells"][index], points)
+
+    data.setdefault("metadata", {}).setdefault(METADATA_KEY, {})["points_md5"] = digest
+
+    make_backup(path, keep=keep, compress=compress)
+    atomic_write_text(path, json.dumps(data, indent=2))
+
+    return total, INJECTED
+
+
+def _glob_root(pattern):
+    """returns the leading directories of pattern without glob characters"""
+    parts = pathlib.Path(pattern).parts
+    fixed = list(itertools.takewhile(lambda p: not glob.has_magic(p), parts[:-1]))
+    return pathlib.Path(*fixed) if fixed else pathlib.Path()
+
+
+def _hidden(path, root):
+    """whether path is within a hidden directory below root"""
+    return any(
+        p.startswith(".") and p not in (".", "..")
+        for p in path.relative_to(root).parts[:-1]
+    )
+
+
+def find_notebooks(paths):
+    """returns notebook paths from paths, which can be notebooks, directories
+    (searched recursively) or glob patterns
+
+    Notebooks in hidden directories, such as .ipynb_checkpoints, below a
+    searched directory or the fixed part of a pattern are ignored."""
+    found = []
+    for path in paths:
+        path = str(path)
+        if glob.has_magic(path):
+            root = _glob_root(path)
+            matches = [pathlib.Path(p) for p in sorted(glob.glob(path, recursive=True))]
+        elif pathlib.Path(path).is_dir():
+            root = pathlib.Path(path)
+            matches = sorted(root.rglob("*.ipynb"))
+        else:
+            root = None
+            matches = [pathlib.Path(path)]
+
+        for match in matches:
+            if match.suffix != ".ipynb" or (root and _hidden(match, root)):
+                continue
+            if match not in found:
+                found.append(match)
+    return found
+
+
+def inject_notebooks(paths, jobs=1, force=False, keep=None, compress=False):
+    """injects mark comments into all notebooks, returns {path: (total, status)}"""
+    inject = partial(inject_mark_comments, force=force, keep=keep, compress=compress)
+    if jobs > 1 and len(paths) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(inject, paths))
+    else:
+        results = [inject(path) for path in paths]
+    return dict(zip(paths, results))
+
+
+def display_summary(results):
+    from rich.console import Console
+    from rich.table import Table
+
+    table = Table(title="Assignment points")
+    table.add_column("Notebook")
+    table.add_column("Total points", justify="right")
+    table.add_column("Status")
+    for path, (total, status) in results.items():
+        table.add_row(str(path), f"{total:g}", status)
+    Console().print(table)
+
+
+def main(paths, jobs=1, force=False, keep=None, compress=False):
+    if isinstance(paths, (str, pathlib.Path)):
+        paths = [paths]
+    notebooks = find_notebooks(paths)
+    if not notebooks:
+        print("no notebooks found")
+        return
+
+    results = inject_notebooks(
+        notebooks, jobs=jobs, force=force, keep=keep, compress=compress
+    )
+    display_summary(results)
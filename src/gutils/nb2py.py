@@ -1,43 +1,224 @@
 # convert student notebooks to python scripts
+import io
 import json
 import pathlib
 import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
 from rich.progress import track
 
-_excludes = re.compile(
-    "(Additional checks|ANUID|Enter your code here|This part worth|complete this function)"
+from gutils.notebook import iter_cells
+from gutils.transfer import file_digest
+
+DEFAULT_EXCLUDES = (
+    "Additional checks",
+    "ANUID",
+    "Enter your code here",
+    "This part worth",
+    "complete this function",
 )
 
 
-def get_code_cells(path):
-    path = pathlib.Path(path)
-    with open(path) as infile:
-        data = json.load(infile)
+def read_patterns(path):
+    """returns exclusion patterns from path, one regex per line
+
+    Blank lines and lines starting with '#' are ignored."""
+    lines = pathlib.Path(path).read_text().splitlines()
+    return [l for l in lines if l.strip() and not l.startswith("#")]
+
+
+def make_exclude_filter(patterns=DEFAULT_EXCLUDES):
+    """returns a single compiled alternation of the regex patterns"""
+    patterns = list(patterns)
+    if not patterns:
+        # matches nothing
+        return re.compile(r"(?!)")
+    return re.compile("|".join(f"(?:{p})" for p in patterns))
+
 
-    result = []
-    for cell in data["cells"]:
+_excludes = make_exclude_filter()
+
+
+def write_code_cells(cells, out, excludes=_excludes, per_cell=False):
+    """writes code from cells to the file-like out
+
+    Parameters
+    ----------
+    cells
+        series of notebook cell dicts
+    out
+        object with a write method
+    excludes
+        compiled regex, lines matching this are excluded
+    per_cell
+        if True, an entire cell is excluded if any line matches excludes
+    """
+    search = excludes.search
+    for cell in cells:
         if cell["cell_type"] == "markdown" or cell.get("metadata", {}).get(
             "nbgrader", {}
         ).get("grade"):
             continue
-        code = "\n".join(l.rstrip() for l in cell["source"] if not _excludes.search(l))
-        if code:
-            result.extend([code, "\n", "\n"])
 
-    return "".join(result)
+        source = cell["source"]
+        if per_cell and any(search(l) for l in source):
+            continue
+
+        num_lines = 0
+        kept = ""
+        for line in source:
+            if not per_cell and search(line):
+                continue
+            kept = line.rstrip()
+            if num_lines:
+                out.write("\n")
+            out.write(kept)
+            num_lines += 1
 
+        # a cell consisting of a single blank line is treated as empty
+        if num_lines > 1 or num_lines == 1 and kept:
+            out.write("\n\n")
+
+
+def get_code_cells(path, excludes=_excludes, per_cell=False):
+    buffer = io.StringIO()
+    write_code_cells(iter_cells(path), buffer, excludes=excludes, per_cell=per_cell)
+    return buffer.getvalue()
+
+
+def manifest_path(indir, assignment_name):
+    """path of the json manifest recording converted notebooks"""
+    return pathlib.Path(indir) / f".nb2py-{assignment_name}.json"
+
+
+def load_manifest(path, settings=None):
+    """returns {<relative notebook path>: {"mtime", "size", "md5"}}
+
+    If the settings used for the previous conversion differ from settings,
+    an empty dict is returned."""
+    path = pathlib.Path(path)
+    if not path.exists():
+        return {}
+    try:
+        data = json.loads(path.read_text())
+    except ValueError:
+        # a corrupt manifest just means everything gets converted
+        return {}
+    if data.get("settings") != settings:
+        return {}
+    return data.get("notebooks", {})
+
+
+def write_manifest(path, manifest, settings=None):
+    path = pathlib.Path(path)
+    tmp = path.with_name(f"{path.name}.tmp")
+    data = {"settings": settings, "notebooks": manifest}
+    tmp.write_text(json.dumps(data, indent=1, sort_keys=True))
+    tmp.replace(path)
 
-def make_scripts(indir, assignment_name):
+
+def _stat_record(path):
+    stat = path.stat()
+    return {"mtime": stat.st_mtime, "size": stat.st_size}
+
+
+def needs_conversion(path, record):
+    """returns (needed, current record) for notebook path
+
+    The md5 is only computed when the size or mtime differ from record."""
+    current = _stat_record(path)
+    outpath = path.parent / f"{path.stem}.py"
+    if not record or not outpath.exists():
+        return True, current
+
+    if record["mtime"] == current["mtime"] and record["size"] == current["size"]:
+        current["md5"] = record.get("md5")
+        return False, current
+
+    current["md5"] = file_digest(path)
+    return current["md5"] != record.get("md5"), current
+
+
+def convert_notebook(path, excludes=_excludes, per_cell=False):
+    """writes the code cells of notebook path to <path.stem>.py, returns the md5
+    of the notebook"""
+    path = pathlib.Path(path)
+    outpath = path.parent / f"{path.stem}.py"
+    with open(outpath, "w") as out:
+        write_code_cells(iter_cells(path), out, excludes=excludes, per_cell=per_cell)
+    return file_digest(path)
+
+
+def get_student_notebooks(indir, assignment_name):
+    """returns paths to student notebooks for assignment_name"""
     indir = pathlib.Path(indir)
     # get all student dirs
-    paths = list(indir.glob(f"*/{assignment_name}/*ipynb"))
+    paths = indir.glob(f"*/{assignment_name}/*ipynb")
     student_file = re.compile(r"(assignment|quiz)\S+ipynb")
-    for path in track(paths):
-        if assignment_name not in path.parts:
-            continue
-        if not student_file.search(path.name):
-            continue
-        code = get_code_cells(path)
-        outpath = path.parent / f"{path.stem}.py"
-        outpath.write_text(code)
+    return [
+        path
+        for path in paths
+        if assignment_name in path.parts and student_file.search(path.name)
+    ]
+
+
+def make_scripts(
+    indir,
+    assignment_name,
+    jobs=1,
+    force=False,
+    excludes=DEFAULT_EXCLUDES,
+    per_cell=False,
+):
+    """converts student notebooks to python scripts
+
+    Parameters
+    ----------
+    indir
+        the nbgrader submitted directory
+    assignment_name
+        name of the assignment
+    jobs
+        number of worker processes, conversion is serial if jobs <= 1
+    force
+        convert all notebooks, ignoring the manifest of previous conversions
+    excludes
+        series of regex patterns, code lines matching any of these are excluded
+    per_cell
+        if True, an entire cell is excluded if any of its lines match
+
+    Notes
+    -----
+    A manifest of converted notebooks is written to indir. A notebook is only
+    converted if it's new, has changed since last conversion, or the .py is
+    missing. Changing excludes or per_cell causes all notebooks to be
+    converted.
+    """
+    indir = pathlib.Path(indir)
+    excludes = make_exclude_filter(excludes)
+    settings = {"excludes": excludes.pattern, "per_cell": per_cell}
+    mpath = manifest_path(indir, assignment_name)
+    previous = {} if force else load_manifest(mpath, settings)
+    manifest = {}
+    todo = []
+    for path in get_student_notebooks(indir, assignment_name):
+        key = str(path.relative_to(indir))
+        needed, record = needs_conversion(path, previous.get(key))
+        manifest[key] = record
+        if needed:
+            todo.append(path)
+
+    convert = partial(convert_notebook, excludes=excludes, per_cell=per_cell)
+    if jobs > 1 and len(todo) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            digests = executor.map(convert, todo, chunksize=4)
+            digests = list(track(digests, total=len(todo)))
+    else:
+        digests = [convert(path) for path in track(todo)]
+
+    for path, digest in zip(todo, digests):
+        manifest[str(path.relative_to(indir))]["md5"] = digest
+
+    write_manifest(mpath, manifest, settings)
+    return todo
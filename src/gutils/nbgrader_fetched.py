@@ -1,7 +1,9 @@
-import json
+import os
 import pathlib
 import re
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 
 def get_courseid():
@@ -15,93 +17,414 @@ def get_courseid():
 
 
 USER_ROOT = pathlib.Path("/home2")
-COURSEID = get_courseid()
-EXHCHANGE_OUTBOUND = pathlib.Path(f"/home/srv/nbgrader/exchange/{COURSEID}/outbound/")
 LOGPATH = pathlib.Path("/home/srv/nbgrader/nbgrader_fetched.json")
+INDEXPATH = pathlib.Path("/home/srv/nbgrader/nbgrader_fetched_index.json")
+# set on first use, so importing does not require a hostname lookup
+COURSEID = None
+EXHCHANGE_OUTBOUND = None
+
+
+def courseid():
+    """returns COURSEID, determining it from the hostname if not set"""
+    global COURSEID
+    if COURSEID is None:
+        COURSEID = get_courseid()
+    return COURSEID
+
+
+def outbound_dir():
+    """returns the nbgrader exchange directory of released assignments"""
+    global EXHCHANGE_OUTBOUND
+    if EXHCHANGE_OUTBOUND is None:
+        EXHCHANGE_OUTBOUND = pathlib.Path(
+            f"/home/srv/nbgrader/exchange/{courseid()}/outbound/"
+        )
+    return EXHCHANGE_OUTBOUND
 
 
 def get_student_homes():
     """returns all student home directories"""
-    pattern = re.compile("u\d+$")
-    student_homes = []
-    for dn in USER_ROOT.glob("u*"):
-        if pattern.search(str(dn)):
-            student_homes.append(dn)
-    return student_homes
+    pattern = re.compile(r"u\d+$")
+    with os.scandir(USER_ROOT) as entries:
+        return [USER_ROOT / e.name for e in entries if pattern.match(e.name)]
 
 
 def get_released_assignments():
     """returns the list of released assignments"""
-    assignments = []
-    for dn in EXHCHANGE_OUTBOUND.glob("*"):
-        if dn.is_dir():
-            assignments.append(dn.name)
-    return assignments
+    with os.scandir(outbound_dir()) as entries:
+        return [e.name for e in entries if e.is_dir()]
+
+
+def scan_home(home, assignments):
+    """returns {<assignment>: fetched time} for assignments in home
+
+    The course directory is listed once, only entries in assignments are
+    stat'ed."""
+    found = {}
+    try:
+        entries = os.scandir(home / courseid())
+    except (FileNotFoundError, NotADirectoryError, PermissionError):
+        return found
+
+    with entries:
+        for entry in entries:
+            if entry.name not in assignments:
+                continue
+            try:
+                found[entry.name] = time.ctime(entry.stat().st_mtime)
+            except OSError:
+                # e.g. removed since listed, the other entries are recorded
+                continue
+    return found
 
 
-def get_student_fetched_times(stored):
-    """returns a dict of {<assignment>: {<student>: created time}, adds new records to stored"""
-    student_homes = get_student_homes()
-    assignments = set(get_released_assignments())
+def scan_homes(student_homes, assignments, stored, max_workers=16):
+    """adds records for assignments fetched by student_homes to stored
+
+    Homes are scanned concurrently by at most max_workers threads. Returns
+    the new (assignment, student, time) records."""
     for assignment in assignments:
         if assignment not in stored:
             stored[assignment] = {}
 
-        for home in student_homes:
-            if home.name in stored[assignment]:
-                continue
+    # only scan homes with assignments not already recorded
+    pending = {}
+    for home in student_homes:
+        missing = {a for a in assignments if home.name not in stored[a]}
+        if missing:
+            pending[home] = missing
 
-            expected_path = home / COURSEID / assignment
-            if not expected_path.exists():
-                continue
+    records = []
+    with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as executor:
+        results = executor.map(lambda h: scan_home(h, pending[h]), pending)
+        for home, found in zip(pending, results):
+            for assignment, t in found.items():
+                stored[assignment][home.name] = t
+                records.append((assignment, home.name, t))
+    return records
+
+
+def load_index():
+    """returns the cached index of student homes and released assignments
+
+    The index has keys
+    homes: {"mtime": <mtime of USER_ROOT>, "names": [<home name>, ...]}
+    assignments: {"mtime": <mtime of outbound dir>, "names": [...]}
+    finished: assignments fetched by all homes
+    closed: assignments no longer being recorded
+    """
+    import json
 
-            t = time.ctime(expected_path.stat().st_mtime)
-            stored[assignment][home.name] = t
+    index = json.loads(INDEXPATH.read_text()) if INDEXPATH.exists() else {}
+    for key in ("finished", "closed"):
+        index.setdefault(key, [])
+    return index
 
+
+def write_index(index):
+    import json
+
+    from gutils.backup import atomic_write_text
+
+    atomic_write_text(INDEXPATH, json.dumps(index))
+
+
+def _cached_listing(index, key, dirpath, lister):
+    """returns names from lister(), reusing those in index[key] if the mtime
+    of dirpath is unchanged"""
+    mtime = dirpath.stat().st_mtime
+    cached = index.get(key)
+    if cached and cached["mtime"] == mtime:
+        return cached["names"], False
+    names = lister()
+    index[key] = {"mtime": mtime, "names": names}
+    return names, True
+
+
+def get_student_fetched_times(stored, max_workers=16, index=None):
+    """returns a dict of {<assignment>: {<student>: created time}, adds new records to stored
+
+    Homes are scanned concurrently by at most max_workers threads.
+
+    If index (see load_index()) is provided, the student homes and released
+    assignments are only listed if their directory mtime has changed, and
+    finished or closed assignments are not scanned. index is updated.
+    """
+    if index is None:
+        student_homes = get_student_homes()
+        assignments = set(get_released_assignments())
+        scan_homes(student_homes, assignments, stored, max_workers=max_workers)
+        return stored
+
+    names, changed = _cached_listing(
+        index,
+        "homes",
+        USER_ROOT,
+        lambda: [h.name for h in get_student_homes()],
+    )
+    if changed:
+        # new students may not have fetched the finished assignments
+        index["finished"] = []
+    student_homes = [USER_ROOT / n for n in names]
+    released, _ = _cached_listing(
+        index, "assignments", outbound_dir(), get_released_assignments
+    )
+    names = set(names)
+    # finished is only trusted if stored, which may be from a different or
+    # reset log, has a record for every home
+    finished = {a for a in index["finished"] if names <= stored.get(a, {}).keys()}
+    assignments = set(released) - finished - set(index["closed"])
+    scan_homes(student_homes, assignments, stored, max_workers=max_workers)
+
+    finished |= {a for a in assignments if names <= stored[a].keys()}
+    index["finished"] = sorted(finished)
     return stored
 
 
+def get_log(backend="json"):
+    """returns the fetch log storage backend
+
+    Parameters
+    ----------
+    backend
+        'json' is a single json file rewritten in full, 'jsonl' an
+        append-only journal, 'sqlite' an indexed sqlite database
+    """
+    from gutils.fetch_log import BACKENDS
+
+    suffix = {"json": ".json", "jsonl": ".jsonl", "sqlite": ".sqlite"}[backend]
+    return BACKENDS[backend](LOGPATH.with_suffix(suffix))
+
+
 def load_log():
     """loads the existing log data"""
-    data = json.loads(LOGPATH.read_text()) if LOGPATH.exists() else {}
-    return data
+    return get_log("json").load()
 
 
 def write_log(data):
-    """loads the existing log data"""
-    if LOGPATH.exists():
-        bk = pathlib.Path(f"{LOGPATH}.bak")
-        LOGPATH.rename(bk)
-    else:
-        bk = None
+    """writes the log data"""
+    get_log("json").write(data)
+
+
+def new_records(previous, current):
+    """returns [(assignment, student, time), ...] in current but not previous"""
+    records = []
+    for assignment, students in current.items():
+        seen = previous.get(assignment, ())
+        records.extend(
+            (assignment, student, t)
+            for student, t in students.items()
+            if student not in seen
+        )
+    return records
+
 
-    log = json.dumps(data)
-    LOGPATH.write_text(log)
-    if bk:
-        # safely remove the backup
-        bk.unlink()
+def close_assignments(names):
+    """marks assignments as closed, they will no longer be scanned"""
+    index = load_index()
+    index["closed"] = sorted(set(index["closed"]) | set(names))
+    write_index(index)
 
 
-def main():
+def main(max_workers=16, verbose=False, backend="json", use_index=True):
     if not USER_ROOT.exists():
         print("Expected dir /home2, which doesn't exist. Exiting")
         exit(1)
 
-    currlog = load_log()
-    mods = get_student_fetched_times(currlog)
-    write_log(mods)
+    log = get_log(backend)
+    start = time.perf_counter()
+    currlog = log.load()
+    index = load_index() if use_index else None
+    previous = {a: set(v) for a, v in currlog.items()}
+    loaded = time.perf_counter()
+    mods = get_student_fetched_times(currlog, max_workers=max_workers, index=index)
+    records = new_records(previous, mods)
+    scanned = time.perf_counter()
+    log.add(records)
+    if index is not None:
+        write_index(index)
+    written = time.perf_counter()
+    if verbose:
+        print(
+            f"{len(records)} new records; "
+            f"load {loaded - start:.3f}s, scan {scanned - loaded:.3f}s, "
+            f"write {written - scanned:.3f}s"
+        )
 
 
-def check_student(student_id):
+def check_student(student_id, backend="json"):
     from cogent3 import make_table
 
-    currlog = load_log()
+    log = get_log(backend)
+    fetched = log.student(student_id)
     columns = ["Assignment", "Time Seen"]
     result = {c: [] for c in columns}
-    for assignment in currlog:
-        time = currlog[assignment].get(student_id, "None")
+    for assignment in log.assignments():
+        time = fetched.get(assignment, "None")
         result["Assignment"].append(assignment)
         result["Time Seen"].append(time)
 
     table = make_table(columns, data=result, title=f"Fetch times for {student_id}")
     print(table)
+
+
+class FetchWatcher:
+    """records fetches as they are notified, flushing them to log in batches
+
+    Parameters
+    ----------
+    log
+        a fetch log backend
+    max_workers
+        max concurrent home directory scans
+    """
+
+    def __init__(self, log, max_workers=16):
+        self.log = log
+        self.max_workers = max_workers
+        self.stored = log.load()
+        self.assignments = set()
+        self.observer = None
+        self._dirty = set()
+        self._refresh = True
+        self._lock = threading.Lock()
+
+    def rescan(self):
+        """scans all homes, returns the new records"""
+        self.assignments = set(get_released_assignments())
+        homes = get_student_homes()
+        records = scan_homes(
+            homes, self.assignments, self.stored, max_workers=self.max_workers
+        )
+        self.log.add(records)
+        return records
+
+    def notify(self, path):
+        """handles the creation of path"""
+        path = pathlib.Path(path)
+        course = courseid()
+        if path.parent == outbound_dir():
+            with self._lock:
+                self._refresh = True
+            return
+
+        if path.parent == USER_ROOT:
+            home = path
+        elif path.parent.parent == USER_ROOT and path.name == course:
+            home = path.parent
+        elif path.parent.name == course and path.parent.parent.parent == USER_ROOT:
+            home = path.parent.parent
+        else:
+            return
+
+        with self._lock:
+            self._dirty.add(home)
+
+        if self.observer is None:
+            return
+        if path == home:
+            self._watch_home(home)
+        elif path.name == course:
+            self._schedule(path)
+
+    def flush(self):
+        """scans homes notified since the last flush, returns the new records"""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            refresh, self._refresh = self._refresh, False
+
+        if refresh:
+            self.assignments = set(get_released_assignments())
+        if not dirty:
+            return []
+        records = scan_homes(
+            dirty, self.assignments, self.stored, max_workers=self.max_workers
+        )
+        self.log.add(records)
+        return records
+
+    def _schedule(self, path):
+        if path.is_dir():
+            self.observer.schedule(self._handler, str(path), recursive=False)
+
+    def _watch_home(self, home):
+        self._schedule(home)
+        self._schedule(home / courseid())
+
+    def start(self):
+        """starts filesystem notification, requires watchdog"""
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+
+        watcher = self
+
+        class _Handler(FileSystemEventHandler):
+            def on_created(self, event):
+                watcher.notify(event.src_path)
+
+            def on_moved(self, event):
+                watcher.notify(event.dest_path)
+
+        self._handler = _Handler()
+        self.observer = Observer()
+        self._schedule(USER_ROOT)
+        self._schedule(outbound_dir())
+        for home in get_student_homes():
+            self._watch_home(home)
+        self.observer.start()
+
+    def stop(self):
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+            self.observer = None
+
+
+def watch(
+    backend="json", flush_interval=10, poll_interval=300, max_workers=16, poll=False
+):
+    """continuously records assignment fetches
+
+    Parameters
+    ----------
+    backend
+        fetch log storage backend
+    flush_interval
+        seconds between writing notified fetches to the log
+    poll_interval
+        seconds between full rescans, when polling
+    max_workers
+        max concurrent home directory scans
+    poll
+        poll instead of using filesystem notifications. Notifications
+        do not work on NFS mounts and require the watchdog package.
+    """
+    if not USER_ROOT.exists():
+        print("Expected dir /home2, which doesn't exist. Exiting")
+        exit(1)
+
+    watcher = FetchWatcher(get_log(backend), max_workers=max_workers)
+    if not poll:
+        try:
+            watcher.start()
+        except ImportError:
+            print("watchdog is not installed, polling instead")
+            poll = True
+
+    # catch up on anything fetched while we were not running
+    print(f"{len(watcher.rescan())} new records")
+    try:
+        while True:
+            if poll:
+                time.sleep(poll_interval)
+                records = watcher.rescan()
+            else:
+                time.sleep(flush_interval)
+                records = watcher.flush()
+            if records:
+                print(f"{time.ctime()}: {len(records)} new records")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.stop()
+        watcher.flush()
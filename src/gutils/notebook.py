@@ -0,0 +1,194 @@
+"""iterative reading of notebook cells that skips output payloads
+
+Student notebooks frequently contain large base64 encoded images or plotly
+figures in cell outputs. Decoding these with json.load is the dominant cost
+when all we want is the cell type, metadata and source. The functions here
+memory map the notebook and scan the JSON bytes, only decoding the values that
+are needed. Skipped values are stepped over without being decoded.
+"""
+import json
+import mmap
+import pathlib
+import re
+
+SKIP_CELL_KEYS = frozenset(("outputs", "attachments"))
+
+_WHITESPACE = re.compile(rb"[ \t\n\r]*")
+_BRACKET = re.compile(rb"[\[\]{}]")
+_BACKSLASH = ord("\\")
+_SCALAR = re.compile(rb"[^,\]}\s]+")
+
+
+class _Scanner:
+    """minimal cursor over the bytes of a JSON document"""
+
+    def __init__(self, buf):
+        self.buf = buf
+        self.pos = 0
+
+    def _error(self, msg):
+        return json.JSONDecodeError(
+            msg, self.buf[: self.pos].decode("utf8", "replace"), self.pos
+        )
+
+    def peek(self):
+        self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+        return self.buf[self.pos : self.pos + 1]
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise self._error(f"expected {char!r}")
+        self.pos += 1
+
+    def string(self):
+        if self.peek() != b'"':
+            raise self._error("expected a string")
+        start = self.pos
+        self._skip_string()
+        return json.loads(self.buf[start : self.pos])
+
+    def _skip_string(self):
+        # bytes.find is far quicker than a regex over long base64 strings
+        pos = self.pos + 1
+        while True:
+            end = self.buf.find(b'"', pos)
+            if end == -1:
+                raise self._error("unterminated string")
+            escapes = 0
+            while self.buf[end - 1 - escapes] == _BACKSLASH:
+                escapes += 1
+            if escapes % 2 == 0:
+                break
+            pos = end + 1
+        self.pos = end + 1
+
+    def _skip_container(self):
+        # brackets are counted in the segments between strings, segments
+        # are only inspected character by character if the container
+        # could close within them
+        depth = 0
+        while True:
+            quote = self.buf.find(b'"', self.pos)
+            if quote == -1:
+                quote = len(self.buf)
+            segment = self.buf[self.pos : quote]
+            closes = segment.count(b"]") + segment.count(b"}")
+            if closes >= depth:
+                for match in _BRACKET.finditer(segment):
+                    depth += 1 if match.group() in b"[{" else -1
+                    if depth == 0:
+                        self.pos += match.end()
+                        return
+            else:
+                depth += segment.count(b"[") + segment.count(b"{") - closes
+
+            if quote == len(self.buf):
+                raise self._error("unterminated container")
+            self.pos = quote
+            self._skip_string()
+
+    def skip_value(self):
+        """advances past the next value without decoding it"""
+        char = self.peek()
+        if char == b'"':
+            self._skip_string()
+        elif char in (b"[", b"{"):
+            self._skip_container()
+        else:
+            match = _SCALAR.match(self.buf, self.pos)
+            if match is None:
+                raise self._error("expected a value")
+            self.pos = match.end()
+
+    def value(self):
+        """decodes and returns the next value"""
+        start = _WHITESPACE.match(self.buf, self.pos).end()
+        self.skip_value()
+        return json.loads(self.buf[start : self.pos])
+
+    def members(self):
+        """yields the keys of an object, the cursor is left at each value"""
+        self.expect(b"{")
+        if self.peek() == b"}":
+            self.pos += 1
+            return
+        while True:
+            key = self.string()
+            self.expect(b":")
+            yield key
+            char = self.peek()
+            self.pos += 1
+            if char == b"}":
+                return
+            if char != b",":
+                self.pos -= 1
+                raise self._error("expected ',' or '}'")
+
+    def items(self):
+        """yields once per array element, the cursor is left at each element"""
+        self.expect(b"[")
+        if self.peek() == b"]":
+            self.pos += 1
+            return
+        while True:
+            yield
+            char = self.peek()
+            self.pos += 1
+            if char == b"]":
+                return
+            if char != b",":
+                self.pos -= 1
+                raise self._error("expected ',' or ']'")
+
+
+def _read_cell(scanner, skip):
+    cell = {}
+    for key in scanner.members():
+        if key in skip:
+            scanner.skip_value()
+        else:
+            cell[key] = scanner.value()
+    return cell
+
+
+def _iter_notebook(path, skip, cells_only):
+    """yields (key, value) for top-level notebook members, with key "cell" for
+    each element of the notebook cells"""
+    with open(path, "rb") as infile:
+        try:
+            buf = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # can't mmap an empty file
+            raise json.JSONDecodeError("empty notebook", "", 0)
+
+    try:
+        scanner = _Scanner(buf)
+        for key in scanner.members():
+            if key == "cells":
+                for _ in scanner.items():
+                    yield "cell", _read_cell(scanner, skip)
+            elif cells_only:
+                scanner.skip_value()
+            else:
+                yield key, scanner.value()
+    finally:
+        buf.close()
+
+
+def iter_cells(path, skip=SKIP_CELL_KEYS):
+    """yields notebook cells as dicts, excluding the keys in skip"""
+    path = pathlib.Path(path)
+    for _, cell in _iter_notebook(path, frozenset(skip), True):
+        yield cell
+
+
+def read_notebook(path, skip=SKIP_CELL_KEYS):
+    """returns the notebook as a dict, cells exclude the keys in skip"""
+    path = pathlib.Path(path)
+    data = {"cells": []}
+    for key, value in _iter_notebook(path, frozenset(skip), False):
+        if key == "cell":
+            data["cells"].append(value)
+        else:
+            data[key] = value
+    return data
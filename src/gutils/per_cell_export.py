@@ -2,53 +2,62 @@
 """Export grades for each cell to json"""
 
 import json
+import pathlib
 import sys
 
-from nbgrader.api import MissingEntry
 from nbgrader.plugins import ExportPlugin
+from traitlets import Bool
+
+from gutils import columnar
+from gutils import gradebook as GB
 
 
 class PerCellExporter(ExportPlugin):
     """
     Export plugin for nbgrader which ouputs per-cell grades to a json formatted file.
+
+    If the --to file ends with .csv, .tsv, .parquet or .feather the grades
+    are instead written as one (student, assignment, notebook, cell, score)
+    row per grade.
     """
 
+    stream = Bool(
+        False,
+        help="write each assignment as it is read, uses less memory for large "
+        "gradebooks but the json is not indented",
+    ).tag(config=True)
+
     def export(self, gradebook):
-        grades = {}
-
-        # It's awful, but I think this nested for loop is the only way to proceed
-        for assignment in gradebook.assignments:
-            grades[assignment.name] = {}
-
-            for notebook in assignment.notebooks:
-                grades[assignment.name][notebook.name] = {}
-
-                for grade_cell in notebook.grade_cells:
-                    grades[assignment.name][notebook.name][grade_cell.name] = {}
-
-                    for student in gradebook.students:
-                        try:
-                            grade = gradebook.find_grade(
-                                grade_cell.name,
-                                notebook.name,
-                                assignment.name,
-                                student.id,
-                            )
-                            grades[assignment.name][notebook.name][grade_cell.name][
-                                student.id
-                            ] = grade.score
-                        except MissingEntry:
-                            grades[assignment.name][notebook.name][grade_cell.name][
-                                student.id
-                            ] = None
+        # the grades of each assignment are read in one joined query, rather
+        # than a query per (grade cell, student)
+        conn = gradebook.db.connection().connection.dbapi_connection
 
         if self.to:
             out_file = self.to
         else:
             out_file = "grades.json"
 
+        if pathlib.Path(out_file).suffix.lower() in columnar.FORMATS:
+            rows = GB.iter_cell_scores(conn)
+            columnar.write_rows(rows, out_file, GB.LONG_COLUMNS)
+            return
+
+        students = GB.student_ids(conn)
+        assignments = GB.assignment_names(conn)
+
         with open(out_file, "w") as f:
-            json.dump(grades, f, indent=4)
+            if not self.stream:
+                grades = {a: GB.cell_grades(conn, a, students) for a in assignments}
+                json.dump(grades, f, indent=4)
+                return
+
+            # one assignment per line
+            f.write("{")
+            for i, assignment in enumerate(assignments):
+                grades = GB.cell_grades(conn, assignment, students)
+                f.write(f"{',' if i else ''}\n{json.dumps(assignment)}: ")
+                json.dump(grades, f)
+            f.write("\n}\n")
 
 
 def main():
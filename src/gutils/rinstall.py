@@ -5,11 +5,43 @@ import sys
 from pathlib import Path
 
 import click
-import tqdm
+
+
+CRAN_REPO = "http://cran.rstudio.com/"
+
+
+def repo_url(repo):
+    """returns a URL for R's repos argument
+
+    A local directory, or file: URL, must be a CRAN-like repository, i.e.
+    contain src/contrib/PACKAGES as created by fill_cran_cache()."""
+    if repo is None:
+        return CRAN_REPO
+    if repo.startswith("file:"):
+        path = Path(repo[len("file:") :].lstrip("/"))
+        path = Path("/") / path
+    elif "://" in repo:
+        return repo
+    else:
+        path = Path(repo).expanduser().absolute()
+
+    index = path / "src" / "contrib" / "PACKAGES"
+    if not index.exists():
+        raise ValueError(f"'{path}' is not a local CRAN repository, no '{index}'")
+    return path.as_uri()
+
+
+def _r_vector(names):
+    names = ", ".join(f"'{n}'" for n in names)
+    return f"c({names})"
 
 
 def install_r_package(
-    cmnd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, command_prefix="R --quiet -e"
+    cmnd,
+    stdout=subprocess.PIPE,
+    stderr=subprocess.PIPE,
+    command_prefix="R --quiet -e",
+    exit_on_fail=True,
 ):
     # we're calling R to do this...
     command = f'{command_prefix} "{cmnd}"'.strip()
@@ -18,7 +50,9 @@ def install_r_package(
     if proc.returncode != 0:
         msg = err
         sys.stderr.writelines(f"FAILED: {command}\n\n{msg}\n")
-        sys.exit(proc.returncode)
+        if exit_on_fail:
+            sys.exit(proc.returncode)
+        return None
 
     if out is not None:
         r = out.decode("utf8")
@@ -27,12 +61,96 @@ def install_r_package(
     return r
 
 
-def install_r_packages(packages):
+def install_r_packages(packages, repos=CRAN_REPO):
+    import tqdm
+
     for pack in tqdm.tqdm(packages):
-        cmnd = f"if (! '{pack}' %in% installed.packages()[,'Package']) install.packages('{pack}', repos='http://cran.rstudio.com/')"
+        cmnd = f"if (! '{pack}' %in% installed.packages()[,'Package']) install.packages('{pack}', repos='{repos}')"
         install_r_package(cmnd)
 
 
+def get_installed_r_packages():
+    """returns the set of installed R package names, from a single R session"""
+    cmnd = "cat(rownames(installed.packages()), sep='\\n')"
+    out = install_r_package(cmnd, command_prefix="Rscript -e")
+    return set(out.split())
+
+
+def install_missing_r_packages(packages, ncpus=1, repos=CRAN_REPO):
+    """installs packages that are not already installed in a single R session
+
+    Parameters
+    ----------
+    packages
+        names of CRAN packages
+    ncpus
+        number of parallel package builds (the Ncpus argument of
+        install.packages)
+    repos
+        URL of the CRAN repository, see repo_url()
+
+    Returns
+    -------
+    the already installed, newly installed and failed package names
+
+    Notes
+    -----
+    install.packages orders the installation by dependency and continues
+    past failures, the failures are identified by checking the installed
+    packages afterwards.
+    """
+    packages = [p for p in dict.fromkeys(packages) if p]
+    installed = get_installed_r_packages()
+    present = [p for p in packages if p in installed]
+    missing = [p for p in packages if p not in installed]
+    if not missing:
+        return present, [], []
+
+    names = _r_vector(missing)
+    cmnd = f"install.packages({names}, repos='{repos}', Ncpus={ncpus})"
+    # R's output is displayed as it happens
+    install_r_package(cmnd, stdout=None, stderr=None, exit_on_fail=False)
+    installed = get_installed_r_packages()
+    failed = [p for p in missing if p not in installed]
+    new = [p for p in missing if p in installed]
+    return present, new, failed
+
+
+def fill_cran_cache(packages, cache_dir, repos=CRAN_REPO):
+    """downloads source tarballs of packages, and their dependencies, into the
+    local CRAN-like repository cache_dir
+
+    Tarballs already in the cache are not downloaded again. The PACKAGES
+    index is rewritten so the cache can be used with repo_url(cache_dir)."""
+    packages = [p for p in dict.fromkeys(packages) if p]
+    contrib = Path(cache_dir).expanduser().absolute() / "src" / "contrib"
+    contrib.mkdir(parents=True, exist_ok=True)
+    cmnd = "; ".join(
+        [
+            f"db <- available.packages(repos='{repos}', type='source')",
+            f"pkgs <- {_r_vector(packages)}",
+            "deps <- tools::package_dependencies(pkgs, db=db, "
+            "which=c('Depends', 'Imports', 'LinkingTo'), recursive=TRUE)",
+            # base packages are not in db
+            "pkgs <- intersect(unique(c(pkgs, unlist(deps))), rownames(db))",
+            f"have <- sub('_.*', '', list.files('{contrib}', pattern='[.]tar[.]gz'))",
+            "pkgs <- setdiff(pkgs, have)",
+            f"if (length(pkgs)) download.packages(pkgs, destdir='{contrib}', "
+            f"repos='{repos}', type='source')",
+            f"tools::write_PACKAGES('{contrib}', type='source')",
+        ]
+    )
+    install_r_package(cmnd, stdout=None, stderr=None, command_prefix="Rscript -e")
+    return contrib.parent.parent
+
+
+def display_install_summary(present, new, failed):
+    click.secho(f"{len(present)} packages already installed", fg="blue")
+    click.secho(f"{len(new)} packages installed", fg="green")
+    if failed:
+        click.secho(f"{len(failed)} packages FAILED: {', '.join(failed)}", fg="red")
+
+
 def rkernel():
     """installs the R kernel for Jupyter"""
     r_kernel_dependencies = [
@@ -61,13 +179,38 @@ def rkernel():
     click.secho("\n\nDone!")
 
 
-def cran(package_file):
-    """installs CRAN packages"""
+def cran(package_file, ncpus=None, repo=None):
+    """installs CRAN packages
+
+    If ncpus is provided, all missing packages are installed in one R
+    session using ncpus parallel builds, failures do not stop the install
+    and are reported at the end. repo is a CRAN URL or a local repository
+    directory, defaults to CRAN_REPO."""
     cran_packages = [l.strip() for l in Path(package_file).read_text().splitlines()]
-    click.secho("Install packages", fg="blue")
-    install_r_packages(cran_packages)
+    repos = repo_url(repo)
+    click.secho(f"Install packages from {repos}", fg="blue")
+    if ncpus is None:
+        install_r_packages(cran_packages, repos=repos)
+        click.secho("\n\nDone!")
+        return
+
+    present, new, failed = install_missing_r_packages(
+        cran_packages, ncpus=ncpus, repos=repos
+    )
+    display_install_summary(present, new, failed)
+    if failed:
+        sys.exit(1)
     click.secho("\n\nDone!")
 
 
+def cran_cache(package_file, cache_dir, repo=None):
+    """downloads CRAN packages, and their dependencies, to a local repository"""
+    cran_packages = [l.strip() for l in Path(package_file).read_text().splitlines()]
+    repos = CRAN_REPO if repo is None else repo
+    click.secho(f"Caching packages from {repos}", fg="blue")
+    path = fill_cran_cache(cran_packages, cache_dir, repos=repos)
+    click.secho(f"\n\nDone! Install from it with: gutils cran --repo {path}")
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,170 @@
+"""moving files, including across filesystems, with progress reporting"""
+import hashlib
+import os
+import pathlib
+from concurrent.futures import ThreadPoolExecutor
+
+CHUNK_SIZE = 2**23  # 8MB
+
+
+def same_device(src, dest_dir):
+    """True if src and the directory dest_dir are on the same filesystem"""
+    return os.stat(src).st_dev == os.stat(dest_dir).st_dev
+
+
+def _copy_range(infile, outfile, size, progress):
+    """copies using the fastest available kernel-side copy"""
+    copy_range = getattr(os, "copy_file_range", None)
+    copied = 0
+    while copied < size:
+        num = min(CHUNK_SIZE, size - copied)
+        if copy_range is not None:
+            try:
+                sent = copy_range(infile.fileno(), outfile.fileno(), num)
+            except OSError:
+                # not supported across these filesystems
+                copy_range = None
+                continue
+        else:
+            try:
+                sent = os.sendfile(outfile.fileno(), infile.fileno(), None, num)
+            except (AttributeError, OSError):
+                sent = outfile.write(infile.read(num))
+        if not sent:
+            break
+        copied += sent
+        if progress:
+            progress(sent)
+    return copied
+
+
+def copy_file(src, dest, progress=None):
+    """copies src to dest in chunks
+
+    Parameters
+    ----------
+    src, dest
+        file paths
+    progress
+        callable, called with the number of bytes copied for each chunk
+    """
+    size = os.stat(src).st_size
+    with open(src, "rb") as infile, open(dest, "wb") as outfile:
+        copied = _copy_range(infile, outfile, size, progress)
+    if copied != size:
+        raise OSError(f"copied {copied} of {size} bytes from '{src}'")
+
+
+def file_digest(path, name="md5", chunk_size=CHUNK_SIZE):
+    """returns the hex digest of the contents of path, name is a hashlib
+    algorithm"""
+    digest = hashlib.new(name)
+    with open(path, "rb") as infile:
+        for chunk in iter(lambda: infile.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_md5(path, chunk_size=CHUNK_SIZE):
+    return file_digest(path, "md5", chunk_size=chunk_size)
+
+
+def verify_copy(src, dest, sha256=None):
+    """raises OSError if dest is not identical to src
+
+    If provided, sha256 is the digest of src and src is not read."""
+    if os.stat(src).st_size != os.stat(dest).st_size:
+        same = False
+    elif sha256:
+        same = file_digest(dest, "sha256") == sha256
+    else:
+        same = file_md5(src) == file_md5(dest)
+    if not same:
+        raise OSError(f"'{dest}' is not identical to '{src}'")
+
+
+def move_file(src, dest, progress=None, verify=True, sha256=None):
+    """moves src to dest, copying if they are on different filesystems
+
+    Parameters
+    ----------
+    src, dest
+        file paths, the parent directory of dest must exist
+    progress
+        callable, called with the number of bytes transferred
+    verify
+        a cross-device copy is checked against src before src is deleted
+    sha256
+        digest of src, if known, a copy is checked against it rather than
+        reading src again
+    """
+    src = pathlib.Path(src)
+    dest = pathlib.Path(dest)
+    size = src.stat().st_size
+    if same_device(src, dest.parent):
+        src.replace(dest)
+        if progress:
+            progress(size)
+        return
+
+    # copy to a temporary name so an interrupted copy never leaves a partial
+    # file at dest
+    tmp = dest.with_name(f".{dest.name}.partial")
+    try:
+        copy_file(src, tmp, progress=progress)
+        if verify:
+            verify_copy(src, tmp, sha256=sha256)
+        tmp.replace(dest)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    src.unlink()
+
+
+def move_files(
+    pairs, workers=4, show_progress=True, verify=True, on_done=None, digests=None
+):
+    """moves each (src, dest) in pairs using at most workers threads
+
+    Displays a progress bar of the bytes transferred if show_progress.
+    on_done(src, dest) is called, from the worker thread, after each
+    successful move. digests is {src: sha256}, see move_file()."""
+    pairs = list(pairs)
+    digests = digests or {}
+    if not show_progress:
+        _run(pairs, workers, None, verify, on_done, digests)
+        return
+
+    from rich.progress import (
+        BarColumn,
+        DownloadColumn,
+        Progress,
+        TimeRemainingColumn,
+        TransferSpeedColumn,
+    )
+
+    total = sum(os.stat(src).st_size for src, _ in pairs)
+    columns = (
+        "[progress.description]{task.description}",
+        BarColumn(),
+        DownloadColumn(),
+        TransferSpeedColumn(),
+        TimeRemainingColumn(),
+    )
+    with Progress(*columns) as bar:
+        task = bar.add_task("Moving", total=total)
+        _run(pairs, workers, lambda n: bar.advance(task, n), verify, on_done, digests)
+
+
+def _run(pairs, workers, progress, verify, on_done, digests):
+    def move(src, dest):
+        sha256 = digests.get(src)
+        move_file(src, dest, progress=progress, verify=verify, sha256=sha256)
+        if on_done:
+            on_done(src, dest)
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        futures = [executor.submit(move, src, dest) for src, dest in pairs]
+        # raises the first failure, after all transfers have finished
+        for future in futures:
+            future.result()
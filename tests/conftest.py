@@ -0,0 +1,32 @@
+import pytest
+
+
+@pytest.fixture(scope="session")
+def gradebook_path(tmp_path_factory):
+    """2 assignments, 3 students, student u3 did not submit python_2"""
+    from nbgrader.api import Gradebook
+
+    path = tmp_path_factory.mktemp("gb") / "gradebook.db"
+    with Gradebook(f"sqlite:///{path}") as gb:
+        for sid, first in (("u1", "Ann"), ("u2", "Bob"), ("u3", "Cat")):
+            gb.add_student(sid, first_name=first, last_name="Smith")
+        for name in ("python_1", "python_2"):
+            gb.add_assignment(name)
+            gb.add_notebook("nb", name)
+            for cell in ("q1", "q2"):
+                gb.add_grade_cell(cell, "nb", name, max_score=5, cell_type="code")
+
+        scores = {"u1": (1, 2), "u2": (3, None), "u3": (None, None)}
+        for name in ("python_1", "python_2"):
+            for sid, (auto, manual) in scores.items():
+                if name == "python_2" and sid == "u3":
+                    continue
+                gb.add_submission(name, sid)
+                q1 = gb.find_grade("q1", "nb", name, sid)
+                q1.auto_score = auto
+                q2 = gb.find_grade("q2", "nb", name, sid)
+                q2.auto_score = 1
+                q2.manual_score = manual
+                q2.extra_credit = 0.5 if manual else None
+        gb.db.commit()
+    return path
@@ -0,0 +1,49 @@
+import gzip
+
+import pytest
+
+from gutils import backup
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = tmp_path / "quiz_1.ipynb"
+    path.write_text("original")
+    # unrelated files are not considered backups
+    (tmp_path / "quiz_10.ipynb.bak").write_text("other")
+    (tmp_path / "quiz_1.ipynb.bak.x").write_text("other")
+    return path
+
+
+def test_make_backup_numbering(path):
+    names = [backup.make_backup(path).name for _ in range(3)]
+    assert names == ["quiz_1.ipynb.bak", "quiz_1.ipynb.bak.1", "quiz_1.ipynb.bak.2"]
+    assert [n for n, _ in backup.list_backups(path)] == [0, 1, 2]
+    assert path.read_text() == "original"
+
+
+def test_make_backup_keep(path):
+    for i in range(5):
+        path.write_text(f"version {i}")
+        backup.make_backup(path, keep=2)
+    got = backup.list_backups(path)
+    assert [p.name for _, p in got] == ["quiz_1.ipynb.bak.3", "quiz_1.ipynb.bak.4"]
+    assert got[-1][1].read_text() == "version 4"
+    # numbering continues after pruning
+    assert backup.make_backup(path, keep=2).name == "quiz_1.ipynb.bak.5"
+
+
+def test_make_backup_compress(path):
+    dest = backup.make_backup(path, compress=True)
+    assert dest.name == "quiz_1.ipynb.bak.gz"
+    assert gzip.decompress(dest.read_bytes()) == b"original"
+    assert backup.make_backup(path).name == "quiz_1.ipynb.bak.1"
+
+
+def test_atomic_write_text(path):
+    dest = backup.make_backup(path)
+    backup.atomic_write_text(path, "new")
+    assert path.read_text() == "new"
+    # hard linked backup is unaffected
+    assert dest.read_text() == "original"
+    assert not [p for p in path.parent.iterdir() if p.name.startswith(".")]
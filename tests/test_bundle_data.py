@@ -0,0 +1,310 @@
+import os
+import pathlib
+
+import pytest
+
+from gutils import bundle_data, transfer
+
+
+@pytest.fixture
+def assignment(tmp_path):
+    assign_dir = tmp_path / "source" / "seqcomp_assignment_1"
+    (assign_dir / "data").mkdir(parents=True)
+    (assign_dir / ".ipynb_checkpoints").mkdir()
+    (assign_dir / "seqcomp_assignment_1.ipynb").write_text("{}")
+    (assign_dir / "helper.py").write_text("")
+    (assign_dir / "data" / "brca1.fasta").write_text(">a\nACGT\n" * 1000)
+    (assign_dir / "data" / "counts.tsv").write_text("a\tb\n1\t2\n")
+    (assign_dir / ".ipynb_checkpoints" / "x.tsv").write_text("")
+    dest_root = tmp_path / "data"
+    dest_root.mkdir()
+    return assign_dir, dest_root
+
+
+def _check_bundled(assign_dir, dest_root, dedup=False):
+    dest_dir = dest_root / assign_dir.name
+    for name in ("brca1.fasta", "counts.tsv"):
+        orig = assign_dir / "data" / name
+        assert orig.is_symlink()
+        assert orig.resolve() == (dest_dir / "data" / name).resolve()
+        assert (dest_dir / "data" / name).is_symlink() == dedup
+    assert (assign_dir / "data" / "brca1.fasta").read_text() == ">a\nACGT\n" * 1000
+    assert not (assign_dir / "helper.py").is_symlink()
+    assert not (dest_dir / ".ipynb_checkpoints").exists()
+
+
+@pytest.mark.parametrize("cross_device", (False, True))
+def test_main(assignment, monkeypatch, cross_device):
+    if cross_device:
+        monkeypatch.setattr(transfer, "same_device", lambda *args: False)
+    assign_dir, dest_root = assignment
+    bundle_data.main(dest_root, assign_dir, False, False, workers=2)
+    _check_bundled(assign_dir, dest_root)
+    assert not list(dest_root.glob("**/.*.partial"))
+
+
+def test_main_dry_run(assignment):
+    assign_dir, dest_root = assignment
+    bundle_data.main(dest_root, assign_dir, False, True)
+    assert not (dest_root / assign_dir.name).exists()
+    assert not (assign_dir / "data" / "counts.tsv").is_symlink()
+
+
+def test_move_file_copy(tmp_path, monkeypatch):
+    monkeypatch.setattr(transfer, "same_device", lambda *args: False)
+    monkeypatch.setattr(transfer, "CHUNK_SIZE", 1000)
+    src = tmp_path / "src.bin"
+    data = os.urandom(10_500)
+    src.write_bytes(data)
+    dest = tmp_path / "dest.bin"
+    chunks = []
+    transfer.move_file(src, dest, progress=chunks.append)
+    assert dest.read_bytes() == data
+    assert not src.exists()
+    assert sum(chunks) == len(data) and len(chunks) == 11
+
+
+def test_move_file_verify_fails(tmp_path, monkeypatch):
+    monkeypatch.setattr(transfer, "same_device", lambda *args: False)
+
+    def bad_copy(src, dest, progress=None):
+        dest.write_bytes(b"corrupt")
+
+    monkeypatch.setattr(transfer, "copy_file", bad_copy)
+    src = tmp_path / "src.bin"
+    src.write_bytes(b"original")
+    with pytest.raises(OSError):
+        transfer.move_file(src, tmp_path / "dest.bin")
+    # the source is retained and no partial copy is left behind
+    assert src.read_bytes() == b"original"
+    assert [p.name for p in tmp_path.iterdir()] == ["src.bin"]
+
+
+def test_main_dedup(assignment):
+    import shutil
+
+    assign_dir, dest_root = assignment
+    # a second assignment sharing one data file
+    other = assign_dir.parent / "seqcomp_assignment_2"
+    (other / "data").mkdir(parents=True)
+    (other / "seqcomp_assignment_2.ipynb").write_text("{}")
+    shutil.copy(assign_dir / "data" / "brca1.fasta", other / "data")
+    (other / "data" / "brca1_copy.fasta").write_text(">a\nACGT\n" * 1000)
+
+    bundle_data.main(dest_root, assign_dir, False, False, dedup=True)
+    bundle_data.main(dest_root, other, False, False, dedup=True)
+    _check_bundled(assign_dir, dest_root, dedup=True)
+    store = dest_root / ".store"
+    objects = [p for p in store.glob("*/*") if p.is_file()]
+    assert len(objects) == 2
+    for path in (other / "data").iterdir():
+        assert path.read_text() == ">a\nACGT\n" * 1000
+        assert path.resolve().parent.parent == store.resolve()
+
+
+def test_main_dedup_chowns_links(assignment, monkeypatch):
+    assign_dir, dest_root = assignment
+    chowned = []
+
+    def lchown(path, uid, gid):
+        chowned.append(path)
+
+    def chown(*args, **kwargs):
+        raise AssertionError("follows the symlink into the store")
+
+    monkeypatch.setattr(bundle_data.os, "lchown", lchown)
+    monkeypatch.setattr(bundle_data.os, "chown", chown)
+    bundle_data.main(dest_root, assign_dir, False, False, dedup=True)
+    assert len(chowned) == 2
+    assert all(pathlib.Path(p).is_symlink() for p in chowned)
+
+
+@pytest.mark.parametrize("dedup", (False, True))
+def test_main_cross_device_reads_once(assignment, monkeypatch, dedup):
+    monkeypatch.setattr(transfer, "same_device", lambda *args: False)
+    hashed = []
+    file_digest = transfer.file_digest
+
+    def spy(path, *args, **kwargs):
+        hashed.append(pathlib.Path(path).name)
+        return file_digest(path, *args, **kwargs)
+
+    monkeypatch.setattr(transfer, "file_digest", spy)
+    assign_dir, dest_root = assignment
+    bundle_data.main(dest_root, assign_dir, False, False, dedup=dedup)
+    _check_bundled(assign_dir, dest_root, dedup=dedup)
+    # only the copies are hashed, verified against the planned digests
+    assert len(hashed) == 2
+    assert all(name.endswith(".partial") for name in hashed)
+
+
+def test_move_file_verify_digest(tmp_path, monkeypatch):
+    monkeypatch.setattr(transfer, "same_device", lambda *args: False)
+    src = tmp_path / "src.bin"
+    src.write_bytes(b"original")
+    with pytest.raises(OSError):
+        transfer.move_file(src, tmp_path / "dest.bin", sha256="0" * 64)
+    assert src.exists()
+
+
+def test_walk_assignment(assignment):
+    assign_dir, _ = assignment
+    (assign_dir / "link.tsv").symlink_to(assign_dir / "data" / "counts.tsv")
+    (assign_dir / "data" / ".hidden.tsv").write_text("")
+    data, notebooks = bundle_data.walk_assignment(assign_dir)
+    assert data == [
+        assign_dir / "data" / "brca1.fasta",
+        assign_dir / "data" / "counts.tsv",
+    ]
+    assert notebooks == [assign_dir / "seqcomp_assignment_1.ipynb"]
+    assert bundle_data.get_data_paths(assign_dir, [".tsv", ".py", ".ipynb"]) == data[:1]
+
+
+@pytest.mark.parametrize(
+    "kwargs,patterns,expect",
+    (
+        ({}, ["*.fasta"], ["data/counts.tsv", "extra/big.bin"]),
+        ({}, ["data/"], ["extra/big.bin"]),
+        ({}, ["/data"], ["extra/big.bin"]),
+        ({}, ["**/counts.tsv"], ["data/brca1.fasta", "extra/big.bin"]),
+        ({}, ["**/data/counts.tsv"], ["data/brca1.fasta", "extra/big.bin"]),
+        ({}, ["*/*.fasta"], ["data/counts.tsv", "extra/big.bin"]),
+        ({}, ["/*.fasta"], ["data/brca1.fasta", "data/counts.tsv", "extra/big.bin"]),
+        ({}, ["data/*", "!data/counts.tsv"], ["data/counts.tsv", "extra/big.bin"]),
+        ({}, ["big.bin/"], ["data/brca1.fasta", "data/counts.tsv", "extra/big.bin"]),
+        ({"include_ext": ["tsv"]}, [], ["data/counts.tsv"]),
+        ({"exclude_ext": ["bin", ".FASTA"]}, [], ["data/counts.tsv"]),
+        ({"min_size": 100}, [], ["data/brca1.fasta", "extra/big.bin"]),
+        ({"max_size": 100}, [], ["data/counts.tsv"]),
+    ),
+)
+def test_make_rules(assignment, kwargs, patterns, expect):
+    assign_dir, _ = assignment
+    (assign_dir / "extra").mkdir()
+    (assign_dir / "extra" / "big.bin").write_bytes(b"0" * 1000)
+    if patterns:
+        (assign_dir / ".bundleignore").write_text("# comment\n" + "\n".join(patterns))
+    rules = bundle_data.make_rules(assign_dir, **kwargs)
+    data, _ = bundle_data.walk_assignment(assign_dir, rules)
+    assert [p.relative_to(assign_dir).as_posix() for p in data] == expect
+
+
+def test_ignore_patterns_gitignore_style():
+    rules = bundle_data.DataRules(
+        ignore_patterns=["**/a/b", "x/*.tsv", "/top.txt", "logs/**", "d?t", "[!c]*.gz"]
+    )
+    for path in ("a/b", "q/a/b", "q/r/a/b", "x/c.tsv", "top.txt", "logs/a/b.txt"):
+        assert rules.ignored(path, False), path
+    for path in ("q/xa/b", "a/b/c", "x/y/c.tsv", "d/top.txt", "logs", "d/t"):
+        assert not rules.ignored(path, False), path
+    # a pattern without a slash matches a name at any depth
+    assert rules.ignored("q/r/dot", False)
+    assert rules.ignored("q/b.gz", False) and not rules.ignored("q/c.gz", False)
+
+
+def _interrupt_chown(monkeypatch, after):
+    """chown fails after `after` calls"""
+    calls = []
+    chown = bundle_data._chown
+
+    def failing_chown(*args, **kwargs):
+        if len(calls) >= after:
+            raise PermissionError("chown failed")
+        calls.append(args)
+        chown(*args, **kwargs)
+
+    monkeypatch.setattr(bundle_data, "_chown", failing_chown)
+
+
+@pytest.mark.parametrize("dedup", (False, True))
+def test_resume(assignment, monkeypatch, dedup):
+    assign_dir, dest_root = assignment
+    _interrupt_chown(monkeypatch, 1)
+    with pytest.raises(PermissionError):
+        bundle_data.main(dest_root, assign_dir, False, False, dedup=dedup)
+    monkeypatch.undo()
+
+    # a new bundle is refused until the interrupted one is resolved
+    with pytest.raises(SystemExit):
+        bundle_data.main(dest_root, assign_dir, False, False, dedup=dedup)
+
+    bundle_data.main(dest_root, assign_dir, False, False, resume=True)
+    _check_bundled(assign_dir, dest_root, dedup=dedup)
+    assert bundle_data.verify(assign_dir, dest_root) == []
+
+
+@pytest.mark.parametrize("dedup", (False, True))
+@pytest.mark.parametrize("undo", (False, True))
+def test_truncated_journal(assignment, monkeypatch, dedup, undo):
+    assign_dir, dest_root = assignment
+    _interrupt_chown(monkeypatch, 1)
+    with pytest.raises(PermissionError):
+        bundle_data.main(dest_root, assign_dir, False, False, dedup=dedup)
+    monkeypatch.undo()
+
+    # the last line is partly written, as by a full disk
+    journal = dest_root / assign_dir.name / bundle_data.JOURNAL_NAME
+    with open(journal, "a") as outfile:
+        outfile.write('{"op": "chowned", "src": "/tm')
+
+    if undo:
+        bundle_data.main(dest_root, assign_dir, False, False, undo=True)
+        for path in (assign_dir / "data").iterdir():
+            assert not path.is_symlink()
+    else:
+        bundle_data.main(dest_root, assign_dir, False, False, resume=True)
+        _check_bundled(assign_dir, dest_root, dedup=dedup)
+        assert bundle_data.verify(assign_dir, dest_root) == []
+    # the partial line was removed before appending
+    assert all(line.endswith("}") for line in journal.read_text().splitlines())
+
+
+def test_journal_ops_without_plan(tmp_path):
+    journal = bundle_data.Journal(tmp_path / "journal.jsonl")
+    journal.append("moved", src="/before/begin")
+    journal.append("begin", dedup=False)
+    journal.append("plan", src="/a", dest="/b", sha256="", owner="", group="")
+    journal.append("moved", src="/unplanned")
+    (run,) = journal.runs()
+    assert run["ops"] == {"/a": set()}
+
+
+@pytest.mark.parametrize("dedup", (False, True))
+@pytest.mark.parametrize("interrupt", (False, True))
+def test_rollback(assignment, monkeypatch, dedup, interrupt):
+    assign_dir, dest_root = assignment
+    data_dir = assign_dir / "data"
+    (data_dir / "counts.tsv").chmod(0o600)
+    expect = {p.name: p.read_text() for p in data_dir.iterdir()}
+    modes = {p.name: p.stat().st_mode & 0o777 for p in data_dir.iterdir()}
+    if interrupt:
+        _interrupt_chown(monkeypatch, 1)
+        with pytest.raises(PermissionError):
+            bundle_data.main(dest_root, assign_dir, False, False, dedup=dedup)
+        monkeypatch.undo()
+    else:
+        bundle_data.main(dest_root, assign_dir, False, False, dedup=dedup)
+
+    bundle_data.main(dest_root, assign_dir, False, False, undo=True)
+    for path in data_dir.iterdir():
+        assert not path.is_symlink()
+        assert path.read_text() == expect[path.name]
+        assert path.stat().st_mode & 0o777 == modes[path.name]
+    dest_data = dest_root / assign_dir.name / "data"
+    assert not [p for p in dest_data.iterdir() if not p.name.startswith(".")]
+    # can bundle again after a rollback
+    bundle_data.main(dest_root, assign_dir, False, False, dedup=dedup)
+    _check_bundled(assign_dir, dest_root, dedup=dedup)
+
+
+def test_verify(assignment):
+    assign_dir, dest_root = assignment
+    assert bundle_data.verify(assign_dir, dest_root)  # nothing bundled
+    bundle_data.main(dest_root, assign_dir, False, False)
+    assert bundle_data.verify(assign_dir, dest_root) == []
+    dest_data = dest_root / assign_dir.name / "data"
+    (dest_data / "counts.tsv").write_text("modified")
+    (dest_data / "brca1.fasta").unlink()
+    problems = bundle_data.verify(assign_dir, dest_root)
+    assert len(problems) == 2
+    assert "broken symlink" in problems[0] or "broken symlink" in problems[1]
@@ -103,3 +103,542 @@ def test_two_funcs_equivalent_pass(a, b):
 def test_two_funcs_equivalent_fail(a, b):
     with pytest.raises(AssertionError):
         check.two_funcs_equivalent(foo_add, foo_mul, 2, 1)
+
+
+def sleeper(seconds):
+    import time
+
+    time.sleep(seconds)
+    return seconds
+
+
+def allocator(mb):
+    return len(bytearray(mb * 2**20))
+
+
+@pytest.fixture
+def no_limits():
+    yield
+    check.set_limits()
+
+
+def test_run_calls_inline():
+    got = check.run_calls([(foo_add, (1, 2), {}), (foo_add, ("a", 2), {})])
+    assert got[0] == (True, 3)
+    assert not got[1][0] and isinstance(got[1][1], TypeError)
+
+
+def test_run_calls_isolated():
+    got = check.run_calls(
+        [(foo_add, (1, 2), {}), (foo_add, ("a", 2), {}), (sleeper, (5,), {})],
+        timeout=1,
+    )
+    assert got[0] == (True, 3)
+    assert isinstance(got[1][1], TypeError)
+    assert isinstance(got[2][1], TimeoutError)
+
+
+def rendezvous(directory, index, num):
+    """marks this call as started, returns once num calls have started"""
+    import os
+    import time
+
+    (directory / str(index)).touch()
+    while len(os.listdir(directory)) < num:
+        time.sleep(0.01)
+    return index
+
+
+def test_run_calls_parallel(tmp_path):
+    # each call waits for all to start, so run one at a time they time out
+    calls = [(rendezvous, (tmp_path, i, 4), {}) for i in range(4)]
+    got = check.run_calls(calls, timeout=30, workers=4)
+    assert got == [(True, i) for i in range(4)]
+
+
+def test_run_calls_memory_limit():
+    got = check.run_calls(
+        [(allocator, (1,), {}), (allocator, (4096,), {})], memory_mb=200
+    )
+    assert got[0] == (True, 2**20)
+    assert isinstance(got[1][1], MemoryError)
+
+
+def test_function_does_not_fail_timeout():
+    with pytest.raises(AssertionError) as err:
+        check.function_does_not_fail(sleeper, 0, 5, timeout=1)
+    msg = str(err.value)
+    assert "failed on 5: timed out" in msg
+    assert "failed on 0" not in msg
+
+
+class BadInput(Exception):
+    """pickles, but cannot be unpickled"""
+
+    def __init__(self, value, reason):
+        super().__init__(f"{value}: {reason}")
+
+
+def raises_bad_input(value):
+    raise BadInput(value, "bad")
+
+
+def test_function_does_not_fail_unpicklable_error():
+    with pytest.raises(AssertionError) as err:
+        check.function_does_not_fail(raises_bad_input, 1, timeout=5)
+    assert "failed on 1: result could not be received" in str(err.value)
+
+
+def test_function_returned_correct_types_timeout():
+    check.function_returned_correct_types(sleeper, float, 0.1, timeout=2)
+    with pytest.raises(AssertionError) as err:
+        check.function_returned_correct_types(sleeper, int, 0, 5, timeout=1)
+    assert "failed on 5: timed out" in str(err.value)
+
+
+def test_two_funcs_equivalent_limits(no_limits):
+    check.set_limits(timeout=2)
+    assert check.two_funcs_equivalent(foo_add, foo_add, 2, 1)
+    # exceptions are compared as by trapped_result
+    assert check.two_funcs_equivalent(foo_add, foo_add, "2", 1)
+    with pytest.raises(AssertionError) as err:
+        check.two_funcs_equivalent(sleeper, abs, 5)
+    assert "TimeoutError" in str(err.value)
+
+
+# the timing checks are tested with a fake timer, advanced by the functions
+# timed according to their input, so results do not depend on the machine
+_clock = [0.0]
+
+
+def fake_timer():
+    return _clock[0]
+
+
+@pytest.fixture
+def fake_clock(monkeypatch):
+    monkeypatch.setattr(check, "_timer", fake_timer)
+
+
+def linear(n):
+    _clock[0] += n * 1e-6
+    return n
+
+
+def quadratic(n):
+    _clock[0] += n**2 * 1e-6
+    return n
+
+
+def instant(n):
+    return n
+
+
+def forever(n):
+    while True:
+        pass
+
+
+def sort_in_place(data):
+    data.sort()
+    assert data != sorted(data, reverse=True)
+
+
+def test_time_function_copies_args():
+    data = list(range(10, 0, -1))
+    assert check.time_function(sort_in_place, data, repeats=3) >= 0
+    assert data[0] == 10
+
+
+def test_time_function(fake_clock):
+    assert check.time_function(linear, 1000) == pytest.approx(1e-3)
+    assert check.time_function(linear, 1000, timeout=5) == pytest.approx(1e-3)
+    # not 0
+    assert check.time_function(instant, 1000) > 0
+    with pytest.raises(TimeoutError):
+        check.time_function(forever, 1, timeout=0.5)
+
+
+def test_scaling_exponent():
+    sizes = [10, 100, 1000]
+    assert abs(check.scaling_exponent(sizes, [1e-3 * n**2 for n in sizes]) - 2) < 1e-6
+    assert abs(check.scaling_exponent(sizes, [0, 0, 0])) < 1e-6
+
+
+def test_function_within_time_budget(fake_clock):
+    check.function_within_time_budget(linear, linear, 100, max_ratio=3, repeats=3)
+    check.function_within_time_budget(instant, instant, 100)
+    with pytest.raises(AssertionError) as err:
+        check.function_within_time_budget(quadratic, linear, 1, 1000, max_ratio=2)
+    msg = str(err.value)
+    assert "quadratic is too slow: took 1s, 1000.0 times" in msg
+    assert "on 1\n" not in msg
+    with pytest.raises(AssertionError) as err:
+        check.function_within_time_budget(
+            foo_add, max, (1, 2), (1.0, 2), multiple_args=True, max_ratio=1e6
+        )
+    assert "failed on (1.0, 2)" in str(err.value)
+    assert "failed on (1, 2)" not in str(err.value)
+
+
+def test_function_within_time_budget_timeout(fake_clock):
+    with pytest.raises(AssertionError) as err:
+        check.function_within_time_budget(forever, linear, 1, timeout=0.5)
+    assert "failed on 1: timed out after 0.5s" in str(err.value)
+
+
+def test_function_scales_as(fake_clock):
+    sizes = [50, 100, 200, 400]
+    check.function_scales_as(linear, int, sizes, max_exponent=1)
+    check.function_scales_as(linear, int, sizes, ref_func=linear)
+    check.function_scales_as(instant, int, sizes, ref_func=instant, max_ratio=1)
+    with pytest.raises(AssertionError) as err:
+        check.function_scales_as(quadratic, int, sizes, ref_func=linear)
+    assert "quadratic scales poorly: time grows as n^2.00" in str(err.value)
+    with pytest.raises(AssertionError) as err:
+        check.function_scales_as(
+            quadratic, int, sizes, ref_func=linear, tolerance=5, max_ratio=300
+        )
+    assert "400.0 times the reference (max 300), at n=400" in str(err.value)
+    assert "n=200" not in str(err.value)
+    with pytest.raises(ValueError):
+        check.function_scales_as(linear, int, sizes)
+
+
+def test_function_scales_as_timeout(fake_clock):
+    with pytest.raises(AssertionError) as err:
+        check.function_scales_as(forever, int, [1, 2], max_exponent=1, timeout=0.5)
+    assert "forever failed on:\nn=1: timed out after 0.5s" in str(err.value)
+
+
+def ref_sorted(data):
+    return sorted(data)
+
+
+def bad_sorted(data):
+    return sorted(data)[:3]
+
+
+def sort_copy(data):
+    data = list(data)
+    data.sort()
+    return data
+
+
+def sort_inplace_return(data):
+    data.sort()
+    return data
+
+
+def clip_negative(values):
+    values = values.copy()
+    values[values < 0] = 0
+    return values
+
+
+def clip_negative_inplace(values):
+    values[values < 0] = 0
+    return values
+
+
+def test_funcs_equivalent_over_pass():
+    inputs = [[3, 1, 2], [5, 4, 3, 2, 1], []]
+    assert check.funcs_equivalent_over(sort_copy, ref_sorted, inputs)
+    # arguments shared with the caller are not modified
+    check.funcs_equivalent_over(
+        sort_inplace_return, sort_inplace_return, inputs, check_mutation=False
+    )
+    assert inputs[1] == [5, 4, 3, 2, 1]
+
+
+def test_funcs_equivalent_over_reports_all():
+    inputs = [[3, 1, 2], [5, 4, 3, 2, 1], [6, 5, 4, 3]]
+    with pytest.raises(AssertionError) as err:
+        check.funcs_equivalent_over(bad_sorted, ref_sorted, inputs)
+    msg = str(err.value)
+    assert "[3, 1, 2]" not in msg
+    assert "input [5, 4, 3, 2, 1]: [1, 2, 3] != [1, 2, 3, 4, 5]" in msg
+    assert "input [6, 5, 4, 3]" in msg
+
+
+def test_funcs_equivalent_over_mutation():
+    with pytest.raises(AssertionError) as err:
+        check.funcs_equivalent_over(sort_inplace_return, ref_sorted, [[2, 1]])
+    assert "argument 0 modified by only sort_inplace_return" in str(err.value)
+    check.funcs_equivalent_over(
+        sort_inplace_return, ref_sorted, [[2, 1]], check_mutation=False
+    )
+
+
+def test_funcs_equivalent_over_multiple_args():
+    inputs = [(1, 2), (3, 4), ("a", 1)]
+    check.funcs_equivalent_over(foo_add, foo_add, inputs, multiple_args=True)
+    with pytest.raises(AssertionError) as err:
+        check.funcs_equivalent_over(foo_add, foo_mul, inputs, multiple_args=True)
+    msg = str(err.value)
+    assert "input (1, 2): 3 != 2" in msg
+    assert "input (3, 4): 7 != 12" in msg
+    # both raise, but different exceptions
+    assert "input ('a', 1): ['TypeError'] != [" in msg
+
+
+def test_funcs_equivalent_over_arrays():
+    data = array([-1.0, 2.0, -3.0])
+    check.funcs_equivalent_over(clip_negative, clip_negative, [data])
+    with pytest.raises(AssertionError) as err:
+        check.funcs_equivalent_over(clip_negative_inplace, clip_negative, [data])
+    assert "argument 0 modified by only clip_negative_inplace" in str(err.value)
+    assert data.tolist() == [-1.0, 2.0, -3.0]
+    assert data.flags.writeable
+
+
+def test_funcs_equivalent_over_thaws_per_call(monkeypatch):
+    # inputs are copied when each call is made, not all beforehand
+    copies = []
+    thaw = check._thaw
+    run_calls = check.run_calls
+
+    def counted_thaw(*args):
+        copies.append(len(copies))
+        return thaw(*args)
+
+    def checked_run_calls(calls, **kwargs):
+        assert not copies
+        return run_calls(calls, **kwargs)
+
+    monkeypatch.setattr(check, "_thaw", counted_thaw)
+    monkeypatch.setattr(check, "run_calls", checked_run_calls)
+    check.funcs_equivalent_over(sort_copy, ref_sorted, [[3, 1, 2], [2, 1]])
+    assert len(copies) == 4
+
+
+def test_funcs_equivalent_over_isolated():
+    inputs = [[3, 1, 2], [2, 1]]
+    check.funcs_equivalent_over(sort_copy, ref_sorted, inputs, timeout=5)
+    with pytest.raises(AssertionError) as err:
+        check.funcs_equivalent_over(sort_inplace_return, ref_sorted, inputs, timeout=5)
+    assert "modified by only sort_inplace_return" in str(err.value)
+    assert inputs == [[3, 1, 2], [2, 1]]
+
+
+def test_two_funcs_equivalent_array_copied():
+    data = array([-1.0, 2.0])
+    assert check.two_funcs_equivalent(clip_negative_inplace, clip_negative, data)
+    assert data.tolist() == [-1.0, 2.0]
+
+
+def test_two_funcs_equivalent_list_and_array():
+    calls = []
+
+    def append_and_set(values, data):
+        calls.append(1)
+        values.append(1)
+        data[0] = 5
+        return values
+
+    def append(values, data):
+        return values + [1]
+
+    values, data = [], array([0.0, 0.0])
+    assert check.two_funcs_equivalent(append_and_set, append, values, data)
+    # each function is called once, on its own copy of the arguments
+    assert len(calls) == 1
+    assert values == [] and data.tolist() == [0.0, 0.0]
+    with pytest.raises(AssertionError) as err:
+        check.funcs_equivalent_over(
+            append_and_set, append, [([], data)], multiple_args=True
+        )
+    msg = str(err.value)
+    assert "argument 0 modified by only append_and_set" in msg
+    assert "argument 1 modified by only append_and_set" in msg
+
+
+class FakeTable:
+    """stands in for a cogent3 Table, which has an array attribute"""
+
+    def __init__(self, data):
+        self.array = array(data, dtype=object)
+
+
+class FakeFrame:
+    """stands in for a pandas DataFrame"""
+
+    def __init__(self, data):
+        self.data = data
+
+    def to_numpy(self):
+        return array(self.data)
+
+
+def test_expected_variables_values_arrays():
+    import numpy
+
+    logged = numpy.log2(numpy.arange(1, 1001, dtype=float))
+    expect = numpy.log2(numpy.arange(1, 1001))
+    check.expected_variables_values([("logged", expect + 1e-12)], locals())
+    check.expected_variables_values([("logged", expect.tolist())], locals())
+
+    logged[[10, 20, 30]] = 0
+    with pytest.raises(AssertionError) as err:
+        check.expected_variables_values([("logged", expect)], locals(), max_shown=2)
+    msg = str(err.value)
+    assert "value of logged has 3 of 1000 elements different" in msg
+    assert "[10] 0.0 != " in msg and "[20] 0.0 != " in msg
+    assert "[30]" not in msg
+
+    with pytest.raises(AssertionError) as err:
+        check.expected_variables_values([("logged", expect[:10])], locals())
+    assert "has shape (1000,), expected (10,)" in str(err.value)
+
+
+def test_expected_variables_values_tolerance():
+    total = 0.30000000000000004
+    with pytest.raises(AssertionError) as err:
+        check.expected_variables_values([("total", 0.3)], locals())
+    assert "value of total=0.30000000000000004 does not equal 0.3" in str(err.value)
+    check.expected_variables_values([("total", 0.3)], locals(), rtol=1e-9)
+
+    counts = array([10, 20, 31])
+    check.expected_variables_values([("counts", [10, 20, 30])], locals(), atol=1)
+    with pytest.raises(AssertionError) as err:
+        check.expected_variables_values([("counts", [10.0, 20.0, 30.0])], locals())
+    assert "(dtype int64, expected float64): [2] 31 != 30.0" in str(err.value)
+
+
+def test_value_difference_sequences():
+    assert check.value_difference([0.1 + 0.2], [0.3], rtol=1e-9) is None
+    assert check.value_difference((1.0, 2.0), [1.0, 2.1], atol=0.2) is None
+    assert check.value_difference([0.1 + 0.2], [0.3])
+    got = check.value_difference([1.0, 2.0], [1.0, 2.5], atol=0.2)
+    assert got == "has 1 of 2 elements different: [1] 2.0 != 2.5"
+    # not numeric, compared as lists
+    assert check.value_difference(["a", 1], ["a", 1], rtol=1e-9) is None
+    assert check.value_difference([[1], [1, 2]], [[1], [1, 2]], rtol=1e-9) is None
+
+
+def test_value_difference_ragged():
+    got = check.value_difference([[1], [1, 2]], array([[1, 1], [1, 2]]))
+    assert got.startswith("=[[1], [1, 2]] cannot be compared with")
+    with pytest.raises(AssertionError) as err:
+        values = [[1], [1, 2]]
+        check.expected_variables_values([("values", array([1, 2]))], locals())
+    assert "value of values=" in str(err.value)
+
+
+def test_value_difference_nan():
+    nan = float("nan")
+    assert check.value_difference(nan, nan) is None
+    assert check.value_difference(nan, nan, rtol=1e-9) is None
+    assert check.value_difference(array([nan, 1.0]), [nan, 1.0]) is None
+    assert check.value_difference([nan, 1.0], [nan, 1.0], rtol=1e-9) is None
+    assert check.value_difference(nan, 1.0)
+
+
+def test_expected_variables_values_tables():
+    table = FakeTable([["a", 1], ["b", 2]])
+    frame = FakeFrame([[1.0, 2.0], [3.0, 4.0]])
+    check.expected_variables_values(
+        [("table", [["a", 1], ["b", 2]]), ("frame", array([[1.0, 2.0], [3.0, 4.0]]))],
+        locals(),
+    )
+    with pytest.raises(AssertionError) as err:
+        check.expected_variables_values([("table", [["a", 1], ["c", 2]])], locals())
+    assert "[(1, 0)] 'b' != 'c'" in str(err.value)
+
+
+def test_expected_variables_attrib_values_arrays():
+    import numpy
+
+    class Result:
+        pass
+
+    result = Result()
+    result.stats = numpy.array([0.1, 0.2, 0.3])
+    check.expected_variables_attrib_values(
+        [("result", [0.1, 0.2, 0.3000001])], "stats", locals(), rtol=1e-3
+    )
+    with pytest.raises(AssertionError) as err:
+        check.expected_variables_attrib_values(
+            [("result", [0.1, 0.2, 0.4])], "stats", locals()
+        )
+    assert "value of result.stats has 1 of 3 elements different" in str(err.value)
+
+
+@pytest.fixture
+def site_package(tmp_path, monkeypatch):
+    """an importable package in a site-packages directory"""
+    import sys
+
+    site = tmp_path / "site-packages"
+    (site / "gutils_fake_pkg").mkdir(parents=True)
+    (site / "gutils_fake_pkg" / "__init__.py").write_text("")
+    (site / "gutils_fake_pkg" / "sub.py").write_text("")
+    monkeypatch.syspath_prepend(str(site))
+    # everything imported so far, e.g. pytest, is allowed
+    loaded = sorted({name.split(".")[0] for name in sys.modules})
+    yield loaded
+    for name in ("gutils_fake_pkg", "gutils_fake_pkg.sub"):
+        sys.modules.pop(name, None)
+
+
+def test_allowed_modules(site_package):
+    allowed = list(site_package)
+    check.allowed_modules(allowed)
+    # the caller's list is not modified
+    assert allowed == site_package
+
+    import gutils_fake_pkg.sub
+
+    with pytest.raises(RuntimeError) as err:
+        check.allowed_modules(allowed)
+    assert "'gutils_fake_pkg'" in str(err.value)
+    check.allowed_modules(allowed + ["gutils_fake_pkg"])
+
+
+def test_allowed_modules_incremental(site_package, monkeypatch):
+    import sys
+
+    check.allowed_modules(site_package)
+    calls = []
+    monkeypatch.setattr(
+        check.inspect, "ismodule", lambda m: calls.append(m) or inspect_module(m)
+    )
+    check.allowed_modules(site_package)
+    assert calls == []
+
+    import gutils_fake_pkg
+
+    with pytest.raises(RuntimeError):
+        check.allowed_modules(site_package)
+    assert calls == [sys.modules["gutils_fake_pkg"]]
+
+
+def test_allowed_modules_placeholders(site_package):
+    import importlib.util
+    import sys
+
+    # a placeholder, later replaced by the module
+    sys.modules["gutils_fake_pkg"] = object()
+    check.allowed_modules(site_package)
+    del sys.modules["gutils_fake_pkg"]
+    import gutils_fake_pkg
+
+    with pytest.raises(RuntimeError):
+        check.allowed_modules(site_package)
+
+    # a module whose file is not yet set, as while it is being imported
+    spec = importlib.util.find_spec("gutils_fake_pkg")
+    module = importlib.util.module_from_spec(spec)
+    del module.__file__
+    sys.modules["gutils_fake_pkg"] = module
+    check.allowed_modules(site_package)
+    module.__file__ = spec.origin
+    with pytest.raises(RuntimeError) as err:
+        check.allowed_modules(site_package)
+    assert "'gutils_fake_pkg'" in str(err.value)
+
+
+def inspect_module(obj):
+    import types
+
+    return isinstance(obj, types.ModuleType)
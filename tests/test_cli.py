@@ -0,0 +1,59 @@
+import subprocess
+import sys
+
+from click.testing import CliRunner
+
+from gutils.cli import main
+
+
+def import_times(statement):
+    """returns {module: cumulative import microseconds} from python -X importtime"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_startup_imports_are_lazy():
+    times = import_times("import gutils.cli")
+    for name in (
+        "gutils.bundle_data",
+        "gutils.inject_marks",
+        "gutils.nbgrader_fetched",
+        "gutils.rinstall",
+        "tqdm",
+        "rich",
+        "nbgrader",
+        "cogent3",
+    ):
+        assert name not in times
+
+
+def test_import_fetched_has_no_side_effects():
+    # the course id is from a hostname lookup, done when first needed
+    assert "socket" not in import_times("import gutils.nbgrader_fetched")
+
+
+def test_help_lists_commands():
+    result = CliRunner().invoke(main, ["--help"])
+    assert result.exit_code == 0
+    for name in ("bundle-data", "log-fetched", "inject-marks", "export-grades"):
+        assert name in result.output
+
+
+def test_export_grades_if_changed_exclusive(tmp_path):
+    for option in (["--orm"], ["--long", "csv"]):
+        args = ["export-grades", str(tmp_path), "--if_changed", *option]
+        result = CliRunner().invoke(main, args)
+        assert result.exit_code == 2
+        assert "--if_changed cannot be used" in result.output
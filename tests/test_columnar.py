@@ -0,0 +1,57 @@
+import pytest
+
+from gutils import columnar
+
+COLUMNS = ("student", "assignment", "score")
+ROWS = [("u1", "python_1", 1.0), ("u2", "python_1", 2.5), ("u1", "python_2", 0.0)]
+
+
+@pytest.mark.parametrize("suffix,delimiter", ((".csv", ","), (".tsv", "\t")))
+def test_write_delimited(tmp_path, suffix, delimiter):
+    path = tmp_path / f"grades{suffix}"
+    num = columnar.write_rows(iter(ROWS), path, COLUMNS)
+    assert num == 3
+    lines = path.read_text().splitlines()
+    assert lines[0] == delimiter.join(COLUMNS)
+    assert lines[2] == delimiter.join(("u2", "python_1", "2.5"))
+    assert list(tmp_path.iterdir()) == [path]
+
+
+@pytest.mark.parametrize("suffix", (".parquet", ".feather"))
+def test_write_arrow(tmp_path, suffix):
+    pytest.importorskip("pyarrow")
+    import pyarrow.feather
+    import pyarrow.parquet
+
+    path = tmp_path / f"grades{suffix}"
+    # a small batch size so several batches are written
+    num = columnar.write_rows(iter(ROWS), path, COLUMNS, batch_size=2)
+    assert num == 3
+    if suffix == ".parquet":
+        table = pyarrow.parquet.read_table(path)
+    else:
+        table = pyarrow.feather.read_table(path)
+    assert table.column_names == list(COLUMNS)
+    assert table.to_pylist()[1] == dict(zip(COLUMNS, ROWS[1]))
+
+
+def test_write_empty(tmp_path):
+    path = tmp_path / "grades.tsv"
+    assert columnar.write_rows([], path, COLUMNS) == 0
+    assert path.read_text().splitlines() == ["\t".join(COLUMNS)]
+
+
+def test_write_failure_leaves_no_file(tmp_path):
+    def rows():
+        yield ROWS[0]
+        raise RuntimeError
+
+    path = tmp_path / "grades.csv"
+    with pytest.raises(RuntimeError):
+        columnar.write_rows(rows(), path, COLUMNS)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_unsupported_format(tmp_path):
+    with pytest.raises(ValueError):
+        columnar.write_rows(ROWS, tmp_path / "grades.xlsx", COLUMNS)
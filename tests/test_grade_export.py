@@ -0,0 +1,132 @@
+import csv
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+pytest.importorskip("nbgrader")
+pytestmark = pytest.mark.filterwarnings("ignore::Warning")
+
+from gutils import gradebook as GB
+from gutils import grade_export as GE
+
+
+@pytest.fixture
+def gradebook(gradebook_path, tmp_path):
+    """a copy of the session gradebook that can be modified"""
+    path = tmp_path / "gradebook.db"
+    shutil.copyfile(gradebook_path, path)
+    return path
+
+
+def read_tsv(path):
+    """returns the data written by GE.write_tsv(), values are strings"""
+    with open(path, newline="") as infile:
+        reader = csv.reader(infile, delimiter="\t")
+        columns = next(reader)
+        data = {c: {} for c in columns}
+        for row in reader:
+            for column, value in zip(columns, row):
+                data[column][row[0]] = value
+    return data
+
+
+def full_export(path, outpath):
+    conn = GB.connect(path)
+    data = GB.pivot_scores(GB.submission_scores(conn), GB.student_names(conn))
+    conn.close()
+    GE.write_tsv(data, outpath)
+    return read_tsv(outpath)
+
+
+def set_manual_score(path, student, assignment, cell, score):
+    conn = sqlite3.connect(str(path))
+    with conn:
+        conn.execute(
+            "UPDATE grade SET manual_score = ? WHERE id IN ("
+            "SELECT g.id FROM grade g "
+            "JOIN base_cell bc ON bc.id = g.cell_id "
+            "JOIN submitted_notebook sn ON sn.id = g.notebook_id "
+            "JOIN submitted_assignment sa ON sa.id = sn.assignment_id "
+            "JOIN assignment a ON a.id = sa.assignment_id "
+            "WHERE sa.student_id = ? AND a.name = ? AND bc.name = ?)",
+            (score, student, assignment, cell),
+        )
+    conn.close()
+    # ensure the modification is seen, even with a coarse mtime resolution
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 2))
+
+
+def test_tsv_round_trip(tmp_path):
+    data = {
+        "anuid": {"u1": "u1", "u2": "u2"},
+        "name": {"u1": "Ann Smith", "u2": "Bob Smith"},
+        "python_1": {"u1": 1.0, "u2": 2.5},
+    }
+    path = tmp_path / "scores.tsv"
+    GE.write_tsv(data, path)
+    got = read_tsv(path)
+    assert got["python_1"] == {"u1": "1.00", "u2": "2.50"}
+    assert got["name"] == data["name"]
+
+
+def test_export_if_changed(gradebook, tmp_path):
+    out = tmp_path / "scores.tsv"
+    state = tmp_path / "state.json"
+    # first export is complete
+    assert GE.export(gradebook, out, state) == 5
+    assert read_tsv(out) == full_export(gradebook, tmp_path / "full.tsv")
+
+    # unchanged gradebook is not read
+    assert GE.export(gradebook, out, state) == 0
+
+    # modified without changing any score, the output is not rewritten
+    stat = os.stat(gradebook)
+    os.utime(gradebook, (stat.st_atime, stat.st_mtime + 2))
+    os.utime(out, (1, 1))
+    assert GE.export(gradebook, out, state) == 0
+    assert os.stat(out).st_mtime == 1
+
+    set_manual_score(gradebook, "u2", "python_2", "q2", 4.0)
+    assert GE.export(gradebook, out, state) == 1
+    got = read_tsv(out)
+    assert got == full_export(gradebook, tmp_path / "full.tsv")
+    assert got["python_2"]["u2"] == "7.00"
+
+
+def test_export_if_changed_new_path(gradebook, tmp_path):
+    state = tmp_path / "state.json"
+    GE.export(gradebook, tmp_path / "day1.tsv", state)
+    set_manual_score(gradebook, "u1", "python_1", "q1", 5.0)
+    assert GE.export(gradebook, tmp_path / "day2.tsv", state) == 1
+    assert read_tsv(tmp_path / "day1.tsv")["python_1"]["u1"] == "3.50"
+    assert read_tsv(tmp_path / "day2.tsv")["python_1"]["u1"] == "7.50"
+    # unchanged, the previous output is copied
+    assert GE.export(gradebook, tmp_path / "day3.tsv", state) == 0
+    assert (tmp_path / "day3.tsv").read_text() == (tmp_path / "day2.tsv").read_text()
+
+
+def test_export_if_changed_select(gradebook, tmp_path):
+    out = tmp_path / "scores.tsv"
+    GE.export(gradebook, out, tmp_path / "state.json", select=lambda a: "1" in a)
+    assert list(read_tsv(out)) == ["anuid", "name", "python_1"]
+
+
+def test_export_deleted_submission(gradebook, tmp_path):
+    out = tmp_path / "scores.tsv"
+    state = tmp_path / "state.json"
+    GE.export(gradebook, out, state)
+    conn = sqlite3.connect(str(gradebook))
+    with conn:
+        conn.execute("PRAGMA foreign_keys = OFF")
+        conn.execute(
+            "DELETE FROM submitted_assignment WHERE student_id = 'u3' AND "
+            "assignment_id = (SELECT id FROM assignment WHERE name = 'python_1')"
+        )
+    conn.close()
+    stat = os.stat(gradebook)
+    os.utime(gradebook, (stat.st_atime, stat.st_mtime + 2))
+    assert GE.export(gradebook, out, state) == 1
+    assert read_tsv(out) == full_export(gradebook, tmp_path / "full.tsv")
@@ -0,0 +1,54 @@
+import pytest
+
+pytest.importorskip("nbgrader")
+pytestmark = pytest.mark.filterwarnings("ignore::Warning")
+
+from gutils import gradebook as GB
+
+
+def test_submission_scores_match_orm(gradebook_path):
+    conn = GB.connect(gradebook_path)
+    got = sorted(GB.submission_scores(conn))
+    conn.close()
+    expect = sorted(GB.orm_submission_scores(gradebook_path))
+    assert got == expect
+    assert ("python_1", "u1", 3.5) in got
+    assert ("python_1", "u3", 1.0) in got
+
+
+def test_student_names(gradebook_path):
+    conn = GB.connect(gradebook_path)
+    names = GB.student_names(conn)
+    conn.close()
+    assert names == {"u1": "Ann Smith", "u2": "Bob Smith", "u3": "Cat Smith"}
+
+
+def test_connect_is_read_only(gradebook_path):
+    import sqlite3
+
+    conn = GB.connect(gradebook_path)
+    with pytest.raises(sqlite3.OperationalError):
+        conn.execute("DELETE FROM student")
+    conn.close()
+
+
+def test_pivot_scores():
+    rows = [("b_1", "u1", 2.0), ("a_1", "u1", 1.0), ("a_1", "u2", 3.0)]
+    names = {"u1": "Ann Smith", "u2": "Bob Smith", "u3": "Cat Smith"}
+    data = GB.pivot_scores(rows, names)
+    assert list(data) == ["anuid", "name", "a_1", "b_1"]
+    # only students with submissions
+    assert data["name"] == {"u1": "Ann Smith", "u2": "Bob Smith"}
+    assert data["b_1"] == {"u1": 2.0, "u2": 0.0}
+    data = GB.pivot_scores(rows, names, sort_key=lambda x: x[0] != "b")
+    assert list(data)[2:] == ["b_1", "a_1"]
+
+
+def test_iter_cell_scores(gradebook_path):
+    conn = GB.connect(gradebook_path)
+    rows = list(GB.iter_cell_scores(conn))
+    conn.close()
+    # u3 did not submit python_2
+    assert len(rows) == 2 * 2 * 3 - 2
+    assert rows[0] == ("u1", "python_1", "nb", "q1", 1.0)
+    assert ("u1", "python_1", "nb", "q2", 2.5) in rows
@@ -0,0 +1,123 @@
+import json
+
+import pytest
+
+from gutils import inject_marks
+
+
+def _write_notebook(path, points=(2, 1.5)):
+    cells = [
+        {
+            "cell_type": "code",
+            "metadata": {"nbgrader": {"grade": True, "points": points[0]}},
+            "source": ["assert x == 1\n"],
+            "outputs": [],
+        },
+        {"cell_type": "code", "metadata": {}, "source": ["x = 1"], "outputs": []},
+        {
+            "cell_type": "markdown",
+            "metadata": {"nbgrader": {"grade": True, "points": points[1]}},
+            "source": ["An answer"],
+        },
+    ]
+    nb = {"cells": cells, "metadata": {}, "nbformat": 4, "nbformat_minor": 5}
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(nb))
+
+
+@pytest.fixture
+def source_dir(tmp_path):
+    _write_notebook(tmp_path / "quiz_1" / "quiz_1.ipynb")
+    _write_notebook(tmp_path / "quiz_2" / "quiz_2.ipynb", points=(1, 1))
+    _write_notebook(tmp_path / "quiz_2" / ".ipynb_checkpoints" / "quiz_2.ipynb")
+    return tmp_path
+
+
+def test_inject_mark_comments(source_dir):
+    path = source_dir / "quiz_1" / "quiz_1.ipynb"
+    assert inject_marks.inject_mark_comments(path) == (3.5, inject_marks.INJECTED)
+    cells = json.loads(path.read_text())["cells"]
+    assert cells[0]["source"][0] == "# This part worth 2\n\n"
+    assert cells[1]["source"] == ["x = 1"]
+    assert cells[2]["source"][0] == "`This part worth 1.5`\n\n"
+    # points unchanged, notebook is not rewritten
+    assert inject_marks.inject_mark_comments(path) == (3.5, inject_marks.UNCHANGED)
+    # unless forced
+    got = inject_marks.inject_mark_comments(path, force=True)
+    assert got == (3.5, inject_marks.INJECTED)
+    # the previous mark comment is replaced
+    cells = json.loads(path.read_text())["cells"]
+    assert cells[0]["source"] == ["# This part worth 2\n\n", "assert x == 1\n"]
+
+
+def test_inject_mark_comments_full_load(source_dir, monkeypatch):
+    # the full notebook is only parsed when marks are injected
+    path = source_dir / "quiz_1" / "quiz_1.ipynb"
+    ungraded = source_dir / "ungraded.ipynb"
+    _write_notebook(ungraded)
+    nb = json.loads(ungraded.read_text())
+    for cell in nb["cells"]:
+        cell["metadata"] = {}
+    ungraded.write_text(json.dumps(nb))
+    calls = []
+    load = json.load
+
+    def counted(*args, **kwargs):
+        calls.append(args)
+        return load(*args, **kwargs)
+
+    monkeypatch.setattr(inject_marks.json, "load", counted)
+    assert inject_marks.inject_mark_comments(path)[1] == inject_marks.INJECTED
+    assert len(calls) == 1
+    assert inject_marks.inject_mark_comments(path)[1] == inject_marks.UNCHANGED
+    assert inject_marks.inject_mark_comments(ungraded)[1] == inject_marks.UNGRADED
+    assert len(calls) == 1
+
+
+def test_find_notebooks(source_dir):
+    expect = [
+        source_dir / "quiz_1" / "quiz_1.ipynb",
+        source_dir / "quiz_2" / "quiz_2.ipynb",
+    ]
+    assert inject_marks.find_notebooks([source_dir]) == expect
+    assert inject_marks.find_notebooks([f"{source_dir}/quiz_*/*.ipynb"]) == expect
+    assert inject_marks.find_notebooks([expect[1], source_dir]) == expect[::-1]
+
+
+def test_find_notebooks_below_hidden_dir(tmp_path):
+    # only hidden directories below the searched directory are ignored
+    source_dir = tmp_path / ".hidden"
+    path = source_dir / "quiz_1" / "quiz_1.ipynb"
+    _write_notebook(path)
+    _write_notebook(source_dir / "quiz_1" / ".ipynb_checkpoints" / "quiz_1.ipynb")
+    assert inject_marks.find_notebooks([source_dir]) == [path]
+    assert inject_marks.find_notebooks([f"{source_dir}/*/*.ipynb"]) == [path]
+    # notebooks given explicitly are never ignored
+    checkpoint = source_dir / "quiz_1" / ".ipynb_checkpoints" / "quiz_1.ipynb"
+    assert inject_marks.find_notebooks([path, checkpoint]) == [path, checkpoint]
+
+
+def test_cli_missing_path(tmp_path):
+    from click.testing import CliRunner
+
+    from gutils.cli import main
+
+    result = CliRunner().invoke(main, ["inject-marks", str(tmp_path / "missing")])
+    assert result.exit_code == 2
+    assert "does not exist" in result.output
+
+
+@pytest.mark.parametrize("jobs", (1, 2))
+def test_inject_notebooks(source_dir, jobs):
+    paths = inject_marks.find_notebooks([source_dir])
+    got = inject_marks.inject_notebooks(paths, jobs=jobs)
+    assert got == {
+        paths[0]: (3.5, inject_marks.INJECTED),
+        paths[1]: (2.0, inject_marks.INJECTED),
+    }
+    _write_notebook(paths[1], points=(3, 1))
+    got = inject_marks.inject_notebooks(paths, jobs=jobs)
+    assert got == {
+        paths[0]: (3.5, inject_marks.UNCHANGED),
+        paths[1]: (4.0, inject_marks.INJECTED),
+    }
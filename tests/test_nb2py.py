@@ -0,0 +1,128 @@
+import json
+
+import pytest
+
+from gutils import nb2py
+
+
+def _write_notebook(path, source):
+    nb = {
+        "cells": [
+            {"cell_type": "code", "metadata": {}, "source": source, "outputs": []},
+            {"cell_type": "markdown", "metadata": {}, "source": ["# a title"]},
+        ],
+        "metadata": {},
+        "nbformat": 4,
+        "nbformat_minor": 5,
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(nb))
+
+
+@pytest.fixture
+def submitted(tmp_path):
+    for student in ("u1", "u2", "u3"):
+        path = tmp_path / student / "quiz_1" / "quiz_1.ipynb"
+        _write_notebook(path, ["x = 1\n", "# ANUID\n", "y = 2"])
+    return tmp_path
+
+
+def test_get_code_cells(submitted):
+    got = nb2py.get_code_cells(submitted / "u1" / "quiz_1" / "quiz_1.ipynb")
+    assert got == "x = 1\ny = 2\n\n"
+
+
+@pytest.mark.parametrize("jobs", (1, 2))
+def test_make_scripts_incremental(submitted, jobs):
+    converted = nb2py.make_scripts(submitted, "quiz_1", jobs=jobs)
+    assert len(converted) == 3
+    assert (submitted / "u2" / "quiz_1" / "quiz_1.py").read_text() == "x = 1\ny = 2\n\n"
+    # nothing changed, nothing converted
+    assert nb2py.make_scripts(submitted, "quiz_1", jobs=jobs) == []
+    # only the modified notebook is converted
+    changed = submitted / "u3" / "quiz_1" / "quiz_1.ipynb"
+    _write_notebook(changed, ["z = 3"])
+    assert nb2py.make_scripts(submitted, "quiz_1", jobs=jobs) == [changed]
+    # missing outputs are recreated
+    (submitted / "u1" / "quiz_1" / "quiz_1.py").unlink()
+    assert len(nb2py.make_scripts(submitted, "quiz_1", jobs=jobs)) == 1
+    # force converts everything
+    assert len(nb2py.make_scripts(submitted, "quiz_1", force=True)) == 3
+
+
+def _original_get_code_cells(cells, excludes):
+    result = []
+    for cell in cells:
+        if cell["cell_type"] == "markdown" or cell.get("metadata", {}).get(
+            "nbgrader", {}
+        ).get("grade"):
+            continue
+        code = "\n".join(l.rstrip() for l in cell["source"] if not excludes.search(l))
+        if code:
+            result.extend([code, "\n", "\n"])
+    return "".join(result)
+
+
+@pytest.mark.parametrize(
+    "source",
+    (
+        [],
+        ["\n"],
+        ["\n", "\n"],
+        ["\n", "x = 1"],
+        ["# ANUID\n"],
+        ["# ANUID\n", "\n"],
+        ["\n", "# ANUID\n"],
+        ["x = 1   \n", "# Enter your code here\n", "y = 2"],
+    ),
+)
+def test_write_code_cells_matches_original(source):
+    import io
+
+    cells = [
+        {"cell_type": "code", "metadata": {}, "source": source},
+        {
+            "cell_type": "code",
+            "metadata": {"nbgrader": {"grade": True}},
+            "source": ["a"],
+        },
+        {"cell_type": "code", "metadata": {}, "source": ["z = 3"]},
+    ]
+    out = io.StringIO()
+    nb2py.write_code_cells(cells, out)
+    assert out.getvalue() == _original_get_code_cells(cells, nb2py._excludes)
+
+
+def test_exclude_per_cell():
+    import io
+
+    cells = [
+        {"cell_type": "code", "metadata": {}, "source": ["x = 1\n", "# SKIP me"]},
+        {"cell_type": "code", "metadata": {}, "source": ["y = 2"]},
+    ]
+    excludes = nb2py.make_exclude_filter(["SKIP", r"^import\s"])
+    out = io.StringIO()
+    nb2py.write_code_cells(cells, out, excludes=excludes)
+    assert out.getvalue() == "x = 1\n\ny = 2\n\n"
+    out = io.StringIO()
+    nb2py.write_code_cells(cells, out, excludes=excludes, per_cell=True)
+    assert out.getvalue() == "y = 2\n\n"
+    # an empty list of patterns excludes nothing
+    out = io.StringIO()
+    nb2py.write_code_cells(cells, out, excludes=nb2py.make_exclude_filter([]))
+    assert out.getvalue() == "x = 1\n# SKIP me\n\ny = 2\n\n"
+
+
+def test_make_scripts_settings_change(submitted):
+    assert len(nb2py.make_scripts(submitted, "quiz_1")) == 3
+    assert nb2py.make_scripts(submitted, "quiz_1") == []
+    # changing the exclusions invalidates the manifest
+    got = nb2py.make_scripts(submitted, "quiz_1", excludes=["x ="], per_cell=True)
+    assert len(got) == 3
+    assert (submitted / "u1" / "quiz_1" / "quiz_1.py").read_text() == ""
+
+
+def test_read_patterns(tmp_path):
+    path = tmp_path / "excludes.txt"
+    path.write_text("# a comment\nANUID\n\n^print\\(\n")
+    assert nb2py.read_patterns(path) == ["ANUID", r"^print\("]
@@ -0,0 +1,290 @@
+import json
+
+import pytest
+
+from gutils import nbgrader_fetched as FETCH
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    """a stand-in for the student homes and the nbgrader exchange"""
+    courseid = "biol3157"
+    user_root = tmp_path / "home2"
+    outbound = tmp_path / "exchange" / courseid / "outbound"
+    for name in ("python_quiz_1", "python_assignment_1"):
+        (outbound / name).mkdir(parents=True)
+    (outbound / "not_a_dir").write_text("")
+
+    for student, fetched in (
+        ("u1", ["python_quiz_1", "python_assignment_1"]),
+        ("u2", ["python_quiz_1"]),
+        ("u3", []),
+    ):
+        (user_root / student).mkdir(parents=True)
+        for name in fetched:
+            (user_root / student / courseid / name).mkdir(parents=True)
+    (user_root / "lost+found").mkdir()
+
+    monkeypatch.setattr(FETCH, "USER_ROOT", user_root)
+    monkeypatch.setattr(FETCH, "COURSEID", courseid)
+    monkeypatch.setattr(FETCH, "EXHCHANGE_OUTBOUND", outbound)
+    monkeypatch.setattr(FETCH, "LOGPATH", tmp_path / "nbgrader_fetched.json")
+    monkeypatch.setattr(FETCH, "INDEXPATH", tmp_path / "nbgrader_fetched_index.json")
+    return user_root
+
+
+@pytest.mark.parametrize("max_workers", (1, 4))
+def test_get_student_fetched_times(server, max_workers):
+    got = FETCH.get_student_fetched_times({}, max_workers=max_workers)
+    assert set(got) == {"python_quiz_1", "python_assignment_1"}
+    assert set(got["python_quiz_1"]) == {"u1", "u2"}
+    assert set(got["python_assignment_1"]) == {"u1"}
+    # existing records are retained
+    (server / "u3" / "biol3157" / "python_quiz_1").mkdir(parents=True)
+    got["python_quiz_1"]["u1"] = "recorded"
+    got = FETCH.get_student_fetched_times(got, max_workers=max_workers)
+    assert set(got["python_quiz_1"]) == {"u1", "u2", "u3"}
+    assert got["python_quiz_1"]["u1"] == "recorded"
+
+
+def test_scan_home_stat_fails(server, monkeypatch):
+    import os
+
+    scandir = os.scandir
+
+    class Entry:
+        def __init__(self, entry):
+            self.name = entry.name
+            self._entry = entry
+
+        def stat(self):
+            if self.name == "python_assignment_1":
+                raise FileNotFoundError(self.name)
+            return self._entry.stat()
+
+    class Entries:
+        def __init__(self, path):
+            self._entries = scandir(path)
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            self._entries.close()
+
+        def __iter__(self):
+            return (Entry(e) for e in self._entries)
+
+    monkeypatch.setattr(FETCH.os, "scandir", Entries)
+    got = FETCH.scan_home(server / "u1", {"python_quiz_1", "python_assignment_1"})
+    assert list(got) == ["python_quiz_1"]
+
+
+def test_main(server, capsys):
+    FETCH.main(verbose=True)
+    assert "3 new records" in capsys.readouterr().out
+    assert set(FETCH.load_log()["python_quiz_1"]) == {"u1", "u2"}
+
+
+def test_get_student_fetched_times_index(server, monkeypatch):
+    index = FETCH.load_index()
+    got = FETCH.get_student_fetched_times({}, index=index)
+    assert set(got["python_quiz_1"]) == {"u1", "u2"}
+    assert index["homes"]["names"] and index["assignments"]["names"]
+    assert index["finished"] == []
+
+    # the listings are reused while the dir mtimes are unchanged
+    def fail():
+        raise AssertionError("should not be listed")
+
+    with monkeypatch.context() as m:
+        m.setattr(FETCH, "get_student_homes", fail)
+        m.setattr(FETCH, "get_released_assignments", fail)
+        (server / "u3" / "biol3157" / "python_quiz_1").mkdir(parents=True)
+        got = FETCH.get_student_fetched_times(got, index=index)
+    assert set(got["python_quiz_1"]) == {"u1", "u2", "u3"}
+    assert index["finished"] == ["python_quiz_1"]
+
+    # finished assignments are not scanned
+    def scan_home(home, assignments):
+        assert "python_quiz_1" not in assignments
+        return {}
+
+    with monkeypatch.context() as m:
+        m.setattr(FETCH, "scan_home", scan_home)
+        FETCH.get_student_fetched_times(got, index=index)
+
+
+def test_index_switch_backend(server):
+    # every home has fetched python_quiz_1, so it is finished
+    (server / "u3" / "biol3157" / "python_quiz_1").mkdir(parents=True)
+    FETCH.main(backend="json")
+    assert FETCH.load_index()["finished"] == ["python_quiz_1"]
+    # a log without its records still gets them
+    FETCH.main(backend="sqlite")
+    assert FETCH.get_log("sqlite").load() == FETCH.get_log("json").load()
+    FETCH.get_log("json").path.unlink()
+    FETCH.main(backend="json")
+    assert set(FETCH.load_log()["python_quiz_1"]) == {"u1", "u2", "u3"}
+
+
+def test_index_new_home(server):
+    import os
+
+    index = FETCH.load_index()
+    got = FETCH.get_student_fetched_times({}, index=index)
+    index["finished"] = ["python_quiz_1"]
+    (server / "u4" / "biol3157" / "python_quiz_1").mkdir(parents=True)
+    # make sure the mtime differs
+    os.utime(server, (1, 1))
+    got = FETCH.get_student_fetched_times(got, index=index)
+    assert "u4" in got["python_quiz_1"]
+    assert "u4" in index["homes"]["names"]
+
+
+def test_close_assignments(server):
+    FETCH.close_assignments(["python_quiz_1"])
+    FETCH.main()
+    assert "python_quiz_1" not in FETCH.load_log()
+    assert set(FETCH.load_log()["python_assignment_1"]) == {"u1"}
+
+
+@pytest.mark.parametrize("backend", ("json", "jsonl", "sqlite"))
+def test_main_backends(server, backend):
+    FETCH.main(backend=backend)
+    log = FETCH.get_log(backend)
+    assert set(log.load()["python_quiz_1"]) == {"u1", "u2"}
+    (server / "u3" / "biol3157" / "python_quiz_1").mkdir(parents=True)
+    FETCH.main(backend=backend)
+    assert set(log.load()["python_quiz_1"]) == {"u1", "u2", "u3"}
+    assert set(log.student("u1")) == {"python_quiz_1", "python_assignment_1"}
+    assert log.student("u4") == {}
+    assert set(log.assignments()) == {"python_quiz_1", "python_assignment_1"}
+
+
+@pytest.mark.parametrize("backend", ("json", "jsonl", "sqlite"))
+def test_log_first_record_wins(tmp_path, backend):
+    from gutils.fetch_log import BACKENDS
+
+    log = BACKENDS[backend](tmp_path / "log")
+    log.add([("a1", "u1", "t1"), ("a1", "u2", "t1")])
+    log.add([("a1", "u1", "t2"), ("a2", "u1", "t2")])
+    assert log.load() == {"a1": {"u1": "t1", "u2": "t1"}, "a2": {"u1": "t2"}}
+    assert log.student("u1") == {"a1": "t1", "a2": "t2"}
+
+
+def test_journal_compact(tmp_path):
+    from gutils.fetch_log import JournalLog
+
+    path = tmp_path / "log.jsonl"
+    log = JournalLog(path)
+    log.add([("a1", "u1", "t1")])
+    log.add([("a1", "u1", "t2")])
+    assert log.load() == {"a1": {"u1": "t1"}}
+    # loading does not rewrite the journal
+    assert len(path.read_text().splitlines()) == 2
+    assert log.compact() == 1
+    assert len(path.read_text().splitlines()) == 1
+    log.add([("a2", "u1", "t3")])
+    assert log.load() == {"a1": {"u1": "t1"}, "a2": {"u1": "t3"}}
+
+
+def test_journal_partial_line(tmp_path):
+    from gutils.fetch_log import JournalLog
+
+    path = tmp_path / "log.jsonl"
+    log = JournalLog(path)
+    log.add([("a1", "u1", "t1")])
+    # an interrupted append
+    with open(path, "a") as outfile:
+        outfile.write('["a2", "u1"')
+    assert log.load() == {"a1": {"u1": "t1"}}
+    assert log.student("u1") == {"a1": "t1"}
+    log.add([("a2", "u2", "t2")])
+    assert log.load() == {"a1": {"u1": "t1"}, "a2": {"u2": "t2"}}
+    with open(path, "a") as outfile:
+        outfile.write('["a3", "u1"')
+    assert log.compact() == 0
+    assert path.read_text().endswith('"t2"]\n')
+
+
+def test_journal_assignments_index(tmp_path):
+    from gutils.fetch_log import JournalLog
+
+    path = tmp_path / "log.jsonl"
+    log = JournalLog(path)
+    assert log.assignments() == []
+    log.add([("a1", "u1", "t1"), ("a1", "u2", "t1")])
+    assert log.assignments() == ["a1"]
+    # an incomplete line being appended is not read
+    with open(path, "a") as outfile:
+        outfile.write('["a2", "u1", "t2"]\n["a3", "u1"')
+    assert log.assignments() == ["a1", "a2"]
+    with open(path, "a") as outfile:
+        outfile.write(', "t3"]\n')
+    assert log.assignments() == ["a1", "a2", "a3"]
+    # only the appended records are read
+    index = json.loads(log.index_path.read_text())
+    assert index["offset"] == path.stat().st_size
+    log.add([("a1", "u1", "t4")])
+    log.compact()
+    assert log.assignments() == ["a1", "a2", "a3"]
+
+
+def test_fetch_watcher_notify(server):
+    from gutils.fetch_log import JournalLog
+
+    log = JournalLog(server.parent / "log.jsonl")
+    watcher = FETCH.FetchWatcher(log)
+    assert len(watcher.rescan()) == 3
+    assert watcher.flush() == []
+
+    (server / "u3" / "biol3157" / "python_quiz_1").mkdir(parents=True)
+    # notifications for unrelated paths are ignored
+    watcher.notify(server / "u3" / "biol3157" / "python_quiz_1" / "x.ipynb")
+    watcher.notify(server.parent / "elsewhere")
+    assert watcher.flush() == []
+
+    watcher.notify(server / "u3" / "biol3157" / "python_quiz_1")
+    got = watcher.flush()
+    assert [r[:2] for r in got] == [("python_quiz_1", "u3")]
+    assert "u3" in log.load()["python_quiz_1"]
+
+    # a newly released assignment
+    (FETCH.EXHCHANGE_OUTBOUND / "python_quiz_2").mkdir()
+    (server / "u4" / "biol3157" / "python_quiz_2").mkdir(parents=True)
+    watcher.notify(FETCH.EXHCHANGE_OUTBOUND / "python_quiz_2")
+    watcher.notify(server / "u4")
+    assert [r[:2] for r in watcher.flush()] == [("python_quiz_2", "u4")]
+
+
+def test_fetch_watcher_observer(server):
+    import time
+
+    pytest.importorskip("watchdog")
+    from gutils.fetch_log import JournalLog
+
+    watcher = FETCH.FetchWatcher(JournalLog(server.parent / "log.jsonl"))
+    watcher.start()
+    try:
+        watcher.rescan()
+        (server / "u3" / "biol3157").mkdir()
+        time.sleep(0.2)
+        (server / "u3" / "biol3157" / "python_quiz_1").mkdir()
+        for _ in range(50):
+            time.sleep(0.1)
+            records = watcher.flush()
+            if records:
+                break
+    finally:
+        watcher.stop()
+    assert [r[:2] for r in records] == [("python_quiz_1", "u3")]
+
+
+def test_courseid_set_on_first_use(monkeypatch):
+    monkeypatch.setattr(FETCH, "COURSEID", None)
+    monkeypatch.setattr(FETCH, "EXHCHANGE_OUTBOUND", None)
+    monkeypatch.setattr(FETCH, "get_courseid", lambda: "biol6243")
+    assert FETCH.courseid() == "biol6243"
+    assert FETCH.outbound_dir().parts[-2:] == ("biol6243", "outbound")
+    assert FETCH.COURSEID == "biol6243"
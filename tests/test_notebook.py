@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+from gutils import notebook
+
+
+@pytest.fixture
+def nb_path(tmp_path):
+    nb = {
+        "cells": [
+            {
+                "cell_type": "code",
+                "metadata": {"nbgrader": {"grade": True, "points": 2}},
+                "source": ['s = "a\\\\"\n', "x = [1, {'b': ']'}]"],
+                "outputs": [
+                    {"data": {"image/png": 'iVBOR"}]w0K', "text/html": ['<a "b">']}},
+                    [[1], [2], "x"],
+                ],
+            },
+            {
+                "cell_type": "markdown",
+                "metadata": {},
+                "source": ["# title ]}"],
+                "attachments": {"a.png": {"image/png": "iVBOR"}},
+            },
+            {"cell_type": "code", "metadata": {}, "source": [], "outputs": []},
+        ],
+        "metadata": {"kernelspec": {"name": "python3"}, "nested": [{"a": "}"}]},
+        "nbformat": 4,
+        "nbformat_minor": 5,
+    }
+    path = tmp_path / "nb.ipynb"
+    path.write_text(json.dumps(nb, indent=1))
+    return path
+
+
+def test_read_notebook_matches_json(nb_path):
+    expect = json.loads(nb_path.read_text())
+    assert notebook.read_notebook(nb_path, skip=()) == expect
+    for cell in expect["cells"]:
+        for key in notebook.SKIP_CELL_KEYS:
+            cell.pop(key, None)
+    assert notebook.read_notebook(nb_path) == expect
+
+
+def test_iter_cells(nb_path):
+    got = list(notebook.iter_cells(nb_path))
+    assert [c["cell_type"] for c in got] == ["code", "markdown", "code"]
+    assert all("outputs" not in c for c in got)
+    assert got[0]["metadata"]["nbgrader"]["points"] == 2
+
+
+@pytest.mark.parametrize("text", ("", "{", '{"cells": [{"source": ]}'))
+def test_invalid_notebook(tmp_path, text):
+    path = tmp_path / "bad.ipynb"
+    path.write_text(text)
+    with pytest.raises(json.JSONDecodeError):
+        list(notebook.iter_cells(path))
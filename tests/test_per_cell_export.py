@@ -0,0 +1,70 @@
+import json
+
+import pytest
+
+pytest.importorskip("nbgrader")
+pytestmark = pytest.mark.filterwarnings("ignore::Warning")
+
+from gutils.per_cell_export import PerCellExporter
+
+
+def nested_find_grade(gb):
+    """the per (grade cell, student) lookups formerly used by the exporter"""
+    from nbgrader.api import MissingEntry
+
+    grades = {}
+    for assignment in gb.assignments:
+        grades[assignment.name] = {}
+        for notebook in assignment.notebooks:
+            grades[assignment.name][notebook.name] = {}
+            for cell in notebook.grade_cells:
+                scores = {}
+                for student in gb.students:
+                    try:
+                        scores[student.id] = gb.find_grade(
+                            cell.name, notebook.name, assignment.name, student.id
+                        ).score
+                    except MissingEntry:
+                        scores[student.id] = None
+                grades[assignment.name][notebook.name][cell.name] = scores
+    return grades
+
+
+@pytest.mark.parametrize("stream", (False, True))
+def test_export(gradebook_path, tmp_path, stream):
+    from nbgrader.api import Gradebook
+
+    out = tmp_path / "grades.json"
+    with Gradebook(f"sqlite:///{gradebook_path}") as gb:
+        PerCellExporter(to=str(out), stream=stream).export(gb)
+        expect = nested_find_grade(gb)
+
+    got = json.loads(out.read_text())
+    assert got == expect
+    assert list(got) == list(expect)
+    assert got["python_2"]["nb"]["q1"]["u3"] is None
+    assert got["python_1"]["nb"]["q2"]["u1"] == 2.5
+
+
+def test_export_long(gradebook_path, tmp_path):
+    import csv
+
+    from nbgrader.api import Gradebook
+
+    out = tmp_path / "grades.tsv"
+    with Gradebook(f"sqlite:///{gradebook_path}") as gb:
+        PerCellExporter(to=str(out)).export(gb)
+        expect = nested_find_grade(gb)
+
+    with open(out) as infile:
+        rows = list(csv.reader(infile, delimiter="\t"))
+    assert rows[0] == ["student", "assignment", "notebook", "cell", "score"]
+    for student, assignment, notebook, cell, score in rows[1:]:
+        assert float(score) == expect[assignment][notebook][cell][student]
+    assert len(rows) - 1 == sum(
+        score is not None
+        for nb in expect.values()
+        for cells in nb.values()
+        for scores in cells.values()
+        for score in scores.values()
+    )
@@ -0,0 +1,80 @@
+import pytest
+
+from gutils import rinstall
+
+
+@pytest.fixture
+def fake_r(monkeypatch):
+    """a stand-in for R, install.packages succeeds except for 'broken'"""
+    installed = {"base", "stats", "digest"}
+    commands = []
+
+    def install_r_package(cmnd, command_prefix="R --quiet -e", **kwargs):
+        commands.append(cmnd)
+        if cmnd.startswith("cat(rownames(installed.packages())"):
+            return "\n".join(sorted(installed))
+        if cmnd.startswith("install.packages("):
+            names = cmnd.split("c(")[1].split(")")[0]
+            names = [n.strip(" '") for n in names.split(",")]
+            installed.update(n for n in names if n != "broken")
+        return ""
+
+    monkeypatch.setattr(rinstall, "install_r_package", install_r_package)
+    return commands
+
+
+def test_install_missing_r_packages(fake_r):
+    packages = ["digest", "ape", "", "broken", "ape", "phangorn"]
+    present, new, failed = rinstall.install_missing_r_packages(packages, ncpus=8)
+    assert present == ["digest"]
+    assert new == ["ape", "phangorn"]
+    assert failed == ["broken"]
+    # one query, one install, one query
+    assert len(fake_r) == 3
+    assert "c('ape', 'broken', 'phangorn')" in fake_r[1]
+    assert "Ncpus=8" in fake_r[1]
+
+
+def test_install_missing_r_packages_none_missing(fake_r):
+    assert rinstall.install_missing_r_packages(["digest"]) == (["digest"], [], [])
+    assert len(fake_r) == 1
+
+
+@pytest.fixture
+def local_repo(tmp_path):
+    """a stand-in local CRAN repository"""
+    contrib = tmp_path / "cran" / "src" / "contrib"
+    contrib.mkdir(parents=True)
+    (contrib / "ape_5.7.tar.gz").write_bytes(b"")
+    (contrib / "PACKAGES").write_text("Package: ape\nVersion: 5.7\n")
+    return tmp_path / "cran"
+
+
+def test_repo_url(local_repo):
+    expect = local_repo.as_uri()
+    assert expect.startswith("file:///")
+    assert rinstall.repo_url(str(local_repo)) == expect
+    assert rinstall.repo_url(expect) == expect
+    assert rinstall.repo_url(None) == rinstall.CRAN_REPO
+    assert (
+        rinstall.repo_url("https://cran.r-project.org") == "https://cran.r-project.org"
+    )
+    # a directory without a PACKAGES index is not a repository
+    with pytest.raises(ValueError):
+        rinstall.repo_url(str(local_repo / "src"))
+
+
+def test_install_from_local_repo(fake_r, local_repo):
+    repos = rinstall.repo_url(str(local_repo))
+    rinstall.install_missing_r_packages(["ape"], repos=repos)
+    assert f"repos='{repos}'" in fake_r[1]
+
+
+def test_fill_cran_cache(fake_r, tmp_path):
+    path = rinstall.fill_cran_cache(["ape", "ape", "phangorn"], tmp_path / "cache")
+    assert path == tmp_path / "cache"
+    assert (path / "src" / "contrib").is_dir()
+    cmnd = fake_r[0]
+    assert "pkgs <- c('ape', 'phangorn')" in cmnd
+    assert f"destdir='{path / 'src' / 'contrib'}'" in cmnd
+    assert "tools::write_PACKAGES" in cmnd